@@ -12,7 +12,9 @@ import python_to_gemini
 
 from flask import Flask, jsonify, request
 from flask_cors import CORS
+import clients
 import query_database
+import ranking
 import python_to_gemini
 import json
 import os, smtplib
@@ -38,6 +40,13 @@ LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 
 LOG_FILE = os.path.join(LOG_DIR, "query_log.jsonl")
+
+# What to do when retrieval is low confidence (best chunk under the collection's min_score):
+#   "shorten" - send only the best chunk and ask Gemini for a shorter answer (default)
+#   "skip"    - don't call Gemini at all, just return the closest sources
+LOW_CONFIDENCE_ACTION = os.getenv("LOW_CONFIDENCE_ACTION", "shorten")
+LOW_CONFIDENCE_RESPONSE = "I couldn't find a bylaw section that clearly answers this question. \nHere are the closest bylaw sources I found. Try rephrasing or naming the specific bylaw."
+_alerted_outage = None # clients.mongo_outage_started() of the last outage we emailed about
 allowed_urls = [
     "https://gdsc-2025.firebaseapp.com",
     "https://gdsc-2025.web.app",
@@ -82,6 +91,8 @@ city_to_collection = {
     "Waterloo": "waterloo",
     'Guelph': 'guelph'
 }
+# load any local/HNSW search indexes now (before gunicorn --preload forks the workers)
+query_database.preload_indexes(city_to_collection.values())
 
 app = Flask(__name__)
 CORS(
@@ -179,77 +190,84 @@ def feedback():
 
     return jsonify({"status": "ok", "emailed": sent})
 
-# --- API ENDPOINT ---
-@app.route('/api/query', methods=['POST'])
-def handle_query():
-    print(f"Received request at /api/query ({request.method})")
-
-    if not request.is_json:
-        return jsonify({"status": "error", "error": {"message": "Request must be JSON"}}), 400
-
-    data = request.get_json()
-    user_query = (data.get("query") or "").strip()
-    city = (data.get("city", "Unknown City"))
-    conversation_context = data.get("conversation_context", [])
-    timestamp = data.get("timestamp")
-
-    if (city not in city_to_collection):
-        return jsonify({"status": "error", "error": {"message": "City Not found"}}), 400
-
-    if not user_query:
-        return jsonify({"status": "error", "error": {"message": "Missing 'query' in request body"}}), 400
+# --- Query pipeline pieces, shared by the Flask endpoint below and asgi_app.py ---
+DB_DOWN_MESSAGE = "DB Error, could not connect to mongodb atlas cluster."
+DB_DOWN_RESPONSE = "I apologize, the bylaw database is currently down. \nI've been sent an email automatically and I'll fix the issue as soon as I can. \nThanks for your patience."
+GEMINI_DOWN_MESSAGE = "Gemini API error, likely server busy. "
+GEMINI_DOWN_RESPONSE = "Couldn’t generate a natural-language answer right now. \nThe server for our AI is too busy. Please try again later. \nNevertheless, Here are the most relevant bylaw sources we found."
+
+
+def parse_query_request(data):
+    """(fields, None) for a valid /api/query body, else (None, (error body, status))."""
+    if data is None:
+        return None, ({"status": "error", "error": {"message": "Request must be JSON"}}, 400)
+    fields = {
+        "user_query": (data.get("query") or "").strip(),
+        "city": data.get("city", "Unknown City"),
+        "conversation_context": data.get("conversation_context", []),
+        "timestamp": data.get("timestamp"),
+    }
+    if (fields["city"] not in city_to_collection):
+        return None, ({"status": "error", "error": {"message": "City Not found"}}, 400)
+    if not fields["user_query"]:
+        return None, ({"status": "error", "error": {"message": "Missing 'query' in request body"}}, 400)
+    return fields, None
+
+
+def write_log(log_entry: dict, query: str = ""):
+    """Appends to the local query log and the Google Sheet (blocking)."""
+    with open(LOG_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+        append_log_entry(query=query, other_logs=json.dumps(log_entry, ensure_ascii=False))
+        print("LOGGED")
+
+
+def db_down_body(city, timestamp) -> dict:
+    return {
+        "status": "degraded",
+        "message": DB_DOWN_MESSAGE,
+        "ai_response": DB_DOWN_RESPONSE,
+        "ai_error": None,
+        "retrieved_sources": [],
+        "city": city,
+        "timestamp": timestamp,
+    }
 
-    # ---- Vector search ----
-    database_name = "bylaws"
-    collection_name = city_to_collection[city]
-    
-    results = []
-    try:
-        print(f"Querying {database_name}.{collection_name} for: '{user_query}'")
-        results, error = query_database.query_database(user_query, database_name, collection_name)
-    except Exception as e:
-        print(f"❌ Vector search error: {e}")
-        error = e
 
-    # if DB connection failed for some reason
-    if len(results) == 0:
-        log_entry={
-            "status": "degraded",
-            "message": (
-                "DB Error, could not connect to mongodb atlas cluster."
-            ),
-            "ai_response": "I apologize, the bylaw database is currently down. \nI've been sent an email automatically and I'll fix the issue as soon as I can. \nThanks for your patience.",
-            "ai_error": None,
-            "retrieved_sources": [],
-            "city": city,
-            "timestamp": timestamp,
-        }
-
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
-            append_log_entry(query=user_query, other_logs=json.dumps(log_entry, ensure_ascii=False))
-            print("LOGGED")
+def report_db_failure(database_name, collection_name, user_query, results, error):
+    """Emails about a DB failure, once per outage: while the cluster is known down every request fails."""
+    global _alerted_outage
+    outage = clients.mongo_outage_started()
+    if outage is None or outage != _alerted_outage:
+        _alerted_outage = outage
+        send_email(subject="[DB FAILURE] Paralegal Mongo Cluster failed", body=f"DB name: {database_name}.{collection_name}, \n user query: {user_query}\n results: {results}, \n error: {error}")
 
 
-        send_email(subject="[DB FAILURE] Paralegal Mongo Cluster failed", body=f"DB name: {database_name}.{collection_name}, \n user query: {user_query}\n results: {results}, \n error: {error}")
-        return jsonify({
-            "status": "degraded",
-            "message": (
-                "DB Error, could not connect to mongodb atlas cluster."
-            ),
-            "ai_response": "I apologize, the bylaw database is currently down. \nI've been sent an email automatically and I'll fix the issue as soon as I can. \nThanks for your patience.",
-            "ai_error": None,
-            "retrieved_sources": [],
-            "city": city,
-            "timestamp": timestamp,
-        }), 200
+def prepare_prompt(results, collection_name):
+    """(low_confidence, context_text, max_output_tokens) for the retrieved chunks."""
+    low_confidence = query_database.is_low_confidence(results, collection_name)
+    prompt_chunks = results
+    max_output_tokens = 512
+    if low_confidence:
+        print(f"Low confidence retrieval (top score {results[0].get('score')}), action: {LOW_CONFIDENCE_ACTION}")
+        if LOW_CONFIDENCE_ACTION == "shorten":
+            prompt_chunks = results[:1]
+            max_output_tokens = 256
 
-    # ---- Prepare bylaw chunks ----
+    # label each chunk with its section when the collection records one
     context_text = "\n\n---\n\n".join(
-        [chunk.get("chunk_text", "") for chunk in results if chunk.get("chunk_text")]
+        [
+            f"[{chunk['section_path']}]\n{chunk['chunk_text']}" if chunk.get("section_path") else chunk["chunk_text"]
+            for chunk in prompt_chunks if chunk.get("chunk_text")
+        ]
     )
+    return low_confidence, context_text, max_output_tokens
+
+
+def build_source_info(city, results):
     # this is L implemnentation, I will aim to normalize the fields across the collections
     # growing pains
+    source_info = []
     if (city == "Toronto"):
         print('found for tornotno')
 
@@ -258,6 +276,7 @@ def handle_query():
                 "title": chunk.get("title"),
                 "bylaw_id": chunk.get("original_bylaw_id"),
                 "pdf_url": chunk.get("pdf_url"),
+                "section": chunk.get("section_path"),
                 # "chunk": chunk.get("chunk_sequence"),
                 # "score": chunk.get("score"),
             }
@@ -290,28 +309,95 @@ def handle_query():
             for chunk in results
         ]
         print(source_info)
-    else:
-       log_entry = {
-            "timestamp": timestamp,
-            "city": f"{city} NOT FOUND",
-        }
+    # several hits (or merged passages) often come from the same bylaw: list it once
+    return ranking.dedupe_sources(source_info)
 
 
-    # ---- Conversation context ----
-    conversation_context_text = "\n".join(
+def conversation_text(conversation_context):
+    return "\n".join(
         [f"{'User' if msg.get('fromMe') else 'AI'}: {msg.get('text')}" for msg in conversation_context]
     )
 
+
+def answer_log_entry(fields, ai_response, ai_error, source_info, low_confidence) -> dict:
+    return {
+        "timestamp": fields["timestamp"],
+        "city": fields["city"],
+        "query": fields["user_query"],
+        "ai_response": ai_response,
+        "ai_error": ai_error,
+        "retrieved_sources": source_info,
+        "low_confidence": low_confidence,
+    }
+
+
+def answer_body(status, fields, ai_response, ai_error, source_info, low_confidence) -> dict:
+    if status == "degraded":
+        return {
+            "status": "degraded",
+            "message": GEMINI_DOWN_MESSAGE,
+            "ai_response": GEMINI_DOWN_RESPONSE,
+            "ai_error": ai_error,
+            "retrieved_sources": source_info,
+            "city": fields["city"],
+            "timestamp": fields["timestamp"],
+        }
+    return {
+        "status": "ok",
+        "ai_response": ai_response,
+        "retrieved_sources": source_info,
+        "low_confidence": low_confidence,
+        "city": fields["city"],
+        "timestamp": fields["timestamp"],
+    }
+
+
+# --- API ENDPOINT ---
+@app.route('/api/query', methods=['POST'])
+def handle_query():
+    print(f"Received request at /api/query ({request.method})")
+
+    fields, invalid = parse_query_request(request.get_json() if request.is_json else None)
+    if invalid:
+        return jsonify(invalid[0]), invalid[1]
+    user_query, city = fields["user_query"], fields["city"]
+
+    # ---- Vector search ----
+    database_name = "bylaws"
+    collection_name = city_to_collection[city]
+    
+    results = []
+    try:
+        print(f"Querying {database_name}.{collection_name} for: '{user_query}'")
+        results, error = query_database.query_database(user_query, database_name, collection_name)
+    except Exception as e:
+        print(f"❌ Vector search error: {e}")
+        error = e
+
+    # if DB connection failed for some reason
+    if len(results) == 0:
+        write_log(db_down_body(city, fields["timestamp"]), query=user_query)
+        report_db_failure(database_name, collection_name, user_query, results, error)
+        return jsonify(db_down_body(city, fields["timestamp"])), 200
+
+    # ---- Prepare bylaw chunks ----
+    low_confidence, context_text, max_output_tokens = prepare_prompt(results, collection_name)
+    source_info = build_source_info(city, results)
+
     # ---- Call Gemini safely ----
     ai_response = None
     ai_error = None
     try:
-        ai_response = python_to_gemini.generate(
-            user_query,
-            context_text if context_text else "No relevant information found in bylaws.",
-            city=city,
-            context=conversation_context_text,
-        )
+        if low_confidence and LOW_CONFIDENCE_ACTION == "skip":
+            ai_response = LOW_CONFIDENCE_RESPONSE
+        else:
+            ai_response = python_to_gemini.generate(
+                user_query,
+                context_text if context_text else "No relevant information found in bylaws.",
+                city=city,
+                context=conversation_text(fields["conversation_context"]),
+                max_output_tokens=max_output_tokens,
+            )
         status = "ok"
     except Exception as e:
         ai_error = str(e)
@@ -322,59 +408,15 @@ def handle_query():
     # ---- Write to log file ----
     print("about to log")
     try:
-        log_entry = {
-            "timestamp": timestamp,
-            "city": city,
-            "query": user_query,
-            "ai_response": ai_response,
-            "ai_error": ai_error,
-            "retrieved_sources": source_info,
-        }
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
-            append_log_entry(other_logs=json.dumps(log_entry, ensure_ascii=False))
-            print("LOGGED")
+        write_log(answer_log_entry(fields, ai_response, ai_error, source_info, low_confidence))
     except Exception as log_err:
         print(f"⚠️ Failed to log query/response: {log_err}")
 
     # ---- Build response ----
+    body = answer_body(status, fields, ai_response, ai_error, source_info, low_confidence)
     if status == "degraded":
-        log_entry={
-            "status": "degraded",
-            "message": (
-                "Gemini API error, likely server busy. "
-            ),
-            "ai_response": "Couldn’t generate a natural-language answer right now. \nThe server for our AI is too busy. Please try again later. \nNevertheless, Here are the most relevant bylaw sources we found.",
-            "ai_error": ai_error,
-            "retrieved_sources": source_info,
-            "city": city,
-            "timestamp": timestamp,
-        }
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
-            append_log_entry(other_logs=json.dumps(log_entry, ensure_ascii=False))
-            print("LOGGED")
-
-
-        return jsonify({
-            "status": "degraded",
-            "message": (
-                "Gemini API error, likely server busy. "
-            ),
-            "ai_response": "Couldn’t generate a natural-language answer right now. \nThe server for our AI is too busy. Please try again later. \nNevertheless, Here are the most relevant bylaw sources we found.",
-            "ai_error": ai_error,
-            "retrieved_sources": source_info,
-            "city": city,
-            "timestamp": timestamp,
-        }), 200
-
-    return jsonify({
-        "status": "ok",
-        "ai_response": ai_response,
-        "retrieved_sources": source_info,
-        "city": city,
-        "timestamp": timestamp,
-    }), 200
+        write_log(body)
+    return jsonify(body), 200
 
 # if __name__ == '__main__':
     # Make sure debug=False for production deployments
@@ -0,0 +1,128 @@
+# file: asgi_app.py
+# Async-native /api/query, served by uvicorn; every other route is still the Flask app.
+#
+#   uvicorn asgi_app:app --host 0.0.0.0 --port 8080 --workers 4
+#
+# app.handle_query runs on gevent monkey-patching and blocking clients. This version
+# awaits each step instead:
+#   embedding      embed_vectors.embed_text_async (thread pool, it's CPU bound)
+#   $vectorSearch  query_database.query_database_async (pymongo AsyncMongoClient)
+#   Gemini         python_to_gemini.generate_async (client.aio streaming)
+#   prompt         app.prepare_prompt in the thread pool (its search settings may read
+#                  the embedding version pointer with the blocking client)
+#   Sheets / SMTP  one background thread, after the response is built
+# The request validation and response bodies are app.py's own helpers, so the JSON is
+# the same as the Flask endpoint's. benchmark_api.py compares the two servers.
+#
+# uvicorn workers import this module separately (there is no --preload), so in-process
+# search indexes are loaded once per worker.
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import app as flask_app
+import python_to_gemini
+import query_database
+
+# The Sheets client (httplib2) isn't thread safe: one thread does all the logging, in order
+_log_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-log")
+
+
+def _in_background(fn, *args):
+    """Runs blocking logging/email work off the event loop; failures are printed, never raised."""
+    def run():
+        try:
+            fn(*args)
+        except Exception as log_err:
+            print(f"⚠️ Failed to log query/response: {log_err}")
+    _log_executor.submit(run)
+
+
+async def handle_query(request):
+    print(f"Received request at /api/query ({request.method}, async)")
+
+    data = None
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+    fields, invalid = flask_app.parse_query_request(data if isinstance(data, dict) else None)
+    if invalid:
+        return JSONResponse(invalid[0], status_code=invalid[1])
+    user_query, city = fields["user_query"], fields["city"]
+
+    # ---- Vector search ----
+    database_name = "bylaws"
+    collection_name = flask_app.city_to_collection[city]
+
+    results = []
+    try:
+        print(f"Querying {database_name}.{collection_name} for: '{user_query}'")
+        results, error = await query_database.query_database_async(user_query, database_name, collection_name)
+    except Exception as e:
+        print(f"❌ Vector search error: {e}")
+        error = e
+
+    # if DB connection failed for some reason
+    if len(results) == 0:
+        body = flask_app.db_down_body(city, fields["timestamp"])
+        _in_background(flask_app.write_log, body, user_query)
+        _in_background(flask_app.report_db_failure, database_name, collection_name, user_query, results, error)
+        return JSONResponse(body)
+
+    # ---- Prepare bylaw chunks ----
+    low_confidence, context_text, max_output_tokens = await run_in_threadpool(
+        flask_app.prepare_prompt, results, collection_name)
+    source_info = flask_app.build_source_info(city, results)
+
+    # ---- Call Gemini safely ----
+    ai_response = None
+    ai_error = None
+    try:
+        if low_confidence and flask_app.LOW_CONFIDENCE_ACTION == "skip":
+            ai_response = flask_app.LOW_CONFIDENCE_RESPONSE
+        else:
+            ai_response = await python_to_gemini.generate_async(
+                user_query,
+                context_text if context_text else "No relevant information found in bylaws.",
+                city=city,
+                context=flask_app.conversation_text(fields["conversation_context"]),
+                max_output_tokens=max_output_tokens,
+            )
+        status = "ok"
+    except Exception as e:
+        ai_error = str(e)
+        print(f"❌ Gemini error: {ai_error}")
+        status = "degraded"
+
+    # ---- Log after responding ----
+    _in_background(flask_app.write_log,
+                   flask_app.answer_log_entry(fields, ai_response, ai_error, source_info, low_confidence))
+    body = flask_app.answer_body(status, fields, ai_response, ai_error, source_info, low_confidence)
+    if status == "degraded":
+        _in_background(flask_app.write_log, body)
+    return JSONResponse(body)
+
+
+# same CORS policy as the Flask app (which keeps applying its own to the mounted routes)
+query_cors = Middleware(
+    CORSMiddleware,
+    allow_origins=flask_app.allowed_urls,
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization"],
+    allow_credentials=True,
+    expose_headers=["Content-Type"],
+    max_age=86400,
+)
+
+app = Starlette(routes=[
+    Route("/api/query", handle_query, methods=["POST", "OPTIONS"], middleware=[query_cors]),
+    Mount("/", app=WSGIMiddleware(flask_app.app)),
+])
@@ -0,0 +1,115 @@
+# file: benchmark_api.py
+# Load test of /api/query: the gunicorn+gevent Flask app against the uvicorn ASGI app
+# (asgi_app.py), at increasing concurrency.
+#
+# Give both servers the same CPUs, e.g. two containers of the same image:
+#   docker run --cpus=2 -p 8080:8080 --env-file .env bylaw-rag-api     # gunicorn + gevent (Dockerfile CMD)
+#   docker run --cpus=2 -p 8081:8080 --env-file .env bylaw-rag-api \
+#       uvicorn asgi_app:app --host 0.0.0.0 --port 8080 --workers 4
+#   python benchmark_api.py --target gevent=http://localhost:8080 --target asgi=http://localhost:8081 \
+#       --queries queries.txt --city Waterloo --concurrency 8,32,128 --duration 30
+#
+# Each level runs --concurrency closed-loop clients for --duration seconds against one
+# target at a time and reports requests/s, latency p50/p95/p99 and the share of
+# responses that weren't status "ok". Every request embeds, searches Atlas, calls
+# Gemini and is logged to the sheet, so run it against a staging deployment.
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+
+def load_queries(path: str) -> list[str]:
+    """One query per line, or .jsonl with {"query": ...} (the benchmark_retrieval.py format)."""
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                line = json.loads(line).get("query", "")
+            if line:
+                queries.append(line)
+    return queries
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def run_level(url: str, queries: list[str], city: str, concurrency: int, duration: float,
+                    timeout: float) -> dict:
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        async def worker(n: int):
+            i = n
+            while time.perf_counter() < deadline:
+                body = {"query": queries[i % len(queries)], "city": city, "conversation_context": []}
+                i += concurrency
+                start = time.perf_counter()
+                try:
+                    r = await client.post("/api/query", json=body)
+                    status = r.json().get("status", str(r.status_code)) if r.status_code == 200 else str(r.status_code)
+                except (httpx.HTTPError, ValueError) as e:
+                    status = type(e).__name__
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    total = len(latencies)
+    return {
+        "requests": total,
+        "rps": total / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "not_ok": 1.0 - statuses.get("ok", 0) / total if total else 0.0,
+        "statuses": statuses,
+    }
+
+
+async def main_async(args):
+    queries = load_queries(args.queries)
+    targets = [t.split("=", 1) for t in args.target]
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    rows = []
+    for concurrency in levels:
+        for name, url in targets:
+            r = await run_level(url, queries, args.city, concurrency, args.duration, args.timeout)
+            rows.append({"target": name, "concurrency": concurrency, **r})
+            print(f"{name:<8} c={concurrency:<4} {r['rps']:7.2f} req/s  p50={r['p50_ms']:7.0f}ms "
+                  f"p95={r['p95_ms']:7.0f}ms p99={r['p99_ms']:7.0f}ms  not ok {r['not_ok']:.1%} {r['statuses']}")
+            await asyncio.sleep(args.cooldown)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"Wrote {args.out}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare /api/query throughput and latency between servers.")
+    ap.add_argument("--target", action="append", required=True, help="name=base_url (repeatable)")
+    ap.add_argument("--queries", required=True, help="Query set (.txt or .jsonl)")
+    ap.add_argument("--city", default="Waterloo")
+    ap.add_argument("--concurrency", default="8,32,128", help="Comma list of concurrent clients")
+    ap.add_argument("--duration", type=float, default=30, help="Seconds per level and target")
+    ap.add_argument("--timeout", type=float, default=60)
+    ap.add_argument("--cooldown", type=float, default=5, help="Pause between runs (seconds)")
+    ap.add_argument("--out", default=None, help="Write the results as JSON")
+    asyncio.run(main_async(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# file: benchmark_chunking.py
+# Micro-benchmark of the offset-based chunker (scraping_common/chunking.py)
+# against the chunkers it replaced, over the whole scraped corpus:
+#
+#   offset    scraping_common.chunking.chunk_with_offsets
+#   sentence  the old insert_bylaws.py sentence packer (copied below)
+#   window    the old Toronto fixed character window (scraping_toronto/chunk_text.py)
+#
+#   python benchmark_chunking.py --input scraping_waterloo/waterloo_bylaws scraping_guelph/guelph_bylaws --toronto
+#
+# --toronto adds the Toronto chapter PDFs already in the document cache
+# (extraction is done once up front and not timed).  Reports best-of-N time,
+# throughput, chunk counts/sizes and peak allocated memory per chunker, and
+# checks that every offset chunk slices back to its own text.
+import argparse
+import json
+import os
+import re
+import time
+import tracemalloc
+from pathlib import Path
+from typing import List
+
+from scraping_common.chunking import chunk_with_offsets
+from scraping_toronto.chunk_text import chunk_text as window_chunks
+
+
+# Previous insert_bylaws.py packer (string concatenation), kept for comparison
+def legacy_sentence_chunks(
+    text: str,
+    target_size: int = 1000,
+    overlap: int = 150,
+    min_size: int = 600,
+) -> List[str]:
+    # Normalize whitespace
+    cleaned = re.sub(r"\r\n?", "\n", text)
+    cleaned = re.sub(r"[ \t]+", " ", cleaned)
+
+    # Split into paragraphs first
+    paras = re.split(r"\n{2,}", cleaned)
+    chunks = []
+    buf = ""
+
+    def flush_buf():
+        nonlocal buf
+        if buf.strip():
+            chunks.append(buf.strip())
+        buf = ""
+
+    for p in paras:
+        p = p.strip()
+        if not p:
+            continue
+        if len(buf) + len(p) + 1 <= target_size:
+            buf = (buf + "\n\n" + p) if buf else p
+        else:
+            # If current buffer is too small, but adding p would overshoot a lot,
+            # still flush to keep coherence.
+            if len(buf) >= min_size:
+                flush_buf()
+                buf = p
+            else:
+                # Try sentence-level packing
+                sentences = re.split(r"(?<=[.!?])\s+", p)
+                for s in sentences:
+                    if len(buf) + len(s) + 1 <= target_size:
+                        buf = (buf + " " + s) if buf else s
+                    else:
+                        if len(buf) >= min_size:
+                            flush_buf()
+                            buf = s
+                        else:
+                            # Force split if we have a very long sentence
+                            # Hard wrap at target_size
+                            while len(s) > 0:
+                                space_left = target_size - (len(buf) + (1 if buf else 0))
+                                if space_left <= 0:
+                                    flush_buf()
+                                    buf = ""
+                                    space_left = target_size
+                                take = s[:space_left]
+                                buf = (buf + " " + take).strip() if buf else take
+                                s = s[space_left:]
+                                if len(buf) >= min_size:
+                                    flush_buf()
+                                    buf = ""
+    if buf:
+        flush_buf()
+
+    # Add overlap by repeating tail of previous chunk at start of next
+    if overlap > 0 and len(chunks) > 1:
+        overlapped = []
+        for i, ch in enumerate(chunks):
+            if i == 0:
+                overlapped.append(ch)
+            else:
+                prev_tail = chunks[i - 1][-overlap:]
+                merged = (prev_tail + "\n" + ch).strip()
+                overlapped.append(merged)
+        chunks = overlapped
+
+    return chunks
+
+
+def load_corpus(input_dirs: List[str], toronto: bool = False) -> List[str]:
+    texts = []
+    for d in input_dirs:
+        for p in sorted(Path(d).rglob("*.json")):
+            if p.name.startswith("."):
+                continue
+            text = json.loads(p.read_text(encoding="utf-8", errors="ignore")).get("text") or ""
+            if text.strip():
+                texts.append(text)
+    if toronto:
+        from scraping_common.doc_cache import DocumentCache
+        from scraping_common.manifest import FetchManifest
+        from scraping_common.pdf_extract import extract_pdf_text
+
+        cache = DocumentCache()
+        manifest = FetchManifest(os.path.join(cache.root, "toronto_manifest.json"))
+        for url, entry in sorted(manifest.entries.items()):
+            path = cache.get(entry.get("content_sha256"))
+            if path:
+                text = extract_pdf_text(path, name=url)
+                if text.strip():
+                    texts.append(text)
+    return texts
+
+
+CHUNKERS = {
+    "offset": lambda t, size, overlap, min_size: chunk_with_offsets(t, size, overlap, min_size),
+    "sentence": lambda t, size, overlap, min_size: legacy_sentence_chunks(t, size, overlap, min_size),
+    "window": lambda t, size, overlap, min_size: window_chunks(t, size, overlap),
+}
+
+
+def run_chunker(fn, texts: List[str], size: int, overlap: int, min_size: int) -> list:
+    return [fn(t, size, overlap, min_size) for t in texts]
+
+
+def benchmark(texts: List[str], size: int, overlap: int, min_size: int, repeats: int = 5) -> List[dict]:
+    total_chars = sum(len(t) for t in texts)
+    rows = []
+    for name, fn in CHUNKERS.items():
+        best = float("inf")
+        for _ in range(repeats):
+            began = time.perf_counter()
+            result = run_chunker(fn, texts, size, overlap, min_size)
+            best = min(best, time.perf_counter() - began)
+
+        tracemalloc.start()
+        run_chunker(fn, texts, size, overlap, min_size)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        lengths = [len(c.text if hasattr(c, "text") else c) for chunks in result for c in chunks]
+        rows.append({
+            "chunker": name,
+            "seconds": best,
+            "mb_per_s": total_chars / 1e6 / best if best else 0.0,
+            "chunks": len(lengths),
+            "mean_chars": sum(lengths) / len(lengths) if lengths else 0.0,
+            "max_chars": max(lengths, default=0),
+            "peak_mb": peak / 1e6,
+        })
+        if name == "offset":
+            bad = sum(1 for t, chunks in zip(texts, result) for c in chunks if t[c.start:c.end] != c.text)
+            if bad:
+                print(f"WARNING: {bad} offset chunks don't match their slice")
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the offset-based chunker against the previous ones.")
+    ap.add_argument("--input", nargs="*", default=[], help="Scraper output folders with by-law .json files")
+    ap.add_argument("--toronto", action="store_true", help="Include Toronto PDFs from the document cache")
+    ap.add_argument("--size", type=int, default=1000, help="Target chunk size in characters (default 1000)")
+    ap.add_argument("--overlap", type=int, default=150, help="Overlap in characters (default 150)")
+    ap.add_argument("--minchunk", type=int, default=600, help="Minimum chunk size (default 600)")
+    ap.add_argument("--repeats", type=int, default=5, help="Timed runs per chunker, best is reported (default 5)")
+    args = ap.parse_args()
+
+    texts = load_corpus(args.input, toronto=args.toronto)
+    if not texts:
+        raise SystemExit("No texts found; pass --input folders and/or --toronto")
+    print(f"Corpus: {len(texts)} documents, {sum(len(t) for t in texts) / 1e6:.1f}M characters")
+    rows = benchmark(texts, args.size, args.overlap, args.minchunk, repeats=args.repeats)
+    print(f"{'chunker':<10}{'best s':>9}{'MB/s':>9}{'chunks':>9}{'mean':>8}{'max':>7}{'peak MB':>9}")
+    for r in rows:
+        print(f"{r['chunker']:<10}{r['seconds']:>9.3f}{r['mb_per_s']:>9.1f}{r['chunks']:>9}"
+              f"{r['mean_chars']:>8.0f}{r['max_chars']:>7}{r['peak_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# file: benchmark_retrieval.py
+# Measures recall@k vs latency of Atlas $vectorSearch for a grid of
+# numCandidates/limit values, using exact brute-force top-k over an exported
+# embedding snapshot as ground truth.
+#
+#   # 1. export the vectors of a collection once (ids + float32 matrix)
+#   python benchmark_retrieval.py export --collection waterloo
+#   # 2. sweep ANN parameters with a query set (one query per line, or .jsonl with {"query": ...})
+#   python benchmark_retrieval.py run --collection waterloo --queries queries.txt \
+#       --candidates 50,100,200,400 --limits 2,4,8 --target-recall 0.95 --write-settings
+#
+# --write-settings stores the cheapest numCandidates that reaches the target
+# recall for --choose-limit into search_settings.json, which query_database reads.
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import embed_vectors
+import query_database
+from clients import get_mongo_client
+from vector_codec import decode_vector
+
+SNAPSHOT_DIR = "snapshots"
+
+
+def snapshot_path(collection_name: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{collection_name}.npz")
+
+
+def export_snapshot(database_name: str, collection_name: str, embedding_path: str = None, path: str = None) -> str:
+    """Dumps (_id, embedding) of every chunk to an .npz file with L2-normalized float32 vectors."""
+    mongo_client, error = get_mongo_client()
+    if not mongo_client:
+        raise RuntimeError(f"MongoDB client is not available: {error}")
+    settings = query_database.get_search_settings(collection_name)
+    embedding_path = embedding_path or settings["embedding_path"]
+    path = path or snapshot_path(collection_name)
+
+    collection = mongo_client[database_name][collection_name]
+    ids, vectors = [], []
+    cursor = collection.find({embedding_path: {"$exists": True, "$ne": None}}, {embedding_path: 1}).batch_size(1000)
+    for doc in cursor:
+        ids.append(str(doc["_id"]))
+        vectors.append(decode_vector(doc[embedding_path]))
+    if not vectors:
+        raise RuntimeError(f"No documents with '{embedding_path}' in {database_name}.{collection_name}")
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez(path, ids=np.asarray(ids), vectors=matrix, embedding_path=embedding_path)
+    print(f"Exported {len(ids)} vectors ({matrix.shape[1]} dims) from {database_name}.{collection_name}.{embedding_path} to {path}")
+    return path
+
+
+def load_snapshot(path: str):
+    data = np.load(path)
+    return data["ids"], data["vectors"]
+
+
+def load_queries(path: str) -> list[str]:
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                line = json.loads(line).get("query", "")
+            if line:
+                queries.append(line)
+    return queries
+
+
+def embed_queries(queries: list[str]) -> np.ndarray:
+    model = embed_vectors.get_embedding_model()
+    vectors = model.encode(queries, batch_size=32, normalize_embeddings=True)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def exact_top_k(matrix: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    """Brute-force cosine top-k (vectors are normalized, so a dot product is enough)."""
+    scores = query_vectors @ matrix.T
+    k = min(k, matrix.shape[0])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def ann_search(collection, settings: dict, query_vector: list[float], num_candidates: int, limit: int):
+    pipeline = [
+        query_database.build_vector_search_stage(query_vector, settings, limit=limit, num_candidates=num_candidates),
+        {"$project": {"_id": 1}},
+    ]
+    start = time.perf_counter()
+    docs = list(collection.aggregate(pipeline))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return [str(d["_id"]) for d in docs], elapsed_ms
+
+
+def sweep(database_name: str, collection_name: str, ids: np.ndarray, matrix: np.ndarray, queries: list[str],
+          candidates: list[int], limits: list[int], repeats: int = 1) -> list[dict]:
+    """Runs every (numCandidates, limit) pair for every query and returns one result row per pair."""
+    mongo_client, error = get_mongo_client()
+    if not mongo_client:
+        raise RuntimeError(f"MongoDB client is not available: {error}")
+    collection = mongo_client[database_name][collection_name]
+    settings = query_database.get_search_settings(collection_name)
+
+    query_vectors = embed_queries(queries)
+    truth = exact_top_k(matrix, query_vectors, max(limits))
+
+    rows = []
+    for limit in limits:
+        for num_candidates in candidates:
+            if num_candidates < limit:
+                continue
+            recalls, latencies = [], []
+            for qi, qv in enumerate(query_vectors):
+                expected = set(ids[truth[qi, :limit]].tolist())
+                for _ in range(repeats):
+                    found, elapsed_ms = ann_search(collection, settings, qv.tolist(), num_candidates, limit)
+                    latencies.append(elapsed_ms)
+                recalls.append(len(expected.intersection(found)) / len(expected))
+            row = {
+                "limit": limit,
+                "num_candidates": num_candidates,
+                "recall": float(np.mean(recalls)),
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p95_ms": float(np.percentile(latencies, 95)),
+            }
+            rows.append(row)
+            print(f"  limit={limit:<3} numCandidates={num_candidates:<5} recall@{limit}={row['recall']:.3f} "
+                  f"p50={row['p50_ms']:.1f}ms p95={row['p95_ms']:.1f}ms")
+    return rows
+
+
+def choose_setting(rows: list[dict], limit: int, target_recall: float):
+    """Cheapest numCandidates reaching target_recall for a limit (or the best-recall row if none does)."""
+    rows = [r for r in rows if r["limit"] == limit]
+    if not rows:
+        return None
+    passing = [r for r in rows if r["recall"] >= target_recall]
+    if passing:
+        return min(passing, key=lambda r: r["num_candidates"])
+    return max(rows, key=lambda r: (r["recall"], -r["num_candidates"]))
+
+
+def write_settings(collection_name: str, row: dict, path: str = query_database.SEARCH_SETTINGS_FILE):
+    settings = query_database.load_settings_overrides(path)
+    settings.setdefault(collection_name, {}).update({
+        "num_candidates": row["num_candidates"],
+        "limit": row["limit"],
+        "max_k": row["limit"], # upper bound for the adaptive cutoff
+    })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(settings, f, indent=2)
+    print(f"Wrote {collection_name} -> numCandidates={row['num_candidates']}, limit={row['limit']} to {path}")
+
+
+def parse_int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Recall vs latency benchmark for $vectorSearch numCandidates/limit.")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    ex = sub.add_parser("export", help="Export a collection's embeddings to a snapshot")
+    ex.add_argument("--db", default="bylaws")
+    ex.add_argument("--collection", required=True)
+    ex.add_argument("--field", default=None, help="Embedding field (defaults to the collection's search setting)")
+    ex.add_argument("--out", default=None, help="Snapshot path (default snapshots/<collection>.npz)")
+
+    run = sub.add_parser("run", help="Sweep ANN parameters against exact top-k")
+    run.add_argument("--db", default="bylaws")
+    run.add_argument("--collection", required=True)
+    run.add_argument("--snapshot", default=None, help="Snapshot path (default snapshots/<collection>.npz)")
+    run.add_argument("--queries", required=True, help="Query set: .txt (one per line) or .jsonl with 'query'")
+    run.add_argument("--candidates", default="25,50,100,200,400", help="Comma list of numCandidates values")
+    run.add_argument("--limits", default="2,4,8", help="Comma list of limit values (k)")
+    run.add_argument("--repeats", type=int, default=1, help="Timed runs per query (default 1)")
+    run.add_argument("--target-recall", type=float, default=0.95)
+    run.add_argument("--choose-limit", type=int, default=4, help="Limit to pick numCandidates for (default 4)")
+    run.add_argument("--write-settings", action="store_true", help="Store the chosen setting in search_settings.json")
+    run.add_argument("--report", default=None, help="Optional path to write all result rows as JSON")
+    args = ap.parse_args()
+
+    if args.command == "export":
+        export_snapshot(args.db, args.collection, embedding_path=args.field, path=args.out)
+        return
+
+    ids, matrix = load_snapshot(args.snapshot or snapshot_path(args.collection))
+    queries = load_queries(args.queries)
+    print(f"Benchmarking {args.db}.{args.collection}: {len(ids)} vectors, {len(queries)} queries")
+    rows = sweep(args.db, args.collection, ids, matrix, queries,
+                 parse_int_list(args.candidates), parse_int_list(args.limits), repeats=args.repeats)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+    chosen = choose_setting(rows, args.choose_limit, args.target_recall)
+    if chosen is None:
+        print(f"No results for limit={args.choose_limit}; nothing to choose.")
+        return
+    print(f"Suggested for {args.collection}: numCandidates={chosen['num_candidates']} limit={chosen['limit']} "
+          f"(recall {chosen['recall']:.3f}, p95 {chosen['p95_ms']:.1f}ms)")
+    if args.write_settings:
+        write_settings(args.collection, chosen)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# file: bylaw_summaries.py
+# Builds the bylaw-level collection used by the first stage of a two-stage search.
+#
+# One document per bylaw in <collection>_bylaws with a summary_embedding: the
+# L2-normalized centroid of the bylaw's chunk vectors, optionally blended with an
+# embedding of its title (--title-weight). query_database searches these first
+# (when "two_stage" is on for the collection) to choose the top few bylaws, then
+# runs the chunk $vectorSearch filtered to those bylaw ids.
+#
+#   python bylaw_summaries.py                         # every searchable collection
+#   python bylaw_summaries.py --collections waterloo --title-weight 0.5
+#   python vector_index.py                            # then (re)create the indexes
+import argparse
+from datetime import datetime, timezone
+
+import numpy as np
+import pymongo
+
+import embed_vectors
+import query_database
+from clients import get_mongo_client
+from embedding_cache import MINILM_MODEL_NAME
+from vector_codec import decode_vector
+
+# chunk schemas differ between Toronto and Waterloo/Guelph
+TITLE_FIELDS = ("title", "bylaw_title")
+URL_FIELDS = ("pdf_url", "url")
+
+
+def _first(doc: dict, fields) -> str:
+    for f in fields:
+        if doc.get(f):
+            return doc[f]
+    return None
+
+
+def chunk_centroids(collection, id_field: str, embedding_path: str, batch: int = 1000) -> dict:
+    """One streaming pass over the chunks: bylaw id -> {sum, count, title, url}."""
+    projection = {"_id": 0, id_field: 1, embedding_path: 1, **{f: 1 for f in TITLE_FIELDS + URL_FIELDS}}
+    bylaws = {}
+    cursor = collection.find({embedding_path: {"$exists": True, "$ne": None}}, projection).batch_size(batch)
+    for doc in cursor:
+        bylaw_id = doc.get(id_field)
+        if bylaw_id is None:
+            continue
+        vec = np.asarray(decode_vector(doc[embedding_path]), dtype=np.float32)
+        entry = bylaws.get(bylaw_id)
+        if entry is None:
+            bylaws[bylaw_id] = {"sum": vec.copy(), "count": 1,
+                                "title": _first(doc, TITLE_FIELDS), "url": _first(doc, URL_FIELDS)}
+        else:
+            entry["sum"] += vec
+            entry["count"] += 1
+    return bylaws
+
+
+def _normalize(vec: np.ndarray) -> np.ndarray:
+    return vec / max(float(np.linalg.norm(vec)), 1e-12)
+
+
+def build_bylaw_summaries(database_name: str, collection_name: str, title_weight: float = 0.0,
+                          batch: int = 500) -> int:
+    mongo_client, error = get_mongo_client()
+    if not mongo_client:
+        raise RuntimeError(f"MongoDB client is not available: {error}")
+    settings = query_database.get_search_settings(collection_name)
+    db = mongo_client[database_name]
+    target = db[query_database.summary_collection_name(collection_name, settings)]
+
+    bylaws = chunk_centroids(db[collection_name], settings["id_field"], settings["embedding_path"])
+    if not bylaws:
+        print(f"{collection_name}: no embedded chunks")
+        return 0
+
+    ids = list(bylaws)
+    vectors = np.stack([_normalize(bylaws[i]["sum"] / bylaws[i]["count"]) for i in ids])
+    if title_weight > 0:
+        titles = [bylaws[i]["title"] or "" for i in ids]
+        title_vecs = embed_vectors.get_embedding_model().encode(titles, batch_size=64, normalize_embeddings=True)
+        vectors = vectors + title_weight * np.asarray(title_vecs, dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+
+    target.create_index([("bylaw_id", 1)], unique=True)
+    built_at = datetime.now(timezone.utc).isoformat()
+    ops = []
+    for bylaw_id, vec in zip(ids, vectors):
+        entry = bylaws[bylaw_id]
+        ops.append(pymongo.UpdateOne(
+            {"bylaw_id": bylaw_id},
+            {"$set": {
+                "bylaw_id": bylaw_id,
+                "title": entry["title"],
+                "url": entry["url"],
+                "chunk_count": entry["count"],
+                settings["summary_embedding_path"]: vec.tolist(),
+                "embedding_model": MINILM_MODEL_NAME,
+                "title_weight": title_weight,
+                "built_at": built_at,
+            }},
+            upsert=True,
+        ))
+        if len(ops) >= batch:
+            target.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        target.bulk_write(ops, ordered=False)
+    removed = target.delete_many({"bylaw_id": {"$nin": ids}}).deleted_count
+
+    print(f"{collection_name}: {len(ids)} bylaw summaries from "
+          f"{sum(b['count'] for b in bylaws.values())} chunks -> {target.name} ({removed} removed)")
+    return len(ids)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build <collection>_bylaws summary vectors for two-stage search.")
+    ap.add_argument("--db", default="bylaws")
+    ap.add_argument("--collections", default=",".join(query_database.COLLECTION_SEARCH_SETTINGS),
+                    help="Comma list of chunk collections (default: all searchable ones)")
+    ap.add_argument("--title-weight", type=float, default=0.0,
+                    help="Blend in the title embedding with this weight (default 0: chunk centroid only)")
+    args = ap.parse_args()
+
+    for name in [c.strip() for c in args.collections.split(",") if c.strip()]:
+        build_bylaw_summaries(args.db, name, title_weight=args.title_weight)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# file: chunk_token_report.py
+# How many stored chunks are longer than the embedding model's sequence limit?
+#
+# all-MiniLM-L6-v2 truncates its input at 256 word pieces (CLS/SEP included),
+# so anything past that in a chunk is never embedded.  This tokenizes every
+# chunk_text in each collection with the model's own fast tokenizer (batched)
+# and reports the share of truncated chunks and of tokens that are dropped.
+#
+#   python chunk_token_report.py                        # bylaw_chunks, waterloo, guelph
+#   python chunk_token_report.py --collections waterloo --batch 2000
+import argparse
+
+import numpy as np
+
+import embed_vectors
+import query_database
+from clients import get_mongo_client
+
+
+def token_lengths(tokenizer, texts: list[str]) -> list[int]:
+    enc = tokenizer(texts, add_special_tokens=True, truncation=False, verbose=False,
+                    return_attention_mask=False, return_token_type_ids=False)
+    return [len(ids) for ids in enc["input_ids"]]
+
+
+def report_collection(collection, tokenizer, limit: int, batch: int = 1000) -> dict:
+    lengths = []
+    texts = []
+    for doc in collection.find({"chunk_text": {"$exists": True}}, {"_id": 0, "chunk_text": 1}).batch_size(batch):
+        texts.append(doc.get("chunk_text") or "")
+        if len(texts) >= batch:
+            lengths.extend(token_lengths(tokenizer, texts))
+            texts = []
+    if texts:
+        lengths.extend(token_lengths(tokenizer, texts))
+    if not lengths:
+        return {"chunks": 0}
+
+    arr = np.asarray(lengths)
+    over = arr > limit
+    return {
+        "chunks": int(arr.size),
+        "truncated": int(over.sum()),
+        "truncated_pct": 100.0 * over.mean(),
+        "tokens_dropped_pct": 100.0 * float(np.clip(arr - limit, 0, None).sum()) / float(arr.sum()),
+        "p50": int(np.percentile(arr, 50)),
+        "p95": int(np.percentile(arr, 95)),
+        "max": int(arr.max()),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Count chunks that exceed the embedding model's token limit.")
+    ap.add_argument("--db", default="bylaws")
+    ap.add_argument("--collections", default=",".join(query_database.COLLECTION_SEARCH_SETTINGS),
+                    help="Comma list of collections (default: all searchable ones)")
+    ap.add_argument("--batch", type=int, default=1000, help="Chunks per tokenizer call (default 1000)")
+    args = ap.parse_args()
+
+    model = embed_vectors.get_embedding_model()
+    limit = model.max_seq_length
+    mongo_client, error = get_mongo_client()
+    if not mongo_client:
+        raise RuntimeError(f"MongoDB client is not available: {error}")
+
+    print(f"Model limit: {limit} tokens (including CLS/SEP)")
+    for name in [c.strip() for c in args.collections.split(",") if c.strip()]:
+        r = report_collection(mongo_client[args.db][name], model.tokenizer, limit, args.batch)
+        if not r["chunks"]:
+            print(f"{name}: no chunks")
+            continue
+        print(f"{name}: {r['truncated']}/{r['chunks']} chunks truncated ({r['truncated_pct']:.1f}%), "
+              f"{r['tokens_dropped_pct']:.1f}% of tokens never embedded; "
+              f"tokens p50={r['p50']} p95={r['p95']} max={r['max']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 # file: clients.py
 
 import os
+import random
+import threading
+import time
+
 import pymongo
 from google import genai
 from dotenv import load_dotenv
@@ -13,30 +17,176 @@ if not GEMINI_API_KEY:
 
 gemini_client = genai.Client(api_key=GEMINI_API_KEY)
 
-# Use "private" global variables
-_mongo_client = None
+# ---- MongoDB ----
+# One MongoClient per process, owned by a manager that knows whether Atlas is up.
+# A background thread pings the cluster every MONGO_HEALTH_INTERVAL seconds. When a
+# ping (or a query, via mark_mongo_down) fails, the cluster is "known down":
+# get_mongo_client() returns (None, error) at once instead of every request blocking
+# on server selection, and reconnects are retried with exponential backoff
+# (MONGO_BACKOFF_BASE doubling up to MONGO_BACKOFF_MAX seconds) by the prober.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 20))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 3000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 3000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 10000))
+MONGO_HEALTH_INTERVAL = float(os.getenv("MONGO_HEALTH_INTERVAL", 15))
+MONGO_BACKOFF_BASE = float(os.getenv("MONGO_BACKOFF_BASE", 1))
+MONGO_BACKOFF_MAX = float(os.getenv("MONGO_BACKOFF_MAX", 60))
+MONGO_CLIENT_OPTIONS = dict(
+    tls=True,
+    tlsAllowInvalidCertificates=False,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+)
+
+
+def mongo_uri() -> str:
+    DATABASE_LOGIN = os.getenv("DATABASE_LOGIN")
+    # print("logging in with:", DATABASE_LOGIN)
+    return f"mongodb+srv://{DATABASE_LOGIN}@gdsc2025.cn3wt5n.mongodb.net/?retryWrites=true&w=majority&appName=GDSC2025"
+
+
+class MongoClientManager:
+    """Owns the process's MongoClient, its health state and the reconnect schedule."""
+
+    def __init__(self, uri_factory=mongo_uri, health_interval: float = MONGO_HEALTH_INTERVAL,
+                 backoff_base: float = MONGO_BACKOFF_BASE, backoff_max: float = MONGO_BACKOFF_MAX):
+        self.uri_factory = uri_factory
+        self.health_interval = health_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock() # health state
+        self._connect_lock = threading.Lock() # one ping at a time (first request vs. prober)
+        self._reset()
+
+    def _reset(self):
+        # also called in a forked child: the parent's client and thread don't carry over
+        self._pid = os.getpid()
+        self._client = None
+        self._healthy = False
+        self._error = None
+        self._failures = 0
+        self._next_attempt = 0.0 # monotonic time of the next reconnect attempt
+        self.down_since = None # wall-clock start of the current outage, None while up
+        self._wake = threading.Event()
+        self._prober = None
+
+    def _new_client(self) -> pymongo.MongoClient:
+        return pymongo.MongoClient(self.uri_factory(), **MONGO_CLIENT_OPTIONS)
+
+    def _connect(self) -> bool:
+        """Creates the client if needed and pings it; updates the health state either way."""
+        try:
+            with self._connect_lock:
+                if self._client is None:
+                    self._client = self._new_client()
+                self._client.admin.command('ping')
+        except pymongo.errors.PyMongoError as e:
+            # ConfigurationError covers the SRV lookup failing when DNS is down too
+            self.mark_down(e, attempt=True)
+            return False
+        with self._lock:
+            if not self._healthy:
+                print(f"Process {os.getpid()}: MongoDB connection successful.")
+            self._healthy = True
+            self._error = None
+            self._failures = 0
+            self.down_since = None
+        return True
+
+    def mark_down(self, error, attempt: bool = False) -> None:
+        """
+        Enters the known-down state and schedules the next reconnect attempt. Reports from
+        requests that are already known to be down don't push the schedule back; a failed
+        reconnect ``attempt`` doubles the wait.
+        """
+        with self._lock:
+            if not attempt and not self._healthy and self.down_since is not None:
+                return
+            if self.down_since is None:
+                print(f"MongoDB connection failed: {error}")
+                self.down_since = time.time()
+            self._healthy = False
+            self._error = error
+            self._failures += 1
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (self._failures - 1))
+            self._next_attempt = time.monotonic() + delay * random.uniform(0.8, 1.2)
+        self._wake.set()
+
+    def _probe_forever(self):
+        while True:
+            if self._healthy:
+                self._wake.wait(self.health_interval)
+            else:
+                self._wake.wait(max(0.0, self._next_attempt - time.monotonic()))
+            self._wake.clear()
+            if self._healthy or time.monotonic() >= self._next_attempt:
+                self._connect()
+
+    def _start_prober(self):
+        self._prober = threading.Thread(target=self._probe_forever, name="mongo-health", daemon=True)
+        self._prober.start()
+
+    def get(self):
+        """(client, None) when the cluster is up, (None, error) immediately while it is known down."""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+        if self._healthy:
+            return self._client, None
+
+        with self._lock:
+            first = self._client is None and self._error is None
+        if first:
+            # first call in this process: connect inline once, then leave it to the prober
+            print(f"Process {os.getpid()}: Initializing MongoDB client for the first time...")
+            connected = self._connect()
+            with self._lock:
+                if self._prober is None:
+                    self._start_prober()
+            if connected:
+                return self._client, None
+        return None, self._error
+
+
+_mongo_manager = MongoClientManager()
+
 
 def get_mongo_client():
-    """Gets the MongoDB client, initializing it on the first call."""
-    global _mongo_client
-    error = None
-    if _mongo_client is None:
-        print(f"Process {os.getpid()}: Initializing MongoDB client for the first time...")
-        DATABASE_LOGIN = os.getenv("DATABASE_LOGIN")
-        # print("logging in with:", DATABASE_LOGIN)
-        uri = f"mongodb+srv://{DATABASE_LOGIN}@gdsc2025.cn3wt5n.mongodb.net/?retryWrites=true&w=majority&appName=GDSC2025"
+    """Gets the MongoDB client, initializing it on the first call. (None, error) while the cluster is down."""
+    return _mongo_manager.get()
+
+
+def mark_mongo_down(error) -> None:
+    """Report a connection failure seen while using the client (skips waiting for the next health check)."""
+    _mongo_manager.mark_down(error)
+
+
+def mongo_outage_started():
+    """Start time of the current MongoDB outage (time.time()), or None while it is reachable."""
+    return _mongo_manager.down_since
+
+
+# The ASGI app (asgi_app.py) queries through pymongo's AsyncMongoClient with the same
+# pool and timeouts. Health is still tracked by the manager above: the async path skips
+# Mongo while it is known down and reports failures with mark_mongo_down.
+_async_mongo_client = None
+
+def get_async_mongo_client():
+    """Gets the AsyncMongoClient, creating it on the first call (from inside the event loop)."""
+    global _async_mongo_client
+    if _async_mongo_client is None:
         try:
-            _mongo_client = pymongo.MongoClient(uri, tls=True, tlsAllowInvalidCertificates=False)
-            print("got client I think")
-            _mongo_client.admin.command('ping')
-            print(f"Process {os.getpid()}: MongoDB connection successful.")
-            error = None
-        except pymongo.errors.ConnectionFailure as e:
-            print(f"MongoDB connection failed: {e}")
-            _mongo_client = None # Ensure it remains None on failure
-            error = e
-
-    return _mongo_client, error
+            _async_mongo_client = pymongo.AsyncMongoClient(mongo_uri(), **MONGO_CLIENT_OPTIONS)
+            print(f"Process {os.getpid()}: AsyncMongoClient created.")
+        except pymongo.errors.PyMongoError as e:
+            print(f"MongoDB async client could not be created: {e}")
+            return None, e
+    return _async_mongo_client, None
 
 # def configure_gemini():
 #     GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
@@ -3,9 +3,11 @@
 from sentence_transformers import SentenceTransformer
 
 from dotenv import load_dotenv
+import asyncio
 import os
 import pymongo
 import torch
+from concurrent.futures import ThreadPoolExecutor
 # embed_vectors.py modifications
 os.environ["OMP_NUM_THREADS"] = "1"
 os.environ["MKL_NUM_THREADS"] = "1"
@@ -52,6 +54,18 @@ def embed_text(text: str) -> list[float]:
         print(f"Error during embedding: {e}")
         return None
 
+# The ASGI app (asgi_app.py) embeds on a small thread pool so encoding a query never
+# blocks the event loop. EMBED_THREADS (default 1) matches torch's one thread per process.
+_embed_executor = None
+
+async def embed_text_async(text: str) -> list[float]:
+    """embed_text on the embedding thread pool."""
+    global _embed_executor
+    if _embed_executor is None:
+        _embed_executor = ThreadPoolExecutor(max_workers=int(os.getenv("EMBED_THREADS", 1)),
+                                             thread_name_prefix="embed")
+    return await asyncio.get_running_loop().run_in_executor(_embed_executor, embed_text, text)
+
 # The update_documents_with_embeddings function can remain as is,
 # as it will also use the new lazy-loading embed_text function.
 
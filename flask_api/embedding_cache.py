@@ -0,0 +1,124 @@
+# file: embedding_cache.py
+# Content-addressed, on-disk cache of chunk embeddings shared by every ingest
+# and re-embed path (reembed.py / reembed_cpu.py and the streaming ingest pipeline behind
+# scraping_toronto/create_database.py and the insert_bylaws.py scripts).
+#
+# Key:   (model name, sha256 of the exact chunk text)
+# Value: the vector as a float16 blob (384 dims -> 768 bytes)
+#
+# Identical text is only ever embedded once per model, no matter which city or
+# run it comes from. Vectors are stored L2-normalized (MiniLM already outputs
+# unit vectors), so float16 costs nothing measurable in cosine similarity.
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache", "embeddings.sqlite3"),
+)
+
+# Cache key for the production model (all-MiniLM-L6-v2 on CPU, 384 dims)
+MINILM_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# SQLite caps the number of host parameters per statement
+_LOOKUP_BATCH = 500
+
+
+def text_sha256(text: str) -> str:
+    """Same digest as the content_sha256 stored on chunks."""
+    return hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # readers don't block the writer (multi-process re-embeds)
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, sha256)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model_name: str, digests: list[str]) -> dict[str, np.ndarray]:
+        """Returns {sha256: float32 vector} for the digests that are cached."""
+        found = {}
+        unique = list(dict.fromkeys(digests))
+        with self._lock:
+            for start in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT sha256, vector FROM embeddings WHERE model = ? AND sha256 IN ({placeholders})",
+                    [model_name, *batch],
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+        return found
+
+    def put_many(self, model_name: str, vectors: dict[str, np.ndarray]):
+        rows = []
+        for digest, vec in vectors.items():
+            vec = np.asarray(vec, dtype=np.float16)
+            rows.append((model_name, digest, int(vec.shape[0]), vec.tobytes()))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self) -> str:
+        return f"embedding cache: {self.hits} hits, {self.misses} misses ({self.hit_rate():.1%} hit rate)"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def encode_cached(model, model_name: str, texts: list[str], cache: EmbeddingCache = None,
+                  batch_size: int = 64) -> list[list[float]]:
+    """
+    Embeds texts with `model` (a SentenceTransformer), consulting `cache` first.
+
+    Only cache misses reach the model, and they are encoded in batches. Results
+    come back in input order as plain lists, ready to store in Mongo.
+    """
+    if not texts:
+        return []
+    digests = [text_sha256(t) for t in texts]
+    cached = cache.get_many(model_name, digests) if cache is not None else {}
+
+    missing = {}
+    for digest, text in zip(digests, texts):
+        if digest not in cached and digest not in missing:
+            missing[digest] = text
+    if cache is not None:
+        cache.hits += sum(1 for d in digests if d in cached)
+        cache.misses += len(digests) - sum(1 for d in digests if d in cached)
+
+    if missing:
+        encoded = model.encode(list(missing.values()), batch_size=batch_size, normalize_embeddings=True)
+        fresh = {digest: np.asarray(vec, dtype=np.float32) for digest, vec in zip(missing.keys(), encoded)}
+        if cache is not None:
+            cache.put_many(model_name, fresh)
+        cached.update(fresh)
+
+    return [cached[d].tolist() for d in digests]
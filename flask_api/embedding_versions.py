@@ -0,0 +1,315 @@
+# file: embedding_versions.py
+# Blue/green embedding versions per collection.
+#
+# A version is a vector field (plus the Atlas index on it) holding one
+# re-embedding of a collection's chunks. The "embedding_versions" collection
+# keeps one document per version and one pointer per collection:
+#
+#   {"_id": "waterloo@v2", "kind": "version", "collection": "waterloo", "version": "v2",
+#    "embedding_path": "chunk_embedding_v2", "index": "vector_index_v2", "status": "validated", ...}
+#   {"_id": "active:waterloo", "kind": "pointer", "collection": "waterloo",
+#    "active":   {"version": "v2", "embedding_path": "chunk_embedding_v2", "index": "vector_index_v2"},
+#    "previous": {"version": "v1", ...}}
+#
+# query_database reads the pointer at runtime (cached for EMBEDDING_VERSION_TTL
+# seconds), so switching versions is one atomic update of the pointer document
+# and needs no deploy; rollback swaps active and previous back. Collections
+# without a pointer keep using the static search settings.
+#
+# Switching a collection to a new field:
+#   python embedding_versions.py init        --collection waterloo                 # register the current field as v1
+#   python embedding_versions.py create      --collection waterloo --version v2 --field chunk_embedding_v2
+#   python reembed.py --collection waterloo --field chunk_embedding_v2             # fill it (search unaffected)
+#   python embedding_versions.py build-index --collection waterloo --version v2
+#   python embedding_versions.py validate    --collection waterloo --version v2 --queries queries.txt
+#   python embedding_versions.py activate    --collection waterloo --version v2
+#   python embedding_versions.py rollback    --collection waterloo
+import argparse
+import os
+import time
+from datetime import datetime, timezone
+
+import pymongo
+
+from clients import get_mongo_client
+from embedding_cache import MINILM_MODEL_NAME
+from vector_codec import VECTOR_FORMATS
+
+VERSIONS_DB = os.getenv("EMBEDDING_VERSIONS_DB", "bylaws")
+VERSIONS_COLLECTION = "embedding_versions"
+VERSION_TTL_SECONDS = float(os.getenv("EMBEDDING_VERSION_TTL", "30"))
+
+# collection -> (expires_at, settings overrides); per process
+_active_cache = {}
+
+
+def _versions(mongo_client):
+    return mongo_client[VERSIONS_DB][VERSIONS_COLLECTION]
+
+
+def active_overrides(collection_name: str) -> dict:
+    """
+    {"embedding_path", "index", "vector_format"} of the collection's active version, or {} if it has
+    no pointer. Cached for VERSION_TTL_SECONDS; on a read error the last known value is kept.
+    """
+    now = time.monotonic()
+    cached = _active_cache.get(collection_name)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    overrides = cached[1] if cached else {}
+    mongo_client, _ = get_mongo_client()
+    if mongo_client:
+        try:
+            pointer = _versions(mongo_client).find_one({"_id": f"active:{collection_name}"}, {"active": 1})
+            active = (pointer or {}).get("active") or {}
+            overrides = {k: active[k] for k in ("embedding_path", "index", "vector_format") if active.get(k)}
+        except pymongo.errors.PyMongoError as e:
+            print(f"Could not read the embedding version of {collection_name}, keeping the last one: {e}")
+    _active_cache[collection_name] = (now + VERSION_TTL_SECONDS, overrides)
+    return overrides
+
+
+# ---- CLI ---------------------------------------------------
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _get_version(col, collection_name: str, version: str) -> dict:
+    doc = col.find_one({"_id": f"{collection_name}@{version}"})
+    if not doc:
+        raise SystemExit(f"Unknown version {version} for {collection_name} (see 'list')")
+    return doc
+
+
+def _register(col, collection_name: str, version: str, field: str, index: str, status: str,
+              vector_format: str = "array") -> dict:
+    doc = {
+        "_id": f"{collection_name}@{version}",
+        "kind": "version",
+        "collection": collection_name,
+        "version": version,
+        "embedding_path": field,
+        "index": index,
+        "vector_format": vector_format,
+        "model": MINILM_MODEL_NAME,
+        "status": status,
+        "created_at": _now(),
+    }
+    try:
+        col.insert_one(doc)
+    except pymongo.errors.DuplicateKeyError:
+        raise SystemExit(f"{collection_name}@{version} already exists")
+    print(f"Registered {collection_name}@{version}: field={field} index={index} status={status}")
+    return doc
+
+
+def _pointer_entry(doc: dict) -> dict:
+    return {"version": doc["version"], "embedding_path": doc["embedding_path"], "index": doc["index"],
+            "vector_format": doc.get("vector_format", "array")}
+
+
+def cmd_init(col, args):
+    import query_database
+
+    settings = query_database.get_search_settings(args.collection)
+    doc = _register(col, args.collection, args.version, settings["embedding_path"], settings["index"], "active",
+                    settings["vector_format"])
+    col.update_one(
+        {"_id": f"active:{args.collection}"},
+        {"$setOnInsert": {"kind": "pointer", "collection": args.collection,
+                          "active": _pointer_entry(doc), "previous": None, "switched_at": _now()}},
+        upsert=True,
+    )
+
+
+def cmd_create(col, args):
+    _register(col, args.collection, args.version, args.field, args.index or f"vector_index_{args.version}", "building",
+              args.vector_format)
+    print(f"Next: python reembed.py --collection {args.collection} --field {args.field} --vector-format {args.vector_format}"
+          f" (or migrate_vectors.py migrate to convert an existing field)")
+
+
+def cmd_build_index(col, args):
+    import query_database
+    import vector_index
+
+    doc = _get_version(col, args.collection, args.version)
+    settings = query_database.get_search_settings(args.collection)
+    vector_index.initialize_vector_index(args.db, args.collection, doc["embedding_path"],
+                                        filter_fields=[settings["id_field"]], index_name=doc["index"])
+    mongo_client, _ = get_mongo_client()
+    collection = mongo_client[args.db][args.collection]
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        info = next(iter(collection.list_search_indexes(doc["index"])), None)
+        if info and info.get("queryable"):
+            col.update_one({"_id": doc["_id"]}, {"$set": {"status": "indexed", "indexed_at": _now()}})
+            print(f"{doc['index']} is queryable")
+            return
+        time.sleep(10)
+    raise SystemExit(f"{doc['index']} not queryable after {args.timeout}s; rerun build-index to keep waiting")
+
+
+def cmd_validate(col, args):
+    import numpy as np
+
+    import benchmark_retrieval
+    import query_database
+
+    doc = _get_version(col, args.collection, args.version)
+    mongo_client, _ = get_mongo_client()
+    collection = mongo_client[args.db][args.collection]
+    base = query_database.get_search_settings(args.collection)
+    candidate = {**base, "embedding_path": doc["embedding_path"], "index": doc["index"],
+                 "vector_format": doc.get("vector_format", "array")}
+
+    # every chunk must have the new field before it can serve queries
+    missing = collection.count_documents({"chunk_text": {"$exists": True}, doc["embedding_path"]: {"$exists": False}})
+
+    # recall of the new index against exact search over the new vectors
+    path = benchmark_retrieval.snapshot_path(f"{args.collection}.{doc['embedding_path']}")
+    benchmark_retrieval.export_snapshot(args.db, args.collection, embedding_path=doc["embedding_path"], path=path)
+    ids, matrix = benchmark_retrieval.load_snapshot(path)
+    queries = benchmark_retrieval.load_queries(args.queries)
+    query_vectors = benchmark_retrieval.embed_queries(queries)
+    k = base["limit"]
+    truth = benchmark_retrieval.exact_top_k(matrix, query_vectors, k)
+
+    recalls, overlaps, latencies = [], [], []
+    for qi, qv in enumerate(query_vectors):
+        found, ms = benchmark_retrieval.ann_search(collection, candidate, qv.tolist(), base["num_candidates"], k)
+        current, _ = benchmark_retrieval.ann_search(collection, base, qv.tolist(), base["num_candidates"], k)
+        expected = set(ids[truth[qi]].tolist())
+        recalls.append(len(expected.intersection(found)) / len(expected))
+        overlaps.append(len(set(current).intersection(found)) / max(1, len(current)))
+        latencies.append(ms)
+
+    result = {
+        "queries": len(queries),
+        "k": k,
+        "missing_vectors": missing,
+        "recall": float(np.mean(recalls)),
+        "overlap_with_active": float(np.mean(overlaps)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "validated_at": _now(),
+    }
+    passed = missing == 0 and result["recall"] >= args.min_recall
+    update = {"validation": result}
+    if passed and doc["status"] in ("building", "indexed"):
+        update["status"] = "validated"
+    col.update_one({"_id": doc["_id"]}, {"$set": update})
+    print(f"{args.collection}@{args.version}: recall@{k}={result['recall']:.3f} "
+          f"overlap with active={result['overlap_with_active']:.3f} p95={result['p95_ms']:.1f}ms "
+          f"missing vectors={missing} -> {'PASS' if passed else 'FAIL'}")
+    if not passed:
+        raise SystemExit(1)
+
+
+def cmd_activate(col, args):
+    doc = _get_version(col, args.collection, args.version)
+    if doc["status"] not in ("validated", "retired", "active") and not args.force:
+        raise SystemExit(f"{doc['_id']} is '{doc['status']}'; validate it first or pass --force")
+    pointer = col.find_one({"_id": f"active:{args.collection}"}) or {}
+    current = pointer.get("active")
+    if current and current["version"] == args.version:
+        print(f"{doc['_id']} is already active")
+        return
+    # single-document update: readers see either the old or the new pointer
+    col.update_one(
+        {"_id": f"active:{args.collection}"},
+        {"$set": {"kind": "pointer", "collection": args.collection, "active": _pointer_entry(doc),
+                  "previous": current, "switched_at": _now()}},
+        upsert=True,
+    )
+    col.update_one({"_id": doc["_id"]}, {"$set": {"status": "active", "activated_at": _now()}})
+    if current:
+        col.update_one({"_id": f"{args.collection}@{current['version']}"}, {"$set": {"status": "retired"}})
+    print(f"{args.collection} now serves {args.version} "
+          f"(was {current['version'] if current else 'static settings'}); "
+          f"workers pick it up within {VERSION_TTL_SECONDS:.0f}s")
+
+
+def cmd_rollback(col, args):
+    pointer = col.find_one({"_id": f"active:{args.collection}"})
+    if not pointer or not pointer.get("previous"):
+        raise SystemExit(f"Nothing to roll back to for {args.collection}")
+    active, previous = pointer["active"], pointer["previous"]
+    result = col.update_one(
+        {"_id": pointer["_id"], "active.version": active["version"]},  # don't race another switch
+        {"$set": {"active": previous, "previous": active, "switched_at": _now()}},
+    )
+    if not result.modified_count:
+        raise SystemExit("The pointer changed while rolling back; check 'list' and retry")
+    col.update_one({"_id": f"{args.collection}@{previous['version']}"}, {"$set": {"status": "active"}})
+    col.update_one({"_id": f"{args.collection}@{active['version']}"}, {"$set": {"status": "retired"}})
+    print(f"{args.collection} rolled back to {previous['version']} (from {active['version']})")
+
+
+def cmd_list(col, args):
+    query = {"collection": args.collection} if args.collection else {}
+    for doc in col.find(query).sort("_id", 1):
+        if doc["kind"] == "pointer":
+            prev = (doc.get("previous") or {}).get("version")
+            print(f"{doc['collection']}: active={doc['active']['version']} previous={prev} since {doc['switched_at']}")
+        else:
+            val = doc.get("validation") or {}
+            recall = f" recall={val['recall']:.3f}" if "recall" in val else ""
+            print(f"  {doc['_id']:<28} {doc['status']:<10} {doc['embedding_path']} / {doc['index']}{recall}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Manage blue/green embedding versions per collection.")
+    ap.add_argument("--db", default="bylaws", help="Database of the chunk collections")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("init", help="Register the field currently in use as the active version")
+    p.add_argument("--collection", required=True)
+    p.add_argument("--version", default="v1")
+    p.set_defaults(func=cmd_init)
+
+    p = sub.add_parser("create", help="Register a new version (field) to re-embed into")
+    p.add_argument("--collection", required=True)
+    p.add_argument("--version", required=True)
+    p.add_argument("--field", required=True, help="Vector field for this version, e.g. chunk_embedding_v2")
+    p.add_argument("--index", default=None, help="Atlas index name (default vector_index_<version>)")
+    p.add_argument("--vector-format", choices=VECTOR_FORMATS, default="array", help="Storage format (vector_codec.py)")
+    p.set_defaults(func=cmd_create)
+
+    p = sub.add_parser("build-index", help="Create the version's vector index and wait until it is queryable")
+    p.add_argument("--collection", required=True)
+    p.add_argument("--version", required=True)
+    p.add_argument("--timeout", type=int, default=1800, help="Seconds to wait (default 1800)")
+    p.set_defaults(func=cmd_build_index)
+
+    p = sub.add_parser("validate", help="Check coverage and recall of a version on a query set")
+    p.add_argument("--collection", required=True)
+    p.add_argument("--version", required=True)
+    p.add_argument("--queries", required=True, help="Query set: .txt (one per line) or .jsonl with 'query'")
+    p.add_argument("--min-recall", type=float, default=0.9)
+    p.set_defaults(func=cmd_validate)
+
+    p = sub.add_parser("activate", help="Point the collection's searches at a version")
+    p.add_argument("--collection", required=True)
+    p.add_argument("--version", required=True)
+    p.add_argument("--force", action="store_true", help="Activate without a passing validation")
+    p.set_defaults(func=cmd_activate)
+
+    p = sub.add_parser("rollback", help="Switch back to the previously active version")
+    p.add_argument("--collection", required=True)
+    p.set_defaults(func=cmd_rollback)
+
+    p = sub.add_parser("list", help="Show versions and pointers")
+    p.add_argument("--collection", default=None)
+    p.set_defaults(func=cmd_list)
+
+    args = ap.parse_args()
+    mongo_client, error = get_mongo_client()
+    if not mongo_client:
+        raise RuntimeError(f"MongoDB client is not available: {error}")
+    args.func(_versions(mongo_client), args)
+
+
+if __name__ == "__main__":
+    main()
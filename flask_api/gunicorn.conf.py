@@ -0,0 +1,19 @@
+# file: gunicorn.conf.py
+# gunicorn settings for the Flask app (the Dockerfile CMD):
+#
+#   gunicorn --config gunicorn.conf.py app:app
+#
+# preload_app imports app.py once in the master, so in-process search indexes
+# (local_index.py / hnsw_index.py) are loaded before the fork and shared by all
+# workers. The gevent worker only monkey-patches after the fork, by which time
+# the preloaded app has already imported ssl, pymongo, googleapiclient and genai
+# and created its module-level locks with the unpatched modules. gunicorn reads
+# this file before it loads the app, so patch everything here, first.
+from gevent import monkey
+
+monkey.patch_all()
+
+bind = "0.0.0.0:8080"
+worker_class = "gevent"
+workers = 4
+preload_app = True
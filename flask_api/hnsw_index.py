@@ -0,0 +1,373 @@
+# file: hnsw_index.py
+# Persistent HNSW graph index per collection (optional: needs hnswlib).
+#
+# Brute-force scans (local_index.py) grow linearly with the number of chunks;
+# an HNSW graph answers in roughly log time. Each collection gets
+# HNSW_INDEX_DIR/<collection>/ with
+#
+#   index.bin      the hnswlib graph (cosine space, 384 dims)
+#   chunks.sqlite3 label -> chunk key (bylaw id, chunk index, content_sha256),
+#                  bylaw id and the projected chunk fields returned with hits
+#   meta.json      M / ef_construction / build time / next label / live count
+#
+# The ingest pipeline keeps it current: with --hnsw, every chunk it upserts is
+# added (a changed chunk replaces its old label) and every chunk it deletes is
+# tombstoned with mark_deleted, whose slot is reused by later adds. Nothing is
+# rebuilt. Sidecar rows are only committed by save(), right after the graph has
+# been written to a temp file and renamed into place, so index.bin and
+# chunks.sqlite3 always describe the same chunks: an ingest that dies between
+# checkpoints leaves the last saved pair (rerun it with --hnsw after
+# `hnsw_index.py build`, since Mongo already has the newer chunks).
+#
+# The web app opens indexes read-only. With gunicorn --preload they are loaded
+# once in the master before it forks, so all workers share the graph's pages.
+# get_hnsw_index() notices a newer index.bin (an ingest saved) and reloads it;
+# the reloaded copy is private to each worker, so restart gunicorn after a big
+# ingest to get the shared pages back.
+#
+#   python hnsw_index.py build --collection waterloo --M 16 --ef-construction 200
+#   python hnsw_index.py bench --collection waterloo --ef 16,32,64,128 --k 4
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:  # the HNSW backend is optional
+    hnswlib = None
+
+from result_fields import RESULT_FIELDS
+from vector_codec import decode_vector
+
+HNSW_INDEX_DIR = os.getenv(
+    "HNSW_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "hnsw_index"),
+)
+DIMENSIONS = 384
+
+
+def index_dir(collection_name: str, root: str = HNSW_INDEX_DIR) -> str:
+    return os.path.join(root, collection_name)
+
+
+def chunk_key(bylaw_id, index, sha) -> str:
+    return f"{bylaw_id}\x1f{index}\x1f{sha}"
+
+
+class HnswIndex:
+    def __init__(self, path: str, read_only: bool = False, M: int = 16, ef_construction: int = 200,
+                 initial_capacity: int = 10000):
+        if hnswlib is None:
+            raise RuntimeError("hnswlib is not installed (pip install hnswlib)")
+        self.path = path
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._saved = time.monotonic()
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {"M": M, "ef_construction": ef_construction, "dims": DIMENSIONS}
+
+        self.index = hnswlib.Index(space="cosine", dim=self.meta["dims"])
+        index_path = os.path.join(path, "index.bin")
+        if os.path.exists(index_path):
+            self.mtime = os.stat(index_path).st_mtime_ns
+            self.index.load_index(index_path, allow_replace_deleted=not read_only)
+        elif read_only:
+            raise FileNotFoundError(f"No HNSW index at {index_path}")
+        else:
+            self.mtime = None
+            self.index.init_index(max_elements=initial_capacity, M=self.meta["M"],
+                                  ef_construction=self.meta["ef_construction"], allow_replace_deleted=True)
+        if not read_only:
+            self._db().execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " label INTEGER PRIMARY KEY,"
+                " chunk_key TEXT NOT NULL UNIQUE,"
+                " bylaw_id TEXT,"
+                " doc TEXT NOT NULL)"
+            )
+            self._db().execute("CREATE INDEX IF NOT EXISTS chunks_bylaw ON chunks (bylaw_id)")
+            self._db().commit()
+        if "live" not in self.meta:  # saved before the live count was kept
+            self.meta["live"] = self.count()
+
+    def _db(self) -> sqlite3.Connection:
+        # connections don't survive a fork (gunicorn --preload), so one per process
+        if self._conn is None or self._conn_pid != os.getpid():
+            uri = f"file:{os.path.join(self.path, 'chunks.sqlite3')}" + ("?mode=ro" if self.read_only else "")
+            self._conn = sqlite3.connect(uri, uri=True, timeout=60, check_same_thread=False)
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    # ---- incremental updates (ingest side) ----
+    # Changes are visible to this process at once but only reach disk (and readers) with save().
+
+    def _tombstone(self, db: sqlite3.Connection, key: str) -> bool:
+        row = db.execute("SELECT label FROM chunks WHERE chunk_key = ?", (key,)).fetchone()
+        if not row:
+            return False
+        try:
+            self.index.mark_deleted(row[0])
+        except RuntimeError as e:  # label not in the graph, or already tombstoned
+            print(f"HNSW label {row[0]} could not be tombstoned: {e}")
+        db.execute("DELETE FROM chunks WHERE label = ?", (row[0],))
+        self.meta["live"] -= 1
+        return True
+
+    def upsert(self, keys: list[str], bylaw_ids: list, vectors, docs: list[dict]) -> None:
+        """Adds chunks; a key that is already indexed gets its old label tombstoned."""
+        if not keys:
+            return
+        with self._lock:
+            db = self._db()
+            for key in keys:
+                self._tombstone(db, key)
+            start = (db.execute("SELECT MAX(label) FROM chunks").fetchone()[0] or 0) + 1
+            start = max(start, self.meta.get("next_label", 0))
+            labels = np.arange(start, start + len(keys))
+            self.meta["next_label"] = int(labels[-1]) + 1
+
+            needed = self.index.get_current_count() + len(keys)
+            if needed > self.index.get_max_elements():
+                self.index.resize_index(max(needed, 2 * self.index.get_max_elements()))
+            self.index.add_items(np.asarray(vectors, dtype=np.float32), labels, replace_deleted=True)
+            db.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                [
+                    (int(label), key, str(bylaw_id),
+                     json.dumps({f: d[f] for f in RESULT_FIELDS if f in d}, ensure_ascii=False))
+                    for label, key, bylaw_id, d in zip(labels, keys, bylaw_ids, docs)
+                ],
+            )
+            self.meta["live"] += len(keys)
+
+    def delete(self, keys: list[str]) -> int:
+        """Tombstones chunks; their slots are reused by later adds."""
+        with self._lock:
+            db = self._db()
+            return sum(self._tombstone(db, key) for key in keys)
+
+    def save(self) -> None:
+        """Writes meta.json and the graph (temp file + rename), then commits the sidecar rows."""
+        with self._lock:
+            self.meta["saved_at"] = time.time()
+            tmp = os.path.join(self.path, "meta.json.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.meta, f)
+            os.replace(tmp, os.path.join(self.path, "meta.json"))
+            tmp = os.path.join(self.path, "index.bin.tmp")
+            self.index.save_index(tmp)
+            os.replace(tmp, os.path.join(self.path, "index.bin"))  # readers never see a partial file
+            self._db().commit()
+            self._saved = time.monotonic()
+
+    def checkpoint(self, interval: float = 60.0) -> None:
+        """save() if the last one was more than ``interval`` seconds ago (writing the graph isn't cheap)."""
+        if time.monotonic() - self._saved >= interval:
+            self.save()
+
+    # ---- queries ----
+
+    def search_labels(self, query_vector, k: int, ef: int = 64, bylaw_ids=None):
+        """``(labels, cosine scores)`` of the ``k`` nearest chunks."""
+        q = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        allowed = None
+        if bylaw_ids:
+            with self._lock:
+                rows = self._db().execute(
+                    f"SELECT label FROM chunks WHERE bylaw_id IN ({','.join('?' * len(bylaw_ids))})",
+                    [str(b) for b in bylaw_ids],
+                ).fetchall()
+            allowed = {r[0] for r in rows}
+            if not allowed:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        with self._lock:  # set_ef + query as one step
+            self.index.set_ef(max(ef, k))
+            k = min(k, self.meta["live"])  # get_current_count() includes tombstones
+            try:
+                if allowed is not None:
+                    labels, distances = self.index.knn_query(q, k=min(k, len(allowed)),
+                                                             filter=lambda label: label in allowed)
+                else:
+                    labels, distances = self.index.knn_query(q, k=k)
+            except RuntimeError as e:  # fewer than k reachable (tiny or heavily filtered index)
+                print(f"HNSW query returned fewer than {k} results: {e}")
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return labels[0], 1.0 - distances[0]  # cosine space returns 1 - cos
+
+    def search(self, query_vector, k: int, ef: int = 64, bylaw_ids=None, with_vectors: bool = False) -> list[dict]:
+        """
+        Hits shaped like the Mongo results, with the cosine mapped to vectorSearchScore's (1 + cos) / 2
+        (and the stored vector under "_vector" if ``with_vectors``).
+        """
+        labels, scores = self.search_labels(query_vector, k, ef, bylaw_ids)
+        if len(labels) == 0:
+            return []
+        with self._lock:
+            rows = dict(self._db().execute(
+                f"SELECT label, doc FROM chunks WHERE label IN ({','.join('?' * len(labels))})",
+                [int(l) for l in labels],
+            ).fetchall())
+        vectors = np.asarray(self.index.get_items(labels), dtype=np.float32) if with_vectors else None
+        results = []
+        for i, (label, cos) in enumerate(zip(labels, scores)):
+            if int(label) in rows:
+                doc = json.loads(rows[int(label)])
+                doc["score"] = (1.0 + float(cos)) / 2.0
+                if with_vectors:
+                    doc["_vector"] = vectors[i]
+                results.append(doc)
+        return results
+
+
+# Use "private" global variables: one read-only index per index directory per process
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_hnsw_index(collection_name: str, root: str = HNSW_INDEX_DIR):
+    """
+    Gets the collection's read-only HNSW index, loading it on the first call and again
+    whenever an ingest has saved a newer index.bin (None if unavailable).
+    """
+    path = index_dir(collection_name, root)
+    try:
+        mtime = os.stat(os.path.join(path, "index.bin")).st_mtime_ns
+    except OSError:
+        mtime = None
+    index = _indexes.get(path)
+    if index is None or index.mtime != mtime:
+        with _indexes_lock:
+            index = _indexes.get(path)
+            if index is None or index.mtime != mtime:
+                if hnswlib is None or mtime is None:
+                    return index
+                print(f"Process {os.getpid()}: {'reloading' if index else 'loading'} HNSW index {path}")
+                index = _indexes[path] = HnswIndex(path, read_only=True)
+    return index
+
+
+def preload_indexes(collection_names) -> None:
+    """Loads the read-only indexes up front (call before gunicorn forks its workers)."""
+    for name in collection_names:
+        get_hnsw_index(name)
+
+
+# ---- CLI ---------------------------------------------------
+
+def build_from_mongo(database_name: str, collection_name: str, M: int, ef_construction: int,
+                     root: str = HNSW_INDEX_DIR, batch: int = 1000) -> HnswIndex:
+    import query_database
+    from clients import get_mongo_client
+
+    mongo_client, error = get_mongo_client()
+    if not mongo_client:
+        raise RuntimeError(f"MongoDB client is not available: {error}")
+    settings = query_database.get_search_settings(collection_name)
+    field, id_field, index_field = settings["embedding_path"], settings["id_field"], settings["index_field"]
+
+    path = index_dir(collection_name, root)
+    for name in ("index.bin", "chunks.sqlite3", "meta.json"):
+        if os.path.exists(os.path.join(path, name)):
+            os.remove(os.path.join(path, name))
+    collection = mongo_client[database_name][collection_name]
+    total = collection.count_documents({field: {"$exists": True, "$ne": None}})
+    index = HnswIndex(path, M=M, ef_construction=ef_construction, initial_capacity=max(total, 1000))
+
+    start = time.perf_counter()
+    projection = {field: 1, id_field: 1, index_field: 1, "content_sha256": 1, **{f: 1 for f in RESULT_FIELDS}}
+    keys, bylaw_ids, vectors, docs = [], [], [], []
+    for doc in collection.find({field: {"$exists": True, "$ne": None}}, projection).batch_size(batch):
+        keys.append(chunk_key(doc.get(id_field), doc.get(index_field), doc.get("content_sha256") or str(doc["_id"])))
+        bylaw_ids.append(doc.get(id_field))
+        vectors.append(decode_vector(doc[field]))
+        docs.append(doc)
+        if len(keys) >= batch:
+            index.upsert(keys, bylaw_ids, vectors, docs)
+            keys, bylaw_ids, vectors, docs = [], [], [], []
+    index.upsert(keys, bylaw_ids, vectors, docs)
+    index.meta["build_seconds"] = time.perf_counter() - start
+    index.save()
+    print(f"Built HNSW index for {collection_name}: {index.count()} chunks in {index.meta['build_seconds']:.1f}s "
+          f"(M={M}, ef_construction={ef_construction}) -> {path}")
+    return index
+
+
+def bench(index: HnswIndex, query_vectors: np.ndarray, efs: list[int], k: int = 4) -> list[dict]:
+    """Recall@k against exact search over the indexed vectors, and latency, per ef."""
+    with index._lock:  # live (not tombstoned) labels
+        labels = np.asarray([l for (l,) in index._db().execute("SELECT label FROM chunks").fetchall()])
+    matrix = np.asarray(index.index.get_items(labels), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+    q = query_vectors / np.linalg.norm(query_vectors, axis=1, keepdims=True).clip(min=1e-12)
+    truth = labels[np.argsort(-(q @ matrix.T), axis=1)[:, :k]]
+
+    rows = []
+    for ef in efs:
+        recalls, latencies = [], []
+        for qi, qv in enumerate(q):
+            start = time.perf_counter()
+            found, _ = index.search_labels(qv, k, ef=ef)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(set(truth[qi].tolist()) & set(found.tolist())) / k)
+        row = {"ef": ef, "recall": float(np.mean(recalls)),
+               "p50_ms": float(np.percentile(latencies, 50)), "p95_ms": float(np.percentile(latencies, 95))}
+        rows.append(row)
+        print(f"  ef={ef:<4} recall@{k}={row['recall']:.3f} p50={row['p50_ms']:.2f}ms p95={row['p95_ms']:.2f}ms")
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build and benchmark the persistent HNSW index.")
+    ap.add_argument("--root", default=HNSW_INDEX_DIR)
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    b = sub.add_parser("build", help="(Re)build a collection's index from Mongo")
+    b.add_argument("--db", default="bylaws")
+    b.add_argument("--collection", required=True)
+    b.add_argument("--M", type=int, default=16, help="Graph degree (default 16)")
+    b.add_argument("--ef-construction", type=int, default=200, help="Build-time beam width (default 200)")
+
+    r = sub.add_parser("bench", help="Recall@k and latency for a list of query-time ef values")
+    r.add_argument("--collection", required=True)
+    r.add_argument("--queries", default=None, help="Query set (.txt/.jsonl); default: 200 indexed vectors")
+    r.add_argument("--ef", default="16,32,64,128", help="Comma list of ef values")
+    r.add_argument("--k", type=int, default=4)
+    args = ap.parse_args()
+
+    if args.command == "build":
+        build_from_mongo(args.db, args.collection, args.M, args.ef_construction, args.root)
+        return
+
+    index = HnswIndex(index_dir(args.collection, args.root), read_only=True)
+    print(f"{args.collection}: {index.count()} chunks, M={index.meta['M']}, "
+          f"ef_construction={index.meta['ef_construction']}, build {index.meta.get('build_seconds', 0):.1f}s")
+    if args.queries:
+        import benchmark_retrieval
+
+        query_vectors = benchmark_retrieval.embed_queries(benchmark_retrieval.load_queries(args.queries))
+    else:
+        with index._lock:
+            labels = [l for (l,) in index._db().execute("SELECT label FROM chunks ORDER BY RANDOM() LIMIT 200")]
+        query_vectors = np.asarray(index.index.get_items(labels), dtype=np.float32)
+    bench(index, query_vectors, [int(e) for e in args.ef.split(",") if e.strip()], args.k)
+
+
+if __name__ == "__main__":
+    main()
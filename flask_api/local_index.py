@@ -0,0 +1,299 @@
+# file: local_index.py
+# In-RAM retrieval backend: a compact quantized index per collection.
+#
+# Each collection is exported once into LOCAL_INDEX_DIR/<collection>/:
+#
+#   vectors.f32   float32 unit vectors (N x 384), memory-mapped and only read
+#                 for the few hundred candidates being rescored
+#   bits.npy      sign bits packed 8 per byte (48 bytes/chunk, 32x smaller)
+#   codes.npy     int8 codes with vector_codec's fixed scale (384 bytes/chunk, 4x)
+#   ids.npy, groups.npy, positions.npy, docs.jsonl, doc_offsets.npy
+#                 Mongo _id, bylaw id (as a group number), chunk index and the
+#                 projected chunk fields, read back only for the hits
+#
+# A search scans the bits (xor + popcount, i.e. Hamming distance) or the int8
+# codes (integer dot product) to pick `candidates` rows, then rescores those
+# exactly against the float vectors. Only the array of the collection's
+# local_prefilter mode is read into each worker; the other one and the float
+# file are memory-mapped and shared through the page cache.
+#
+#   python local_index.py build --collection waterloo
+#   python local_index.py check --collection waterloo --mode bits --candidates 200 --k 4
+#
+# query_database uses it when a collection's "backend" setting is "local".
+import argparse
+import json
+import mmap
+import os
+import threading
+import time
+
+import numpy as np
+
+from result_fields import RESULT_FIELDS
+from vector_codec import INT8_CLIP, INT8_SCALE, decode_vector
+
+LOCAL_INDEX_DIR = os.getenv(
+    "LOCAL_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_index"),
+)
+_SCAN_BLOCK = 16384  # rows per int8 block (bounds the float32 temporary)
+
+
+def index_dir(collection_name: str, root: str = LOCAL_INDEX_DIR) -> str:
+    return os.path.join(root, collection_name)
+
+
+def pack_bits(matrix: np.ndarray) -> np.ndarray:
+    return np.packbits(matrix > 0, axis=-1)
+
+
+def quantize(matrix: np.ndarray) -> np.ndarray:
+    """vector_codec.quantize_int8, vectorized."""
+    return np.rint(np.clip(matrix, -INT8_CLIP, INT8_CLIP) * INT8_SCALE).astype(np.int8)
+
+
+def build_local_index(database_name: str, collection_name: str, root: str = LOCAL_INDEX_DIR) -> str:
+    """Exports a collection's vectors and chunk fields from Mongo into a local index directory."""
+    import query_database
+    from clients import get_mongo_client
+
+    mongo_client, error = get_mongo_client()
+    if not mongo_client:
+        raise RuntimeError(f"MongoDB client is not available: {error}")
+    settings = query_database.get_search_settings(collection_name)
+    field, id_field, index_field = settings["embedding_path"], settings["id_field"], settings["index_field"]
+    out = index_dir(collection_name, root)
+    os.makedirs(out, exist_ok=True)
+
+    ids, groups, positions, offsets, vectors = [], [], [], [], []
+    group_of = {}
+    projection = {field: 1, **{f: 1 for f in RESULT_FIELDS}}
+    cursor = mongo_client[database_name][collection_name].find(
+        {field: {"$exists": True, "$ne": None}}, projection).batch_size(1000)
+    with open(os.path.join(out, "docs.jsonl"), "wb") as docs:
+        for doc in cursor:
+            ids.append(str(doc["_id"]))
+            groups.append(group_of.setdefault(doc.get(id_field), len(group_of)))
+            positions.append(doc.get(index_field, -1))
+            vectors.append(decode_vector(doc[field]))
+            offsets.append(docs.tell())
+            row = {f: doc[f] for f in RESULT_FIELDS if f in doc}
+            docs.write(json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n")
+    if not vectors:
+        raise RuntimeError(f"No vectors in {database_name}.{collection_name}.{field}")
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+    matrix.tofile(os.path.join(out, "vectors.f32"))
+    np.save(os.path.join(out, "bits.npy"), pack_bits(matrix))
+    np.save(os.path.join(out, "codes.npy"), quantize(matrix))
+    np.save(os.path.join(out, "ids.npy"), np.asarray(ids))
+    np.save(os.path.join(out, "groups.npy"), np.asarray(groups, dtype=np.int32))
+    np.save(os.path.join(out, "positions.npy"), np.asarray(positions, dtype=np.int32))
+    np.save(os.path.join(out, "doc_offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(out, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"collection": collection_name, "embedding_path": field, "id_field": id_field, "index_field": index_field,
+                   "count": len(ids), "dims": int(matrix.shape[1]),
+                   "groups": {str(k): v for k, v in group_of.items()}, "built_at": time.time()}, f)
+    print(f"Built local index for {collection_name}: {len(ids)} chunks, {len(group_of)} bylaws -> {out}")
+    return out
+
+
+class LocalIndex:
+    def __init__(self, path: str, prefilter: str = "bits"):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        n, d = self.meta["count"], self.meta["dims"]
+        self.vectors = np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r", shape=(n, d))
+        # the scanned array is resident; the other is only mapped, in case a caller asks for that mode
+        self.bits = np.load(os.path.join(path, "bits.npy"), mmap_mode=None if prefilter == "bits" else "r")
+        self.codes = np.load(os.path.join(path, "codes.npy"), mmap_mode=None if prefilter == "int8" else "r")
+        self.ids = np.load(os.path.join(path, "ids.npy"))
+        self.groups = np.load(os.path.join(path, "groups.npy"))
+        self.doc_offsets = np.load(os.path.join(path, "doc_offsets.npy"))
+        positions_path = os.path.join(path, "positions.npy")
+        self.positions = np.load(positions_path) if os.path.exists(positions_path) else None
+        self.group_of = self.meta["groups"]
+        # mapped rather than read through a file handle: a shared seek offset isn't safe across
+        # threads, nor across gunicorn workers forked from a preloaded parent
+        with open(os.path.join(path, "docs.jsonl"), "rb") as f:
+            self._docs = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self.meta["count"]
+
+    def resident_bytes(self) -> dict:
+        sizes = {}
+        for name, array in (("bits", self.bits), ("int8", self.codes), ("float32", self.vectors)):
+            sizes[name + (" (mmap)" if isinstance(array, np.memmap) else "")] = array.nbytes
+        return sizes
+
+    # ---- scans ----
+
+    def _hamming(self, q: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(np.bitwise_xor(self.bits, pack_bits(q))).sum(axis=1, dtype=np.int32)
+
+    def _int8_scores(self, q: np.ndarray) -> np.ndarray:
+        qc = quantize(q).astype(np.float32)
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), _SCAN_BLOCK):
+            block = self.codes[start:start + _SCAN_BLOCK]
+            scores[start:start + len(block)] = block.astype(np.float32) @ qc
+        return scores / (INT8_SCALE * INT8_SCALE)
+
+    def _mask(self, bylaw_ids) -> np.ndarray:
+        wanted = [self.group_of[str(b)] for b in bylaw_ids if str(b) in self.group_of]
+        return np.isin(self.groups, wanted)
+
+    def candidates(self, q: np.ndarray, n: int, mode: str = "bits", bylaw_ids=None) -> np.ndarray:
+        """Row numbers of the ``n`` best rows by the quantized scan."""
+        if mode == "bits":
+            cost = self._hamming(q).astype(np.float32)
+        elif mode == "int8":
+            cost = -self._int8_scores(q)
+        elif mode == "exact":
+            cost = -(self.vectors @ q)
+        else:
+            raise ValueError(f"Unknown scan mode {mode!r}")
+        if bylaw_ids:
+            cost[~self._mask(bylaw_ids)] = np.inf
+        n = min(n, len(cost))
+        rows = np.argpartition(cost, n - 1)[:n]
+        return rows[np.isfinite(cost[rows])]
+
+    def search_rows(self, query_vector, k: int, candidates: int = 200, mode: str = "bits", bylaw_ids=None):
+        """``(rows, cosine scores)`` of the top ``k`` after exact rescoring of the candidates."""
+        q = np.array(query_vector, dtype=np.float32)
+        q /= max(float(np.linalg.norm(q)), 1e-12)
+        rows = self.candidates(q, max(candidates, k), mode, bylaw_ids)
+        rows.sort()  # sequential reads from the memmap
+        scores = self.vectors[rows] @ q
+        top = np.argsort(-scores)[:k]
+        return rows[top], scores[top]
+
+    def find(self, query: dict):
+        """
+        Chunk documents matching a ranking.neighbour_query filter (bylaw id + chunk
+        index range per clause), answered from the local arrays; None if this index predates
+        positions.npy.
+        """
+        if self.positions is None:
+            return None
+        id_field, index_field = self.meta["id_field"], self.meta.get("index_field")
+        docs = []
+        for clause in query['$or']:
+            group = self.group_of.get(str(clause[id_field]))
+            if group is None:
+                continue
+            bounds = clause[index_field]
+            rows = np.flatnonzero((self.groups == group)
+                                  & (self.positions >= bounds['$gte']) & (self.positions <= bounds['$lte']))
+            docs.extend(self.doc(row) for row in rows)
+        return docs
+
+    def doc(self, row: int) -> dict:
+        start = int(self.doc_offsets[row])
+        return json.loads(self._docs[start:self._docs.find(b"\n", start)])
+
+    def search(self, query_vector, k: int, candidates: int = 200, mode: str = "bits", bylaw_ids=None,
+               with_vectors: bool = False) -> list[dict]:
+        """
+        Hits shaped like the Mongo results, with the cosine mapped to vectorSearchScore's (1 + cos) / 2
+        (and the unit vector under "_vector" if ``with_vectors``).
+        """
+        rows, scores = self.search_rows(query_vector, k, candidates, mode, bylaw_ids)
+        results = []
+        for row, cos in zip(rows, scores):
+            doc = self.doc(row)
+            doc["score"] = (1.0 + float(cos)) / 2.0
+            if with_vectors:
+                doc["_vector"] = np.asarray(self.vectors[row])
+            results.append(doc)
+        return results
+
+
+# Use "private" global variables: one loaded index per collection per process
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_local_index(collection_name: str, root: str = LOCAL_INDEX_DIR, prefilter: str = "bits"):
+    """
+    Gets the collection's local index, loading it (with the ``prefilter`` array resident) on the
+    first call; None if it was never built.
+    """
+    index = _indexes.get(collection_name)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(collection_name)
+            if index is None:
+                path = index_dir(collection_name, root)
+                if not os.path.exists(os.path.join(path, "meta.json")):
+                    return None
+                print(f"Process {os.getpid()}: loading local index {path}")
+                index = _indexes[collection_name] = LocalIndex(path, prefilter)
+    return index
+
+
+def recall_check(index: LocalIndex, query_vectors: np.ndarray, k: int = 4, candidates: int = 200,
+                 mode: str = "bits") -> dict:
+    """Recall@k of the quantized scan + rescoring against exact search, and the scan latency."""
+    recalls, exact_ms, fast_ms = [], [], []
+    for q in query_vectors:
+        start = time.perf_counter()
+        truth, _ = index.search_rows(q, k, candidates=k, mode="exact")
+        exact_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        found, _ = index.search_rows(q, k, candidates=candidates, mode=mode)
+        fast_ms.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(set(truth.tolist()) & set(found.tolist())) / max(1, len(truth)))
+    return {
+        "recall": float(np.mean(recalls)),
+        "exact_p50_ms": float(np.percentile(exact_ms, 50)),
+        "p50_ms": float(np.percentile(fast_ms, 50)),
+        "p95_ms": float(np.percentile(fast_ms, 95)),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build and check the quantized local vector index.")
+    ap.add_argument("--root", default=LOCAL_INDEX_DIR)
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    b = sub.add_parser("build", help="Export a collection from Mongo into a local index")
+    b.add_argument("--db", default="bylaws")
+    b.add_argument("--collection", required=True)
+
+    c = sub.add_parser("check", help="Recall@k and latency of the quantized scan vs exact search")
+    c.add_argument("--collection", required=True)
+    c.add_argument("--queries", default=None,
+                   help="Query set (.txt/.jsonl); default: 200 stored chunk vectors as queries")
+    c.add_argument("--mode", choices=["bits", "int8"], default="bits")
+    c.add_argument("--candidates", type=int, default=200)
+    c.add_argument("--k", type=int, default=4)
+    args = ap.parse_args()
+
+    if args.command == "build":
+        build_local_index(args.db, args.collection, args.root)
+        return
+
+    index = LocalIndex(index_dir(args.collection, args.root), prefilter=args.mode)
+    if args.queries:
+        import benchmark_retrieval
+
+        query_vectors = benchmark_retrieval.embed_queries(benchmark_retrieval.load_queries(args.queries))
+    else:
+        rng = np.random.default_rng(0)
+        rows = np.sort(rng.choice(len(index), size=min(200, len(index)), replace=False))
+        query_vectors = np.asarray(index.vectors[rows])
+    sizes = ", ".join(f"{k}={v / len(index):.0f} B/chunk" for k, v in index.resident_bytes().items())
+    r = recall_check(index, query_vectors, args.k, args.candidates, args.mode)
+    print(f"{args.collection}: {len(index)} chunks ({sizes})")
+    print(f"{args.mode} scan + rescoring of {args.candidates}: recall@{args.k}={r['recall']:.3f} "
+          f"p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms (exact scan p50={r['exact_p50_ms']:.2f}ms)")
+
+
+if __name__ == "__main__":
+    main()
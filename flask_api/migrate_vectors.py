@@ -0,0 +1,142 @@
+# file: migrate_vectors.py
+# Converts stored chunk vectors between formats (vector_codec.py) and compares them.
+#
+#   # write packed float32 copies of Waterloo's vectors next to the arrays
+#   python migrate_vectors.py migrate --collection waterloo --field chunk_embedding \
+#       --to float32 --target-field chunk_embedding_f32
+#   # then switch over with embedding_versions.py (create --vector-format float32,
+#   # build-index, validate, activate) so search never sees a half-migrated field
+#
+#   # storage size of each format on a sample, and query latency per field/index
+#   python migrate_vectors.py compare --collection waterloo --field chunk_embedding \
+#       --queries queries.txt --against chunk_embedding_f32:vector_index_f32:float32
+#
+# Converting in place (no --target-field) is possible too, but the field's Atlas
+# index and the query format have to change at the same moment, so prefer a new field.
+import argparse
+import time
+
+import bson
+import numpy as np
+import pymongo
+from tqdm import tqdm
+
+import query_database
+from clients import get_mongo_client
+from vector_codec import VECTOR_FORMATS, decode_vector, encode_vector, vector_format_of
+
+
+def migrate(collection, field: str, to: str, target_field: str = None, batch: int = 500) -> int:
+    """Re-encodes ``field`` as ``to`` into ``target_field`` (default: in place). Resumable: converted docs are skipped."""
+    target_field = target_field or field
+    query = {field: {"$exists": True, "$ne": None}}
+    if target_field != field:
+        query[target_field] = {"$exists": False}
+    total = collection.count_documents(query)
+    cursor = collection.find(query, {field: 1}).batch_size(batch)
+
+    converted, ops = 0, []
+    for doc in tqdm(cursor, total=total, desc=f"{field} -> {target_field} ({to})"):
+        value = doc[field]
+        if target_field == field and vector_format_of(value) == to:
+            continue
+        ops.append(pymongo.UpdateOne({"_id": doc["_id"]}, {"$set": {target_field: encode_vector(decode_vector(value), to)}}))
+        if len(ops) >= batch:
+            collection.bulk_write(ops, ordered=False)
+            converted += len(ops)
+            ops = []
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+        converted += len(ops)
+    print(f"Converted {converted} vectors to {to} in {collection.name}.{target_field}")
+    return converted
+
+
+def compare_sizes(collection, field: str, sample: int = 500) -> dict:
+    """Average BSON bytes of one vector field per format, measured on a random sample."""
+    sizes = {fmt: [] for fmt in VECTOR_FORMATS}
+    errors = {"float32": [], "int8": []}
+    for doc in collection.aggregate([{"$match": {field: {"$exists": True}}}, {"$sample": {"size": sample}},
+                                     {"$project": {field: 1}}]):
+        vec = decode_vector(doc[field])
+        ref = np.asarray(vec, dtype=np.float32)
+        for fmt in VECTOR_FORMATS:
+            encoded = encode_vector(vec, fmt)
+            sizes[fmt].append(len(bson.encode({field: encoded})))
+            if fmt in errors:
+                back = np.asarray(decode_vector(encoded), dtype=np.float32)
+                cos = float(ref @ back) / max(float(np.linalg.norm(ref) * np.linalg.norm(back)), 1e-12)
+                errors[fmt].append(1.0 - cos)
+    return {
+        fmt: {
+            "bytes": float(np.mean(v)) if v else 0.0,
+            "cosine_error": float(np.mean(errors[fmt])) if errors.get(fmt) else 0.0,
+        }
+        for fmt, v in sizes.items()
+    }
+
+
+def time_queries(collection, settings: dict, query_vectors, repeats: int = 3) -> dict:
+    latencies = []
+    for qv in query_vectors:
+        stage = query_database.build_vector_search_stage(qv.tolist(), settings)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            list(collection.aggregate([stage, {"$project": {"_id": 1}}]))
+            latencies.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": float(np.percentile(latencies, 50)), "p95_ms": float(np.percentile(latencies, 95))}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Convert stored vectors between array/float32/int8 and compare them.")
+    ap.add_argument("--db", default="bylaws")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    mg = sub.add_parser("migrate", help="Re-encode a vector field")
+    mg.add_argument("--collection", required=True)
+    mg.add_argument("--field", required=True)
+    mg.add_argument("--to", choices=VECTOR_FORMATS, required=True)
+    mg.add_argument("--target-field", default=None, help="Write here instead of converting in place")
+    mg.add_argument("--batch", type=int, default=500)
+
+    cp = sub.add_parser("compare", help="Storage size per format, and query latency per field/index")
+    cp.add_argument("--collection", required=True)
+    cp.add_argument("--field", required=True)
+    cp.add_argument("--sample", type=int, default=500, help="Documents to measure sizes on (default 500)")
+    cp.add_argument("--queries", default=None, help="Query set for latency (.txt or .jsonl)")
+    cp.add_argument("--against", action="append", default=[],
+                    help="field:index:format to time against the current settings (repeatable)")
+    cp.add_argument("--repeats", type=int, default=3)
+    args = ap.parse_args()
+
+    mongo_client, error = get_mongo_client()
+    if not mongo_client:
+        raise RuntimeError(f"MongoDB client is not available: {error}")
+    collection = mongo_client[args.db][args.collection]
+
+    if args.command == "migrate":
+        migrate(collection, args.field, args.to, args.target_field, args.batch)
+        return
+
+    sizes = compare_sizes(collection, args.field, args.sample)
+    base = sizes["array"]["bytes"] or 1.0
+    for fmt, row in sizes.items():
+        print(f"{fmt:<8} {row['bytes']:>7.0f} bytes/vector ({row['bytes'] / base:.0%} of array), "
+              f"mean cosine error {row['cosine_error']:.2e}")
+
+    if args.queries:
+        import benchmark_retrieval
+
+        query_vectors = benchmark_retrieval.embed_queries(benchmark_retrieval.load_queries(args.queries))
+        settings = query_database.get_search_settings(args.collection)
+        runs = [("current", settings)]
+        for spec in args.against:
+            field, index, fmt = spec.split(":")
+            runs.append((spec, {**settings, "embedding_path": field, "index": index, "vector_format": fmt}))
+        for name, s in runs:
+            r = time_queries(collection, s, query_vectors, args.repeats)
+            print(f"{name}: {s['embedding_path']} ({s['vector_format']}) p50={r['p50_ms']:.1f}ms p95={r['p95_ms']:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,12 @@ from google.genai import types
 from clients import gemini_client
 from datetime import datetime
 
-def generate(user_input: str, bylaws_data: str, city: str = None, context: str = None):
+GEMINI_MODEL = "gemini-2.5-flash-lite"
+
+
+def build_request(user_input: str, bylaws_data: str, city: str = None, context: str = None,
+                  max_output_tokens: int = 512):
+    """(contents, config) of the Gemini call; shared by generate and generate_async."""
     now = datetime.now()
     easy_str = now.strftime("%B %d, %Y")   # e.g. "September 29, 2025"
 
@@ -42,7 +47,8 @@ Instructions:
 5. If you cannot answer at all from the given data, clearly state what information you do have and explain that the question cannot be fully answered.
 6. Some bylaw text may be **cut off at the start or end**. When responding, reconstruct cutoff words into full words so the answer reads naturally and is easy for the user to understand.
 7. Always prefer clarity and accuracy over speculation.
-8. If bylaw text contains fees with multiple effective dates, always select the fee that is in effect as of {easy_str} and ignore older dates. Do not list past amounts unless the user explicitly asks for historical values.
+8. Some bylaw sections start with a bracketed label such as [Article 2 > § 545-5 Licence required]. When you rely on one, name that section (e.g. "§ 545-5") in your answer.
+9. If bylaw text contains fees with multiple effective dates, always select the fee that is in effect as of {easy_str} and ignore older dates. Do not list past amounts unless the user explicitly asks for historical values.
 """
     print("PROMPT: ", prompt)
     contents = [
@@ -59,13 +65,39 @@ Instructions:
         temperature=0.5,
         top_p=0.95,
         top_k=40,
-        max_output_tokens=512,
+        max_output_tokens=max_output_tokens,
     )
+    return contents, generate_content_config
+
+
+def generate(user_input: str, bylaws_data: str, city: str = None, context: str = None, max_output_tokens: int = 512):
+    contents, generate_content_config = build_request(user_input, bylaws_data, city, context, max_output_tokens)
 
     output = ""
     try:
         for chunk in gemini_client.models.generate_content_stream(
-            model="gemini-2.5-flash-lite",
+            model=GEMINI_MODEL,
+            contents=contents,
+            config=generate_content_config,
+        ):
+            if hasattr(chunk, "text") and chunk.text:
+                output += chunk.text
+    except Exception as e:
+        # Fail gracefully so your API never crashes
+        return f"Error contacting Gemini: {e}"
+
+    return output if output else "No response generated."
+
+
+async def generate_async(user_input: str, bylaws_data: str, city: str = None, context: str = None,
+                         max_output_tokens: int = 512):
+    """generate() on the async client (gemini_client.aio), for the ASGI app."""
+    contents, generate_content_config = build_request(user_input, bylaws_data, city, context, max_output_tokens)
+
+    output = ""
+    try:
+        async for chunk in await gemini_client.aio.models.generate_content_stream(
+            model=GEMINI_MODEL,
             contents=contents,
             config=generate_content_config,
         ):
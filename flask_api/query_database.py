@@ -1,76 +1,394 @@
+import asyncio
 import embed_vectors
+import embedding_versions
+import functools
+import hnsw_index
+import json
+import local_index
+import os
 import pymongo
-from clients import get_mongo_client
+import query_router
+from clients import get_async_mongo_client, get_mongo_client, mark_mongo_down, mongo_outage_started
+from ranking import assemble_results, boost_related, named_hits_ok, neighbour_query, postprocess_results, rank_results
+from result_fields import RESULT_FIELDS
+from vector_codec import encode_vector
+
+# ---- Per-collection $vectorSearch settings ----
+# numCandidates/limit used to be hard-coded for every city. They now live here
+# per collection and can be overridden without a code change by a JSON file
+# (SEARCH_SETTINGS_FILE, default search_settings.json next to this file) of the form
+#   {"waterloo": {"num_candidates": 120, "limit": 4}, ...}
+# benchmark_retrieval.py --write-settings produces that file from measured recall.
+# Which vector field/index a collection searches comes from its active embedding
+# version (embedding_versions.py) when it has one, so a re-embed can be switched
+# over (and back) at runtime without editing this file.
+DEFAULT_SEARCH_SETTINGS = {
+    "index": "vector_index",
+    "embedding_path": "chunk_embedding",
+    "vector_format": "array", # how the vectors are stored (vector_codec.py); the query vector is sent the same way
+    "num_candidates": 200,
+    "limit": 4,
+    # Adaptive depth: fetch up to max_k chunks, then cut the list where the scores
+    # fall off. A result set whose best score is under min_score is "low confidence".
+    "adaptive": True,
+    "min_k": 1,
+    "max_k": 6,
+    "min_score": 0.70, # absolute vectorSearchScore floor (cosine score = (1 + cos) / 2)
+    "min_relative_score": 0.90, # keep chunks scoring at least this fraction of the best one
+    "max_relative_gap": 0.04, # stop at the first drop between neighbours larger than this fraction of the best score
+    # Two-stage search: pick the top_bylaws bylaws from the <collection>_bylaws summary
+    # vectors (bylaw_summaries.py), then search only their chunks. Needs id_field as a
+    # filter field in the chunk index (vector_index.py).
+    "id_field": "bylaw_id",
+    "index_field": "chunk_index", # position of a chunk within its bylaw
+    "two_stage": False,
+    "top_bylaws": 5,
+    "bylaw_num_candidates": 50,
+    "summary_collection": None, # default <collection>_bylaws
+    "summary_index": "vector_index",
+    "summary_embedding_path": "summary_embedding",
+    # "mongo" runs $vectorSearch; "local" searches the quantized in-process index built by
+    # local_index.py (scan local_prefilter codes for local_candidates rows, rescore exactly);
+    # "hnsw" searches the persistent graph index of hnsw_index.py with beam width hnsw_ef
+    "backend": "mongo",
+    "local_prefilter": "bits",
+    "local_candidates": 200,
+    "hnsw_ef": 64,
+    # Merge hits that are neighbouring/overlapping chunks of the same bylaw into one passage
+    "merge_adjacent": True,
+    # Maximal marginal relevance: fetch mmr_candidates hits (with their vectors) and pick
+    # the k that balance relevance to the query (weight mmr_lambda) against redundancy
+    "mmr": False,
+    "mmr_lambda": 0.7,
+    "mmr_candidates": 20,
+    # Neighbour expansion: add the expand_neighbors chunks before and after every hit
+    # (one batched query for all hits) and stitch them into one passage; 0 = off
+    "expand_neighbors": 0,
+    # Local index searched while MongoDB is down ("local", "hnsw" or None); only used if
+    # it has been built (local_index.py / hnsw_index.py). A "local"/"hnsw" backend is its own failover
+    "failover_backend": "local",
+    # Pre-filter the search to the bylaws a query names ("Chapter 591"; the whole collection is
+    # searched only if that finds nothing above min_score), and rank the chunks of bylaws whose
+    # titles share a word with it as if they scored related_boost higher (query_router.py; a
+    # no-op until query_routes.json is built)
+    "route_queries": True,
+    "related_boost": 0.02,
+}
+
+COLLECTION_SEARCH_SETTINGS = {
+    # Toronto was re-embedded with the CPU MiniLM model into a separate field
+    # (the fallback when the collection has no embedding version pointer)
+    "bylaw_chunks": {"embedding_path": "chunk_embedding_cpu", "id_field": "original_bylaw_id",
+                     "index_field": "chunk_sequence"},
+    "waterloo": {},
+    "guelph": {},
+}
+
+SEARCH_SETTINGS_FILE = os.getenv(
+    "SEARCH_SETTINGS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_settings.json"),
+)
+
+
+# Fields returned for every chunk (vector search hits and their neighbours)
+RESULT_PROJECTION = {'_id': 0, **{f: 1 for f in RESULT_FIELDS}} # Exclude MongoDB default ID
+
+
+def load_settings_overrides(path: str = SEARCH_SETTINGS_FILE) -> dict:
+    """Reads per-collection overrides from the settings file, if there is one."""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+        print(f"Loaded search settings overrides from {path}")
+        return overrides
+    except Exception as e:
+        print(f"⚠️ Could not read search settings from {path}: {e}")
+        return {}
+
+
+_settings_overrides = load_settings_overrides()
 
-def query_database(query_text: str, database_name: str, collection_name: str):
-    mongo_client, error = get_mongo_client() # <-- Get the client here
-    if not mongo_client:
-        print("Error: MongoDB client is not available.")
-        return [], error
-    
-    # This will now use the lazy-loading version of the model
-    print("EMBEDDING")
-    query_vector = embed_vectors.embed_text(query_text)
-    print("DONE EMBEDDING AAH")
-    if not query_vector:
-        print("Error: Could not generate query vector.")
-        return [], error
 
-    vector_index_name = "vector_index"
-    if collection_name == "bylaw_chunks":
-        embedding_path = "chunk_embedding_cpu"
-    else:
-        embedding_path = "chunk_embedding"
-    # ---- Define pipeline for the NEW collection ----
-    # Vector index name (ensure it matches the one created)
-    vector_index_name = "vector_index" # Or whatever name is used in vector_index.py
-    # Field containing embeddings
-    #embedding_path = "chunk_embedding_cpu" # Or "chunk_embedding" if you changed it
+def get_search_settings(collection_name: str, include_version: bool = True) -> dict:
+    """Returns the merged search settings (defaults < code < settings file < active embedding version) for a collection."""
+    settings = dict(DEFAULT_SEARCH_SETTINGS)
+    settings.update(COLLECTION_SEARCH_SETTINGS.get(collection_name, {}))
+    settings.update(_settings_overrides.get(collection_name, {}))
+    if include_version:
+        settings.update(embedding_versions.active_overrides(collection_name))
+    return settings
 
+
+def summary_collection_name(collection_name: str, settings: dict) -> str:
+    return settings["summary_collection"] or f"{collection_name}_bylaws"
+
+
+def build_vector_search_stage(query_vector, settings: dict, limit: int = None, num_candidates: int = None,
+                              filter: dict = None) -> dict:
+    """Builds the $vectorSearch stage for a collection's settings (optionally overriding limit/candidates)."""
+    stage = {
+        'index': settings["index"],
+        'path': settings["embedding_path"],
+        'queryVector': encode_vector(query_vector, settings["vector_format"]),
+        'numCandidates': num_candidates or settings["num_candidates"],
+        'limit': limit or settings["limit"], # number of chunks to return
+    }
+    if filter:
+        stage['filter'] = filter # pre-filter; the fields must be "filter" fields of the index
+    return {'$vectorSearch': stage}
+
+
+def preload_indexes(collection_names) -> None:
+    """
+    Loads the in-process indexes of collections (their "local"/"hnsw" backend or failover index).
+    Called when app.py is imported, so with gunicorn --preload every worker shares them.
+    """
+    for name in collection_names:
+        # static settings only: reading the version pointer would open a MongoClient before the fork
+        failover_index(name, get_search_settings(name, include_version=False))
+
+
+def failover_index(collection_name: str, settings: dict = None):
+    """
+    (backend, index) of the collection's in-process index: its "local"/"hnsw" backend, else
+    its failover_backend. The index is None if that was never built.
+    """
+    if settings is None:
+        settings = get_search_settings(collection_name, include_version=False)
+    backend = settings["backend"] if settings["backend"] in ("local", "hnsw") else settings["failover_backend"]
+    if backend == "local":
+        return backend, local_index.get_local_index(collection_name, prefilter=settings["local_prefilter"])
+    if backend == "hnsw":
+        return backend, hnsw_index.get_hnsw_index(collection_name)
+    return backend, None
+
+
+def select_bylaws(db, collection_name: str, query_vector, settings: dict):
+    """
+    First stage of a two-stage search: the ids of the top_bylaws bylaws whose summary
+    vector is closest to the query, or None if the summary collection can't be searched.
+    """
     pipeline = [
         {
             '$vectorSearch': {
-                'index': vector_index_name,
-                'path': embedding_path,
+                'index': settings["summary_index"],
+                'path': settings["summary_embedding_path"],
                 'queryVector': query_vector,
-                'numCandidates': 200, # Adjust as needed
-                'limit': 4 # Adjust as needed - number of chunks to return
+                'numCandidates': max(settings["bylaw_num_candidates"], settings["top_bylaws"]),
+                'limit': settings["top_bylaws"],
             }
-        }, {
-            '$project': {
-                '_id': 0, # Exclude MongoDB default ID
-                'original_bylaw_id': 1, # Keep original bylaw ID
-                'title': 1, # Keep original bylaw title
-                'pdf_url': 1, # Keep original PDF URL
-                'url': 1,
-                'bylaw_id': 1,
-                'bylaw_title': 1,
-                'chunk_sequence': 1, # Keep chunk sequence number
-                'chunk_text': 1, # <<< RETURN THE CHUNK TEXT
-                'score': { # Keep the search score
-                    '$meta': 'vectorSearchScore'
-                }
-                # 'pdf_content': 0 # <<< DO NOT return full content anymore
-            }
-        }
+        },
+        {'$project': {'_id': 0, 'bylaw_id': 1, 'score': {'$meta': 'vectorSearchScore'}}},
+    ]
+    try:
+        rows = list(db[summary_collection_name(collection_name, settings)].aggregate(pipeline))
+    except pymongo.errors.OperationFailure as op_fail:
+        print(f"Bylaw summary search failed, searching all chunks: {op_fail}")
+        return None
+    return [r["bylaw_id"] for r in rows] or None
+
+
+def is_low_confidence(results: list[dict], collection_name: str) -> bool:
+    """True when nothing was retrieved or the best chunk scores under the collection's min_score."""
+    if not results:
+        return True
+    settings = get_search_settings(collection_name)
+    return (results[0].get("score") or 0.0) < settings["min_score"]
+
+
+def search_limits(settings: dict):
+    """(limit, num_candidates) of the chunk search."""
+    limit = settings["max_k"] if settings["adaptive"] else settings["limit"]
+    if settings["mmr"]:
+        limit = max(limit, settings["mmr_candidates"]) # MMR picks the final k from these
+    return limit, max(settings["num_candidates"], limit)
+
+
+def build_search_pipeline(query_vector, settings: dict, limit: int, num_candidates: int, search_filter: dict = None):
+    pipeline = [
+        build_vector_search_stage(query_vector, settings, limit=limit,
+                                  num_candidates=num_candidates, filter=search_filter),
+        {'$project': {**RESULT_PROJECTION, 'score': {'$meta': 'vectorSearchScore'}}}, # Keep the search score
     ]
-    # ---------------------------------------------
+    if settings["mmr"]:
+        pipeline[1]['$project'][settings["embedding_path"]] = 1 # candidate vectors for MMR
+    return pipeline
+
+
+def route_query(query_text: str, collection_name: str, settings: dict):
+    """(named, related) bylaw ids from query_router.route, or (None, None) when routing is off."""
+    if not settings["route_queries"]:
+        return None, None
+    named, related = query_router.route(query_text, collection_name)
+    if named:
+        print(f"Query names bylaws: {named}")
+    elif related:
+        print(f"Query may be about bylaws: {related}")
+    return named, related
+
+
+def bylaw_filter(settings: dict, bylaw_ids) -> dict:
+    return {settings["id_field"]: {'$in': bylaw_ids}}
+
+
+def query_database(query_text: str, database_name: str, collection_name: str, query_vector=None):
+    mongo_client, error = get_mongo_client() # <-- Get the client here; returns at once while Atlas is known down
+    if not mongo_client:
+        print("Error: MongoDB client is not available.")
+        if failover_index(collection_name)[1] is None:
+            return [], error
+        print(f"Searching the local snapshot of {collection_name} instead")
+
+    # This will now use the lazy-loading version of the model
+    if query_vector is None:
+        print("EMBEDDING")
+        query_vector = embed_vectors.embed_text(query_text)
+        print("DONE EMBEDDING AAH")
+    if not query_vector:
+        print("Error: Could not generate query vector.")
+        return [], error
+
+    settings = get_search_settings(collection_name)
+    vector_index_name = settings["index"]
+    embedding_path = settings["embedding_path"]
+
+    limit, num_candidates = search_limits(settings)
+    named_ids, related_ids = route_query(query_text, collection_name, settings)
+
+    def unrouted_filter():
+        if settings["two_stage"] and mongo_client:
+            bylaw_ids = select_bylaws(mongo_client[database_name], collection_name, query_vector, settings)
+            if bylaw_ids:
+                print(f"Two-stage search restricted to bylaws: {bylaw_ids}")
+                return bylaw_filter(settings, bylaw_ids)
+        return None
 
-    # ---- Run pipeline on the NEW collection ----
+    collection = mongo_client[database_name][collection_name] if mongo_client else None
+
+    def fetch_from_mongo(query: dict) -> list[dict]:
+        if collection is None:
+            return [] # Mongo is down: no neighbour expansion
+        return list(collection.find(query, RESULT_PROJECTION))
+
+    def search_local(backend: str, index, search_filter):
+        bylaw_ids = search_filter[settings["id_field"]]['$in'] if search_filter else None
+        if backend == "local":
+            hits = index.search(query_vector, limit, candidates=settings["local_candidates"],
+                                mode=settings["local_prefilter"], bylaw_ids=bylaw_ids,
+                                with_vectors=settings["mmr"])
+        else:
+            hits = index.search(query_vector, limit, ef=settings["hnsw_ef"], bylaw_ids=bylaw_ids,
+                                with_vectors=settings["mmr"])
+        fetch = fetch_from_mongo
+        if backend == "local":
+            fetch = lambda query: index.find(query) if index.positions is not None else fetch_from_mongo(query)
+        return hits, f"{backend} index", fetch
+
+    def search(search_filter):
+        """Runs the configured backend with the given pre-filter -> (hits, label, neighbour fetch)."""
+        if collection is None:
+            return search_local(*failover_index(collection_name, settings), search_filter)
+        if settings["backend"] in ("local", "hnsw"):
+            backend, index = failover_index(collection_name, settings)
+            if index is not None:
+                return search_local(backend, index, search_filter)
+            print(f"No {settings['backend']} index for {collection_name}, falling back to $vectorSearch")
+
+        pipeline = build_search_pipeline(query_vector, settings, limit, num_candidates, search_filter)
+        try:
+            hits = list(collection.aggregate(pipeline))
+        except pymongo.errors.ConnectionFailure as e: # includes server selection and network timeouts
+            mark_mongo_down(e) # the next requests skip Mongo until the health check sees it back
+            backend, index = failover_index(collection_name, settings)
+            if index is None:
+                raise
+            print(f"$vectorSearch failed ({e}), searching the local snapshot")
+            return search_local(backend, index, search_filter)
+        return hits, "$vectorSearch", fetch_from_mongo
+
+    # ---- Run the search on the NEW collection ----
     try:
-        # Use the imported client directly
-        result = list(mongo_client[database_name][collection_name].aggregate(pipeline))
-        print("results:: ", result)
+        hits, source, fetch = search(bylaw_filter(settings, named_ids) if named_ids else unrouted_filter())
+        if named_ids and not named_hits_ok(hits, settings):
+            print("Nothing in the named bylaws scored above min_score, searching the whole collection")
+            hits, source, fetch = search(unrouted_filter())
+        hits = boost_related(hits, related_ids, settings)
+        result = postprocess_results(hits, query_vector, settings, fetch_neighbours=fetch)
+        print(f"results ({source}):: ", result)
         return result, "No Error"
     except pymongo.errors.OperationFailure as op_fail:
          print(f"Error during vector search aggregation: {op_fail}")
-         print("  * Check if the vector index '{vector_index_name}' exists on collection '{collection_name}' and field '{embedding_path}'.")
+         print(f"  * Check if the vector index '{vector_index_name}' exists on collection '{collection_name}' and field '{embedding_path}'.")
          return [], "No Error"
     except Exception as e:
          print(f"An unexpected error occurred during database query: {e}")
          return [], "No Error"
     # -----------------------------------------
 
+
+async def query_database_async(query_text: str, database_name: str, collection_name: str):
+    """
+    query_database for the ASGI app (asgi_app.py). The query is embedded on the embedding
+    thread and $vectorSearch runs on the AsyncMongoClient, so the event loop never blocks
+    on Mongo. Searches that run in process (local/hnsw backend, two-stage selection, or the
+    failover index while Mongo is down) go through query_database on a worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    query_vector = await embed_vectors.embed_text_async(query_text)
+    if not query_vector:
+        print("Error: Could not generate query vector.")
+        return [], None
+
+    # the embedding version pointer is cached; a refresh reads it with the sync client
+    settings = await loop.run_in_executor(None, get_search_settings, collection_name)
+    run_sync = functools.partial(query_database, query_text, database_name, collection_name, query_vector=query_vector)
+    if settings["backend"] in ("local", "hnsw") or settings["two_stage"] or mongo_outage_started() is not None:
+        return await loop.run_in_executor(None, run_sync)
+
+    mongo_client, error = get_async_mongo_client()
+    if not mongo_client:
+        return await loop.run_in_executor(None, run_sync)
+    collection = mongo_client[database_name][collection_name]
+    limit, num_candidates = search_limits(settings)
+    named_ids, related_ids = route_query(query_text, collection_name, settings)
+
+    async def search(search_filter):
+        cursor = await collection.aggregate(build_search_pipeline(query_vector, settings, limit, num_candidates,
+                                                                  search_filter))
+        return await cursor.to_list()
+
+    try:
+        hits = await search(bylaw_filter(settings, named_ids) if named_ids else None)
+        if named_ids and not named_hits_ok(hits, settings):
+            print("Nothing in the named bylaws scored above min_score, searching the whole collection")
+            hits = await search(None)
+        hits = boost_related(hits, related_ids, settings)
+        results = rank_results(hits, query_vector, settings)
+        neighbours = []
+        if settings["expand_neighbors"] > 0:
+            query = neighbour_query(results, settings)
+            if query is not None:
+                neighbours = await collection.find(query, RESULT_PROJECTION).to_list()
+        result = assemble_results(results, settings, fetch_neighbours=lambda query: neighbours)
+        print("results ($vectorSearch, async):: ", result)
+        return result, "No Error"
+    except pymongo.errors.ConnectionFailure as e:
+        mark_mongo_down(e)
+        if failover_index(collection_name, settings)[1] is None:
+            print(f"MongoDB unreachable during vector search: {e}")
+            return [], e
+        print(f"$vectorSearch failed ({e}), searching the local snapshot")
+        return await loop.run_in_executor(None, run_sync)
+    except pymongo.errors.OperationFailure as op_fail:
+        print(f"Error during vector search aggregation: {op_fail}")
+        print(f"  * Check if the vector index '{settings['index']}' exists on collection '{collection_name}' and field '{settings['embedding_path']}'.")
+        return [], "No Error"
+    except Exception as e:
+        print(f"An unexpected error occurred during database query: {e}")
+        return [], "No Error"
+
 # Example Call:
 # results = query_database("can i park on bartly drive?", "bylaws", "bylaw_chunks")
-# print(results)
\ No newline at end of file
+# print(results)
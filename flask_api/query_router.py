@@ -0,0 +1,206 @@
+# file: query_router.py
+# Routes queries that name a bylaw straight to it.
+#
+# "What does Chapter 591 say about ...", "by-law 2019-038": the vector search would
+# spend its candidates across every bylaw in the city. A lookup table per collection
+# (query_routes.json, built from Mongo with `python query_router.py`) maps
+#
+#   chapters  Toronto chapter numbers ("591") -> bylaw ids
+#   bylaws    by-law numbers ("2019-38", Guelph's "15200") -> bylaw ids
+#   keywords  distinctive title words ("noise", "fence") -> bylaw ids; a word is
+#             only kept if it appears in at most MAX_KEYWORD_BYLAWS titles
+#
+# route() returns two lists. "named" bylaws were referenced explicitly and in the
+# table: query_database pre-filters its one search to their chunks (a $vectorSearch
+# filter on the id field, see vector_index.py, or a row mask in the local backends),
+# and only searches the whole collection if that finds nothing above min_score.
+# "related" bylaws merely share a title word with the query ("park" -> Parks), which
+# is often wrong, so nothing is filtered: their chunks among the results are only
+# ranked a little higher (ranking.boost_related).
+import argparse
+import json
+import os
+import re
+
+ROUTES_FILE = os.getenv(
+    "QUERY_ROUTES_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_routes.json"),
+)
+MAX_KEYWORD_BYLAWS = 3 # a title word shared by more bylaws says nothing about the query
+MAX_ROUTED_BYLAWS = 5
+
+# "Chapter 591", "ch. 591"
+_CHAPTER_REF = re.compile(r"\b(?:chapter|ch\.)\s*(\d{1,4}[a-z]?)\b", re.I)
+# "by-law 2019-038", "bylaw no. 87-12", "By-law Number (1996)-15200", "bylaw 15200". A short
+# bare number is not a reference: "is there a bylaw 3 dogs limit"
+_BYLAW_REF = re.compile(
+    r"\bby-?\s?law\s*(?:no\.?|number|#)?\s*(\(?\d{2,4}\)?\s*-\s*\d{1,5}[a-z]?|\d{4,6})\b", re.I)
+# a year-style number inside a title ("Fence By-law 2019-038")
+_TITLE_NUMBER = re.compile(r"\b((?:19|20)\d{2}-\d{1,5})\b")
+# notes the source pages append to titles ("Traffic and Parking\n\nNote: Schedules have been updated ...")
+_TITLE_NOTE = re.compile(r"\n\s*\n|\bnote:", re.I)
+_WORD = re.compile(r"[a-z][a-z'-]{2,}")
+_STOPWORDS = {
+    "bylaw", "bylaws", "by-law", "by-laws", "law", "laws", "chapter", "city", "town", "municipal", "code",
+    "the", "and", "for", "with", "from", "into", "under", "other", "general", "amend", "amendment",
+    "amending", "respecting", "regulate", "regulating", "regulation", "regulations", "provide", "provisions",
+    "establish", "prohibit", "certain", "within", "area", "areas", "toronto", "waterloo", "guelph", "what",
+    "can", "how", "does", "are", "there", "need", "allowed", "rules", "about", "have", "has", "keep", "where",
+    "when", "which", "who", "our", "your", "their", "any", "much", "many", "long",
+}
+
+
+def normalize_number(value: str) -> str:
+    """"No. 2019-38" / "2019-038" -> "2019-38"; "591A" -> "591a" (zero padding and case don't matter)."""
+    value = str(value).strip().lower()
+    value = re.sub(r"^(?:no\.?|number|#)\s*", "", value)
+    parts = re.findall(r"\d+[a-z]?", value)
+    return "-".join(p.lstrip("0") or "0" for p in parts)
+
+
+def clean_title(title: str) -> str:
+    """The title without the notes some listings append to it."""
+    return _TITLE_NOTE.split(title or "", 1)[0].strip()
+
+
+def _stem(word: str) -> str:
+    """Plural -> singular, enough to match "fences" in a query to a "Fence By-law" title."""
+    word = word.strip("'-")
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _keywords(text: str) -> set:
+    return {_stem(w) for w in _WORD.findall(text.lower()) if w not in _STOPWORDS}
+
+
+def title_keywords(title: str) -> set:
+    return _keywords(clean_title(title))
+
+
+def chapter_numbers(bylaw_id, title: str = None) -> set:
+    """Toronto: ids and titles like "Chapter 591"."""
+    return {normalize_number(m.group(1)) for text in (str(bylaw_id or ""), clean_title(title))
+            for m in _CHAPTER_REF.finditer(text)}
+
+
+def bylaw_numbers(bylaw_id, title: str = None, bylaw_number: str = None) -> set:
+    numbers = set()
+    title = clean_title(title)
+    numbers.update(normalize_number(m.group(1)) for m in _BYLAW_REF.finditer(title))
+    numbers.update(normalize_number(m.group(1)) for m in _TITLE_NUMBER.finditer(title))
+    if bylaw_number:
+        numbers.add(normalize_number(bylaw_number))
+    # ids like "waterloo::2019-038"
+    if "::" in str(bylaw_id or ""):
+        tail = str(bylaw_id).split("::", 1)[1]
+        if re.fullmatch(r"[\d-]+[a-z]?", tail):
+            numbers.add(normalize_number(tail))
+    return {n for n in numbers if n}
+
+
+def build_table(bylaws) -> dict:
+    """``bylaws``: iterable of ``(bylaw_id, title, bylaw_number)`` -> routing table."""
+    chapters, numbers, keywords = {}, {}, {}
+    for bylaw_id, title, bylaw_number in bylaws:
+        # the Toronto listing repeats some chapters
+        for table, keys in ((chapters, chapter_numbers(bylaw_id, title)),
+                            (numbers, bylaw_numbers(bylaw_id, title, bylaw_number)),
+                            (keywords, title_keywords(title))):
+            for key in keys:
+                if bylaw_id not in table.setdefault(key, []):
+                    table[key].append(bylaw_id)
+    keywords = {w: ids for w, ids in keywords.items() if len(ids) <= MAX_KEYWORD_BYLAWS}
+    return {"chapters": chapters, "bylaws": numbers, "keywords": keywords}
+
+
+def load_routes(path: str = ROUTES_FILE) -> dict:
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            routes = json.load(f)
+        print(f"Loaded query routes for {', '.join(routes)} from {path}")
+        return routes
+    except Exception as e:
+        print(f"⚠️ Could not read query routes from {path}: {e}")
+        return {}
+
+
+_routes = load_routes()
+
+
+def _bylaw_ref_keys(ref: str) -> list:
+    """Lookup keys of a by-law reference; "(1996)-15200" is also tried as Guelph's bare "15200"."""
+    keys = [normalize_number(ref)]
+    if ref.lstrip().startswith("("):
+        keys.append(normalize_number(ref.rsplit("-", 1)[1]))
+    return keys
+
+
+def route(query: str, collection_name: str, routes: dict = None):
+    """
+    ``(named, related)`` bylaw ids for a query, best first; either may be None.
+    named: an explicit "Chapter N" / "By-law N" whose number is in the table.
+    related: bylaws whose title shares a distinctive word with the query (only when nothing is named).
+    """
+    table = (routes if routes is not None else _routes).get(collection_name)
+    if not table or not query:
+        return None, None
+
+    named = []
+    lookups = [(table.get("chapters", {}), [normalize_number(m.group(1))]) for m in _CHAPTER_REF.finditer(query)]
+    lookups += [(table.get("bylaws", {}), _bylaw_ref_keys(m.group(1))) for m in _BYLAW_REF.finditer(query)]
+    for numbers, keys in lookups:
+        for key in keys:
+            for bylaw_id in numbers.get(key, []):
+                if bylaw_id not in named:
+                    named.append(bylaw_id)
+    if named:
+        return named[:MAX_ROUTED_BYLAWS], None
+
+    # related: bylaws matching the most query words first
+    hits = {}
+    for word in _keywords(query):
+        for bylaw_id in table.get("keywords", {}).get(word, []):
+            hits[bylaw_id] = hits.get(bylaw_id, 0) + 1
+    if not hits:
+        return None, None
+    return None, sorted(hits, key=lambda b: -hits[b])[:MAX_ROUTED_BYLAWS]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build the bylaw number/title routing table.")
+    ap.add_argument("--db", default="bylaws")
+    ap.add_argument("--out", default=ROUTES_FILE)
+    args = ap.parse_args()
+
+    import query_database
+    from clients import get_mongo_client
+
+    mongo_client, error = get_mongo_client()
+    if not mongo_client:
+        raise RuntimeError(f"MongoDB client is not available: {error}")
+    routes = {}
+    for name in query_database.COLLECTION_SEARCH_SETTINGS:
+        id_field = query_database.get_search_settings(name)["id_field"]
+        rows = mongo_client[args.db][name].aggregate([
+            {"$group": {
+                "_id": f"${id_field}",
+                "title": {"$first": {"$ifNull": ["$title", "$bylaw_title"]}},
+                "bylaw_number": {"$first": "$bylaw_number"},
+            }},
+        ])
+        routes[name] = build_table((r["_id"], r.get("title"), r.get("bylaw_number")) for r in rows if r["_id"])
+        print(f"{name}: {len(routes[name]['chapters'])} chapters, {len(routes[name]['bylaws'])} by-law numbers, "
+              f"{len(routes[name]['keywords'])} keywords")
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(routes, f, indent=1)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+# file: ranking.py
+# What happens to the chunks a vector search returns before they reach the prompt:
+#
+#   rank_results      MMR re-ranking (if "mmr"), then the adaptive cutoff
+#   assemble_results  neighbour expansion (if "expand_neighbors"), then merging
+#                     consecutive/overlapping chunks of a bylaw into one passage
+#
+# Pure functions of the hits and the collection's search settings (query_database.py),
+# shared by every backend and by the sync and async query paths.
+import numpy as np
+
+from vector_codec import decode_vector
+
+
+def adaptive_cutoff(results: list[dict], settings: dict) -> list[dict]:
+    """
+    Trims score-ordered results to a variable k between min_k and max_k.
+
+    A chunk is kept while its score is above min_score, within min_relative_score
+    of the best score, and not separated from the previous chunk by a gap larger
+    than max_relative_gap (relative to the best score). min_k chunks are always kept.
+    """
+    if not results:
+        return results
+    min_k = max(1, settings["min_k"])
+    max_k = max(min_k, settings["max_k"])
+    top_score = results[0].get("score") or 0.0
+    if top_score <= 0:
+        return results[:min_k]
+
+    kept = [results[0]]
+    for prev, chunk in zip(results, results[1:max_k]):
+        score = chunk.get("score") or 0.0
+        prev_score = prev.get("score") or 0.0
+        if len(kept) >= min_k and (
+            score < settings["min_score"]
+            or score < top_score * settings["min_relative_score"]
+            or (prev_score - score) > top_score * settings["max_relative_gap"]
+        ):
+            break
+        kept.append(chunk)
+    return kept
+
+
+def mmr_select(query_vector, vectors: np.ndarray, k: int, lam: float = 0.7) -> list[int]:
+    """
+    Indices of k rows of `vectors` chosen greedily by maximal marginal relevance:
+    lam * sim(query, d) - (1 - lam) * max sim(d, already chosen). lam=1 is plain top-k.
+    """
+    n = len(vectors)
+    if n <= k:
+        return list(range(n))
+    v = vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+    q = np.asarray(query_vector, dtype=np.float32)
+    q = q / max(float(np.linalg.norm(q)), 1e-12)
+    relevance = v @ q
+    pairwise = v @ v.T
+    chosen = [int(np.argmax(relevance))]
+    redundancy = pairwise[chosen[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[chosen[0]] = False
+    while len(chosen) < k:
+        gain = np.where(available, lam * relevance - (1 - lam) * redundancy, -np.inf)
+        best = int(np.argmax(gain))
+        chosen.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return chosen
+
+
+def _overlap_len(a: str, b: str, max_overlap: int = 400) -> int:
+    """Length of the longest suffix of a that is also a prefix of b (for chunks stored without offsets)."""
+    for k in range(min(len(a), len(b), max_overlap), 0, -1):
+        if a.endswith(b[:k]):
+            return k
+    return 0
+
+
+def _are_adjacent(a: dict, b: dict, index_field: str) -> bool:
+    if a.get("char_end") is not None and b.get("char_start") is not None and b["char_start"] <= a["char_end"]:
+        return True
+    return b[index_field] - a[index_field] <= 1
+
+
+def _merge_run(run: list[dict], index_field: str) -> dict:
+    """One passage from index-ordered neighbouring chunks, without repeating their overlap."""
+    # the best hit (not a neighbour added for context) lends the passage its fields and score
+    best = max(run, key=lambda c: (c.get("score") or 0.0, not c.get("context")))
+    text = run[0].get("chunk_text") or ""
+    end = run[0].get("char_end")
+    for chunk in run[1:]:
+        piece = chunk.get("chunk_text") or ""
+        start = chunk.get("char_start")
+        if end is not None and start is not None:
+            # offsets into the bylaw text say exactly how much is repeated (none if
+            # contiguous); only a real gap between the chunks gets a separating space
+            text += piece[end - start:] if start <= end else " " + piece
+        else:
+            k = _overlap_len(text, piece)
+            text += piece[k:] if k else "\n" + piece
+        end = chunk.get("char_end")
+    merged = dict(best)
+    merged["chunk_text"] = text
+    merged[index_field] = run[0][index_field]
+    merged["merged_chunks"] = [c[index_field] for c in run]
+    if run[0].get("char_start") is not None:
+        merged["char_start"], merged["char_end"] = run[0]["char_start"], end
+    return merged
+
+
+def merge_adjacent_chunks(results: list[dict], settings: dict) -> list[dict]:
+    """
+    Merges hits that are consecutive or overlapping chunks of the same bylaw into one
+    passage (the overlap is sent to Gemini once). Passages keep the rank and score of
+    their best chunk; hits without an id or chunk index are left alone.
+    """
+    id_field, index_field = settings["id_field"], settings["index_field"]
+    by_bylaw = {}
+    for rank, chunk in enumerate(results):
+        if chunk.get(id_field) is None or chunk.get(index_field) is None:
+            by_bylaw[("unmerged", rank)] = [(rank, chunk)]
+        else:
+            by_bylaw.setdefault(chunk[id_field], []).append((rank, chunk))
+
+    passages = []
+    for members in by_bylaw.values():
+        members.sort(key=lambda m: m[1].get(index_field) or 0)
+        runs = []
+        for rank, chunk in members:
+            if runs and _are_adjacent(runs[-1][-1][1], chunk, index_field):
+                runs[-1].append((rank, chunk))
+            else:
+                runs.append([(rank, chunk)])
+        for run in runs:
+            chunks = [c for _, c in run]
+            passages.append((min(r for r, _ in run), chunks[0] if len(chunks) == 1 else _merge_run(chunks, index_field)))
+    passages.sort(key=lambda p: p[0])
+    return [p for _, p in passages]
+
+
+def dedupe_sources(source_info: list[dict]) -> list[dict]:
+    """Keeps the first source per bylaw id (results are best-first)."""
+    seen = set()
+    unique = []
+    for source in source_info:
+        key = source.get("bylaw_id") or source.get("pdf_url")
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(source)
+    return unique
+
+
+def neighbour_query(results: list[dict], settings: dict) -> dict:
+    """One $or filter covering the window of every hit (served by the (id, index) compound index)."""
+    id_field, index_field, window = settings["id_field"], settings["index_field"], settings["expand_neighbors"]
+    clauses = [
+        {id_field: r[id_field], index_field: {'$gte': r[index_field] - window, '$lte': r[index_field] + window}}
+        for r in results if r.get(id_field) is not None and r.get(index_field) is not None
+    ]
+    return {'$or': clauses} if clauses else None
+
+
+def expand_neighbours(results: list[dict], settings: dict, fetch) -> list[dict]:
+    """
+    Adds the chunks around each hit, fetched in one batch by ``fetch(filter)``; each
+    neighbour follows its hit and carries its score, so merge_adjacent_chunks stitches
+    every window into one passage ranked like the hit.
+    """
+    query = neighbour_query(results, settings)
+    if query is None:
+        return results
+    id_field, index_field, window = settings["id_field"], settings["index_field"], settings["expand_neighbors"]
+    by_key = {}
+    for doc in fetch(query):
+        by_key.setdefault((doc.get(id_field), doc.get(index_field)), doc)
+
+    seen = {(r.get(id_field), r.get(index_field)) for r in results}
+    expanded = []
+    for hit in results:
+        expanded.append(hit)
+        if hit.get(id_field) is None or hit.get(index_field) is None:
+            continue
+        for offset in range(-window, window + 1):
+            key = (hit[id_field], hit[index_field] + offset)
+            if key in seen or key not in by_key:
+                continue
+            seen.add(key)
+            expanded.append({**by_key[key], "score": hit.get("score"), "context": True})
+    return expanded
+
+
+def postprocess_results(results: list[dict], query_vector, settings: dict, fetch_neighbours=None) -> list[dict]:
+    """
+    MMR (if enabled) -> adaptive cutoff -> neighbour expansion -> adjacent-chunk merging;
+    drops the candidate vectors. ``fetch_neighbours(filter)`` returns chunk documents.
+    """
+    return assemble_results(rank_results(results, query_vector, settings), settings, fetch_neighbours)
+
+
+def rank_results(results: list[dict], query_vector, settings: dict) -> list[dict]:
+    """The hits to answer with: MMR (if enabled), then the adaptive cutoff; drops the candidate vectors."""
+    if settings["mmr"] and results:
+        k = settings["max_k"] if settings["adaptive"] else settings["limit"]
+        vectors = np.asarray(
+            [r["_vector"] if "_vector" in r else decode_vector(r[settings["embedding_path"]]) for r in results],
+            dtype=np.float32,
+        )
+        picked = mmr_select(query_vector, vectors, k, settings["mmr_lambda"])
+        results = sorted((results[i] for i in picked), key=lambda r: r.get("score") or 0.0, reverse=True)
+    for r in results:
+        r.pop("_vector", None)
+        r.pop(settings["embedding_path"], None)
+    if settings["adaptive"]:
+        results = adaptive_cutoff(results, settings)
+    return results
+
+
+def assemble_results(results: list[dict], settings: dict, fetch_neighbours=None) -> list[dict]:
+    """Ranked hits -> passages: neighbour expansion (if enabled), then adjacent-chunk merging."""
+    if settings["expand_neighbors"] > 0 and fetch_neighbours is not None:
+        results = expand_neighbours(results, settings, fetch_neighbours)
+        results = merge_adjacent_chunks(results, settings) # stitches the windows even if merge_adjacent is off
+    elif settings["merge_adjacent"]:
+        results = merge_adjacent_chunks(results, settings)
+    return results
+
+
+def top_score(hits: list[dict]) -> float:
+    return (hits[0].get("score") or 0.0) if hits else 0.0
+
+
+def named_hits_ok(hits: list[dict], settings: dict) -> bool:
+    """
+    Whether the search restricted to the bylaws a query names ("Chapter 591") answers it:
+    it found something scoring at least min_score. Otherwise the whole collection is searched.
+    """
+    return top_score(hits) >= settings["min_score"]
+
+
+def boost_related(hits: list[dict], related_ids, settings: dict) -> list[dict]:
+    """
+    Re-orders hits with the chunks of the bylaws a query's title keywords point to
+    ranked as if they scored related_boost higher. The scores themselves are unchanged.
+    """
+    related, id_field, boost = set(related_ids or ()), settings["id_field"], settings["related_boost"]
+    if not related or not boost:
+        return hits
+    return sorted(hits, key=lambda r: (r.get("score") or 0.0) + (boost if r.get(id_field) in related else 0.0),
+                  reverse=True)
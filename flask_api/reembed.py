@@ -0,0 +1,235 @@
+# file: reembed.py
+# Resumable, multi-process re-embedding of any collection/field.
+#
+# The _id range is split into --workers shards with $bucketAuto; each shard runs
+# in its own process with its own model, Mongo client and a background writer
+# thread, so bulk_write of one batch overlaps encoding of the next. After every
+# committed batch the shard's last _id is checkpointed to disk; a rerun with the
+# same arguments picks up where each shard stopped (--restart starts over).
+#
+#   python reembed.py --collection bylaw_chunks --field chunk_embedding_cpu --workers 4
+#   python reembed.py --collection waterloo --field chunk_embedding --only-missing
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+
+import pymongo
+from bson import json_util
+from tqdm import tqdm
+
+from embedding_cache import MINILM_MODEL_NAME, EmbeddingCache, encode_cached
+from vector_codec import VECTOR_FORMATS, encode_vector
+
+CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reembed_checkpoints")
+
+
+def make_client() -> pymongo.MongoClient:
+    # one client per process: MongoClient isn't fork-safe
+    from scraping_common.ingest import make_mongo_client
+    return make_mongo_client()
+
+
+def checkpoint_path(args, shard: int = None) -> str:
+    name = f"{args.db}.{args.collection}.{args.field}"
+    if shard is not None:
+        name += f".shard{shard}"
+    return os.path.join(args.checkpoint_dir, name + ".json")
+
+
+def _write_json(path: str, data) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(json_util.dumps(data))
+    os.replace(tmp, path)  # atomic: a crash never leaves a half-written checkpoint
+
+
+def _read_json(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json_util.loads(f.read())
+
+
+def plan_shards(collection, workers: int, query: dict) -> list[dict]:
+    """Splits the _id space into up to `workers` ranges of about equal size."""
+    if workers <= 1:
+        return [{"min": None, "max": None, "last": True}]
+    buckets = list(collection.aggregate([
+        {"$match": query},
+        {"$bucketAuto": {"groupBy": "$_id", "buckets": workers}},
+    ], allowDiskUse=True))
+    # $bucketAuto bounds are [min, max) except for the last bucket, which includes max
+    return [
+        {"min": b["_id"]["min"], "max": b["_id"]["max"], "last": i == len(buckets) - 1}
+        for i, b in enumerate(buckets)
+    ]
+
+
+def shard_query(base: dict, shard: dict, after=None) -> dict:
+    bounds = {}
+    if after is not None:
+        bounds["$gt"] = after
+    elif shard["min"] is not None:
+        bounds["$gte"] = shard["min"]
+    if shard["max"] is not None:
+        bounds["$lte" if shard["last"] else "$lt"] = shard["max"]
+    return {**base, "_id": bounds} if bounds else dict(base)
+
+
+def run_shard(args, index: int, shard: dict, base_query: dict) -> int:
+    """Re-embeds one _id range; returns the number of documents written."""
+    import embed_vectors  # loads torch; only in the worker processes
+
+    model = embed_vectors.get_embedding_model()
+    cache = None if args.no_cache else EmbeddingCache()
+    client = make_client()
+    collection = client[args.db][args.collection]
+
+    ckpt_file = checkpoint_path(args, index)
+    ckpt = _read_json(ckpt_file) or {"last_id": None, "count": 0, "done": False}
+    if ckpt["done"]:
+        return 0
+
+    # writer thread: bulk_write + checkpoint while the next batch encodes
+    pending = queue.Queue(maxsize=2)
+    errors = []
+
+    def writer():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            if errors:
+                # keep draining so flush() never blocks on a full queue; the checkpoint
+                # must not move past the failed batch
+                continue
+            ops, last_id = item
+            try:
+                collection.bulk_write(ops, ordered=False)
+            except Exception as e:
+                errors.append(e)
+                continue
+            ckpt["last_id"] = last_id
+            ckpt["count"] += len(ops)
+            _write_json(ckpt_file, ckpt)
+            bar.update(len(ops))
+
+    query = shard_query(base_query, shard, ckpt["last_id"])
+    total = collection.count_documents(query)
+    bar = tqdm(total=total, desc=f"shard {index}", position=index, leave=True)
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+
+    written = 0
+    batch = []
+
+    def flush():
+        nonlocal written
+        texts = [text for _, text in batch]
+        vectors = encode_cached(model, MINILM_MODEL_NAME, texts, cache, batch_size=args.batch)
+        ops = [
+            pymongo.UpdateOne({"_id": _id}, {"$set": {args.field: encode_vector(vec, args.vector_format)}})
+            for (_id, _), vec in zip(batch, vectors)
+        ]
+        pending.put((ops, batch[-1][0]))
+        written += len(ops)
+
+    cursor = collection.find(query, {"_id": 1, args.text_field: 1}).sort("_id", 1).batch_size(args.batch)
+    try:
+        for doc in cursor:
+            if errors:
+                break
+            text = (doc.get(args.text_field) or "").strip()
+            if not text:
+                continue
+            batch.append((doc["_id"], text))
+            if len(batch) >= args.batch:
+                flush()
+                batch = []
+        if batch and not errors:
+            flush()
+    finally:
+        pending.put(None)
+        thread.join()
+        bar.close()
+        client.close()
+        if cache is not None:
+            cache.close()
+
+    if errors:
+        raise RuntimeError(f"shard {index}: bulk_write failed, rerun to resume from the checkpoint: {errors[0]}")
+    ckpt["done"] = True
+    _write_json(ckpt_file, ckpt)
+    return written
+
+
+def _shard_entry(payload):
+    args, index, shard, base_query = payload
+    return index, run_shard(args, index, shard, base_query)
+
+
+def reembed(args) -> int:
+    os.makedirs(args.checkpoint_dir, exist_ok=True)
+    base_query = {args.text_field: {"$exists": True}}
+    if args.only_missing:
+        base_query[args.field] = {"$exists": False}
+
+    plan_file = checkpoint_path(args)
+    plan = None if args.restart else _read_json(plan_file)
+    if plan is None:
+        # a fresh plan invalidates the old per-shard checkpoints
+        for name in os.listdir(args.checkpoint_dir):
+            if name.startswith(os.path.basename(plan_file)[:-len(".json")] + ".shard"):
+                os.remove(os.path.join(args.checkpoint_dir, name))
+        client = make_client()
+        try:
+            shards = plan_shards(client[args.db][args.collection], args.workers, base_query)
+        finally:
+            client.close()
+        plan = {"shards": shards, "created_at": time.time()}
+        _write_json(plan_file, plan)
+        print(f"Planned {len(shards)} shards for {args.db}.{args.collection}.{args.field}")
+    else:
+        print(f"Resuming {len(plan['shards'])} shards from {plan_file}")
+
+    payloads = [(args, i, shard, base_query) for i, shard in enumerate(plan["shards"])]
+    start = time.perf_counter()
+    if len(payloads) == 1:
+        results = [_shard_entry(payloads[0])]
+    else:
+        # spawn, not fork: torch and MongoClient don't survive a fork
+        with mp.get_context("spawn").Pool(len(payloads)) as pool:
+            results = pool.map(_shard_entry, payloads)
+    total = sum(n for _, n in results)
+    print(f"🎉 Re-embedded {total} documents in {time.perf_counter() - start:.1f}s "
+          f"({len(payloads)} shards). Checkpoints: {args.checkpoint_dir}")
+    return total
+
+
+def build_parser(description: str = "Resumable multi-process re-embedding of a collection field.") -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description=description)
+    ap.add_argument("--db", default="bylaws")
+    ap.add_argument("--collection", default="bylaw_chunks")
+    ap.add_argument("--field", default="chunk_embedding_cpu", help="Field to write the vectors to")
+    ap.add_argument("--text-field", default="chunk_text")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                    help="Worker processes / _id shards (default: half the CPUs)")
+    ap.add_argument("--batch", type=int, default=100, help="Documents per encode + bulk_write (default 100)")
+    ap.add_argument("--vector-format", choices=VECTOR_FORMATS, default="array",
+                    help="Store vectors as a BSON array or packed BinData float32/int8 (default array)")
+    ap.add_argument("--only-missing", action="store_true", help="Only documents that don't have --field yet")
+    ap.add_argument("--restart", action="store_true", help="Ignore existing checkpoints and start over")
+    ap.add_argument("--no-cache", action="store_true", help="Don't use the local embedding cache")
+    ap.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR)
+    return ap
+
+
+def main():
+    reembed(build_parser().parse_args())
+
+
+if __name__ == "__main__":
+    main()
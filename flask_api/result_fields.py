@@ -0,0 +1,20 @@
+# file: result_fields.py
+# The chunk fields returned with every search hit, whichever backend answers it:
+# query_database's $project / find projection (RESULT_PROJECTION), and the docs
+# stored by the in-process indexes (local_index.py, hnsw_index.py).
+# Kept apart from query_database so the index builders don't import its clients.
+
+RESULT_FIELDS = (
+    "original_bylaw_id",  # Toronto: original bylaw id, title and PDF URL
+    "title",
+    "pdf_url",
+    "url",
+    "bylaw_id",
+    "bylaw_title",
+    "chunk_sequence",  # Toronto's chunk sequence number
+    "chunk_index",
+    "char_start",  # offsets into the bylaw text, used to merge overlapping chunks
+    "char_end",
+    "section_path",  # Toronto: "Article 2 > § 545-5 Licence required"
+    "chunk_text",
+)
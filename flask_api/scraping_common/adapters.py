@@ -0,0 +1,240 @@
+"""
+Per-city adapters for ``scraping_common.ingest.run_ingest``.
+
+* ``TorontoAdapter`` reads the chapter list from ``lawmcode.htm``,
+  streams each chapter PDF into the document cache and writes the
+  ``bylaw_chunks`` schema (``original_bylaw_id``/``chunk_sequence``,
+  vectors in ``chunk_embedding_cpu``).  Chapters are chunked on their
+  ``§`` section boundaries (``scraping_toronto/sections.py``) and every
+  chunk records its ``section_path``.
+* ``WaterlooAdapter`` and ``GuelphAdapter`` read the JSON files written
+  by the city scrapers and write the ``bylaw_id``/``chunk_index``
+  schema (vectors in ``chunk_embedding``).  They only differ in which
+  JSON key holds the document URL.
+"""
+
+import json
+import re
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from embedding_cache import MINILM_MODEL_NAME
+from scraping_common.chunking import Chunk, chunk_with_offsets
+from scraping_common.manifest import conditional_download
+from scraping_toronto.parse_html import parse_html
+from scraping_toronto.sections import chunk_sections
+
+
+def slugify(s: str) -> str:
+    s = s.lower()
+    s = re.sub(r"[^a-z0-9]+", "-", s)
+    return re.sub(r"-+", "-", s).strip("-")
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class TokenChunking:
+    """Size chunks in embedding-model tokens instead of characters.
+
+    Fast tokenizers aren't safe to call from several threads at once, so
+    the chunk stage's workers take turns.
+    """
+
+    def __init__(self, tokenizer, target_tokens: int = 200, overlap_tokens: int = 32, min_tokens: int = 100):
+        self.tokenizer = tokenizer
+        self.target_tokens = target_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = min_tokens
+        self._lock = threading.Lock()
+
+    def chunk(self, text: str, chunker=chunk_with_offsets) -> Optional[List[Chunk]]:
+        with self._lock:
+            return chunker(text, self.target_tokens, self.overlap_tokens, self.min_tokens, tokenizer=self.tokenizer)
+
+
+# ---- Waterloo / Guelph (scraper JSON output) ---------------
+
+class ScrapedJsonAdapter:
+    id_field = "bylaw_id"
+    index_field = "chunk_index"
+    embedding_field = "chunk_embedding"
+    url_key = "url"
+
+    def __init__(
+        self,
+        city: str,
+        input_dir: Path,
+        target_chunk_chars: int = 1000,
+        overlap_chars: int = 150,
+        min_chunk_chars: int = 600,
+        token_chunking: Optional[TokenChunking] = None,
+    ):
+        self.city = city
+        self.input_dir = Path(input_dir)
+        self.target_chunk_chars = target_chunk_chars
+        self.overlap_chars = overlap_chars
+        self.min_chunk_chars = min_chunk_chars
+        self.token_chunking = token_chunking
+
+    def build_bylaw_id(self, title: str, bylaw_number: Optional[str]) -> str:
+        # Stable id: city + bylaw_number if present, else slug of title
+        if bylaw_number and str(bylaw_number).strip():
+            return f"{slugify(self.city)}::{slugify(bylaw_number)}"
+        return f"{slugify(self.city)}::{slugify(title)}"
+
+    def sources(self) -> Iterator[Dict]:
+        for p in sorted(self.input_dir.rglob("*")):
+            # skip hidden files such as the scraper's .fetch_manifest.json
+            if p.is_file() and not p.name.startswith(".") and p.suffix.lower() in (".txt", ".json"):
+                yield {"path": p}
+
+    def fetch(self, item: Dict) -> Dict:
+        path = item["path"]
+        if path.suffix.lower() == ".txt":
+            base = {
+                "title": path.stem,
+                "url": None,
+                "text": path.read_text(encoding="utf-8", errors="ignore"),
+                "bylaw_number": None,
+                "fetched_at": None,
+            }
+        else:
+            data = json.loads(path.read_text(encoding="utf-8", errors="ignore"))
+            base = {
+                "title": data.get("title") or path.stem,
+                "url": data.get(self.url_key),
+                "text": data.get("text") or "",
+                "bylaw_number": data.get("bylaw_number"),
+                "fetched_at": data.get("fetched_at"),
+            }
+        base["bylaw_id"] = self.build_bylaw_id(base["title"], base["bylaw_number"])
+        return base
+
+    def chunk(self, text: str) -> List[Chunk]:
+        if self.token_chunking is not None:
+            return self.token_chunking.chunk(text)
+        return chunk_with_offsets(
+            text,
+            target_size=self.target_chunk_chars,
+            overlap=self.overlap_chars,
+            min_size=self.min_chunk_chars,
+        )
+
+    def make_doc(self, item: Dict, chunk: Chunk, index: int, sha: str) -> Dict:
+        return {
+            "city": self.city,
+            "bylaw_title": item["title"],
+            "bylaw_number": item.get("bylaw_number"),
+            "url": item.get("url"),
+            "fetched_at": item.get("fetched_at"),
+            "ingested_at": now_iso(),
+            "bylaw_id": item["bylaw_id"],
+            "chunk_index": index,
+            "chunk_text": chunk.text,
+            "char_start": chunk.start,
+            "char_end": chunk.end,
+            "content_sha256": sha,
+            "embedding_model": MINILM_MODEL_NAME,
+            "embedding_dim": 384,
+            "similarity": "cosine",
+        }
+
+    def ensure_indexes(self, col) -> None:
+        # Unique identity to avoid dupes if re-running: (bylaw_id, chunk_index, content_sha256);
+        # its (bylaw_id, chunk_index) prefix also serves the neighbour-expansion lookups at query time
+        col.create_index(
+            [("bylaw_id", 1), ("chunk_index", 1), ("content_sha256", 1)],
+            unique=True,
+            name="uniq_bylaw_chunk_sha"
+        )
+        # Helpful secondary indexes
+        col.create_index([("bylaw_title", 1)])
+        col.create_index([("bylaw_number", 1)])
+        col.create_index([("url", 1)])
+
+
+class WaterlooAdapter(ScrapedJsonAdapter):
+    url_key = "url"
+
+
+class GuelphAdapter(ScrapedJsonAdapter):
+    url_key = "pdf_url"  # Guelph by-laws are PDFs only
+
+
+# ---- Toronto (municipal code chapters) ---------------------
+
+class TorontoAdapter:
+    id_field = "original_bylaw_id"
+    index_field = "chunk_sequence"
+    embedding_field = "chunk_embedding_cpu"  # same field/model as reembed_cpu.py and the query path
+
+    def __init__(
+        self,
+        html_file_name: str,
+        fetcher,
+        doc_cache,
+        manifest=None,
+        offline: bool = False,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 100,
+        min_chunk_size: int = 600,
+        token_chunking: Optional[TokenChunking] = None,
+        by_section: bool = True,
+    ):
+        self.html_file_name = html_file_name
+        self.fetcher = fetcher
+        self.doc_cache = doc_cache
+        self.manifest = manifest
+        self.offline = offline
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.min_chunk_size = min_chunk_size
+        self.token_chunking = token_chunking
+        self.by_section = by_section
+
+    def sources(self) -> Iterator[Dict]:
+        for law in parse_html(self.html_file_name):
+            yield {"bylaw_id": law["_id"], "title": law["title"], "pdf_url": law["pdf"]}
+
+    def fetch(self, item: Dict) -> Dict:
+        item["source"] = conditional_download(
+            self.fetcher, self.manifest, self.doc_cache, item["pdf_url"], reextract=True, offline=self.offline
+        )
+        return item
+
+    def chunk(self, text: str) -> List[Chunk]:
+        chunks = None
+        if self.by_section:
+            # sections are short, so a smaller minimum keeps them apart
+            if self.token_chunking is not None:
+                chunks = self.token_chunking.chunk(text, chunker=chunk_sections)
+            else:
+                chunks = chunk_sections(text, self.chunk_size, self.chunk_overlap, self.min_chunk_size // 2)
+        if chunks is not None:
+            return chunks
+        # no § headings found (or sectioning turned off)
+        if self.token_chunking is not None:
+            return self.token_chunking.chunk(text)
+        return chunk_with_offsets(text, self.chunk_size, self.chunk_overlap, self.min_chunk_size)
+
+    def make_doc(self, item: Dict, chunk: Chunk, index: int, sha: str) -> Dict:
+        return {
+            "original_bylaw_id": item["bylaw_id"],
+            "title": item["title"],
+            "pdf_url": item["pdf_url"],
+            "chunk_sequence": index + 1,
+            "chunk_text": chunk.text,
+            "char_start": chunk.start,
+            "char_end": chunk.end,
+            "section_path": chunk.section_path,
+            "content_sha256": sha,
+        }
+
+    def ensure_indexes(self, col) -> None:
+        # not unique: collections built by the old insert_many path may hold duplicates.
+        # Also serves the neighbour-expansion lookups at query time.
+        col.create_index([("original_bylaw_id", 1), ("chunk_sequence", 1)])
@@ -0,0 +1,198 @@
+"""
+Offset-based chunker shared by every city.
+
+Chunks are computed as ``(start, end)`` offsets into the original text
+and only sliced out at the very end, so packing costs one pass over the
+text with no intermediate strings:
+
+* paragraphs (blank-line separated) and sentences (``.``/``!``/``?``
+  followed by whitespace) are found with ``finditer`` over the original
+  string – no per-paragraph ``split`` copies,
+* consecutive units are packed into a chunk by moving its end offset
+  (the whitespace between units is simply part of the slice),
+* a chunk is closed at a unit boundary once it has ``min_size``
+  characters and the next unit would overshoot ``target_size``; units
+  that cannot be packed are hard-wrapped at the last space before
+  ``target_size``,
+* overlap moves a chunk's start back by up to ``overlap`` characters
+  (to a word boundary) instead of copying the previous chunk's tail.
+
+Every ``Chunk`` carries its offsets, so ``text[c.start:c.end] == c.text``.
+
+Sizes are characters by default.  Pass the embedding model's tokenizer to
+size chunks in tokens instead: ``all-MiniLM-L6-v2`` silently truncates at
+256 word pieces, so character-sized chunks can lose their tail.  The text
+is tokenized once (fast tokenizer, ``return_offsets_mapping``) and spans
+are measured by bisecting the token offsets.  ``target_size`` bounds the
+packed chunk and ``overlap`` is added in front of it, so keep
+``target_size + overlap + 2`` (CLS/SEP) within the model's limit.
+"""
+
+import re
+from bisect import bisect_left
+from typing import List, NamedTuple, Optional, Tuple
+
+# a blank line (paragraph break) or whitespace after sentence punctuation
+# (no lookbehind: matching the punctuation itself is ~2x faster)
+_BREAK = re.compile(r"[.!?]\s+|\n\s*\n\s*")
+_SPACE = re.compile(r"\s")
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int
+    end: int
+    section_path: Optional[str] = None  # set by structure-aware chunkers
+
+
+def _units(text: str):
+    """Yield ``(start, end)`` of every sentence, never spanning a paragraph break."""
+    end = len(text)
+    while end > 0 and text[end - 1].isspace():
+        end -= 1
+    pos = _skip_space(text, 0, end)
+    for brk in _BREAK.finditer(text, pos, end):
+        stop = brk.start()
+        if text[stop] in ".!?":
+            stop += 1  # the punctuation belongs to the sentence
+        else:
+            while stop > pos and text[stop - 1].isspace():
+                stop -= 1
+        if stop > pos:
+            yield pos, stop
+        pos = brk.end()
+    if pos < end:
+        yield pos, end
+
+
+def _skip_space(text: str, pos: int, end: int) -> int:
+    while pos < end and text[pos].isspace():
+        pos += 1
+    return pos
+
+
+class _CharLength:
+    """Chunk length measured in characters."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def size(self, start: int, end: int) -> int:
+        return end - start
+
+    def cut(self, start: int, target: int, min_size: int) -> int:
+        """Where to cut a chunk starting at ``start`` to keep it within ``target``."""
+        limit = start + target
+        cut = self.text.rfind(" ", start + min_size, limit)
+        return cut if cut > start else limit
+
+    def back(self, floor: int, start: int, overlap: int) -> int:
+        """Move ``start`` back by up to ``overlap`` (not before ``floor``), to a word start."""
+        back = max(floor, start - overlap)
+        if floor < back < start:
+            m = _SPACE.search(self.text, back, start)
+            if m:
+                back = _skip_space(self.text, m.start(), start)
+        return back
+
+
+class _TokenLength:
+    """Chunk length measured in tokens of a (fast) Hugging Face tokenizer.
+
+    The whole text is tokenized once with ``return_offsets_mapping``; the
+    token count of any span is then two bisections over the token start
+    offsets, so packing never re‑tokenizes.
+    """
+
+    def __init__(self, text: str, tokenizer):
+        enc = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        offsets = enc["offset_mapping"]
+        self.starts = [s for s, _ in offsets]
+        self.ends = [e for _, e in offsets]
+
+    def size(self, start: int, end: int) -> int:
+        return bisect_left(self.starts, end) - bisect_left(self.starts, start)
+
+    def _continues_word(self, i: int) -> bool:
+        # word pieces of one word are contiguous in the text ("permit", "##ted")
+        return 0 < i < len(self.starts) and self.starts[i] == self.ends[i - 1]
+
+    def cut(self, start: int, target: int, min_size: int) -> int:
+        first = bisect_left(self.starts, start)
+        limit = min(first + target, len(self.starts))
+        j = limit
+        while j > first + min_size and self._continues_word(j):
+            j -= 1
+        if j <= first + min_size:
+            j = limit
+        return self.ends[j - 1]
+
+    def back(self, floor: int, start: int, overlap: int) -> int:
+        i = bisect_left(self.starts, start)
+        j = max(bisect_left(self.starts, floor), i - overlap)
+        while j < i and self._continues_word(j):
+            j += 1
+        return self.starts[j] if j < i else start
+
+
+def chunk_spans(
+    text: str,
+    target_size: int = 1000,
+    overlap: int = 150,
+    min_size: int = 600,
+    tokenizer=None,
+) -> List[Tuple[int, int]]:
+    """``(start, end)`` offsets of the chunks of ``text`` (see module docstring).
+
+    Sizes are in characters, or in tokens when a ``tokenizer`` is given.
+    """
+    length = _TokenLength(text, tokenizer) if tokenizer is not None else _CharLength(text)
+    target_size = max(1, target_size)
+    min_size = min(min_size, target_size)
+    spans: List[Tuple[int, int]] = []
+    cs = ce = -1  # current chunk, empty while cs < 0
+
+    for us, ue in _units(text):
+        if cs < 0:
+            cs, ce = us, ue
+        elif length.size(cs, ue) <= target_size:
+            ce = ue
+            continue
+        elif length.size(cs, ce) >= min_size:
+            spans.append((cs, ce))
+            cs, ce = us, ue
+        else:
+            ce = ue  # too short to close: pack what fits, wrap the rest below
+        # hard-wrap anything longer than target_size
+        while length.size(cs, ce) > target_size:
+            cut = length.cut(cs, target_size, min_size)
+            spans.append((cs, cut))
+            cs = _skip_space(text, cut, ce)
+    if cs >= 0 and ce > cs:
+        spans.append((cs, ce))
+
+    if overlap > 0 and len(spans) > 1:
+        spans = [spans[0]] + [
+            (length.back(ps, s, overlap), e) for (ps, _), (s, e) in zip(spans, spans[1:])
+        ]
+    return spans
+
+
+def chunk_with_offsets(
+    text: str,
+    target_size: int = 1000,
+    overlap: int = 150,
+    min_size: int = 600,
+    tokenizer=None,
+) -> List[Chunk]:
+    return [Chunk(text[s:e], s, e) for s, e in chunk_spans(text, target_size, overlap, min_size, tokenizer)]
+
+
+def chunk_text(
+    text: str,
+    target_size: int = 1000,
+    overlap: int = 150,
+    min_size: int = 600,
+    tokenizer=None,
+) -> List[str]:
+    return [text[s:e] for s, e in chunk_spans(text, target_size, overlap, min_size, tokenizer)]
@@ -0,0 +1,92 @@
+"""
+Content-addressed on-disk cache of raw downloaded documents.
+
+Every page and PDF the scrapers download is streamed straight to disk
+(1 MB at a time, hashed on the way) instead of being held in memory as
+``response.content``.  Files are stored by their SHA‑256::
+
+    doc_cache/objects/ab/abcdef0123...   (no extension)
+
+so identical documents are stored once, and the fetch manifest's
+``content_sha256`` doubles as the key to the cached copy.  Extraction
+opens the cached file by path, which lets PyMuPDF page through it on
+demand and lets the process pool receive a short path instead of a
+pickled copy of the whole PDF.  Re‑running extraction or chunking
+experiments (``--reextract`` / ``--offline`` on the scrapers) then needs
+no network at all.
+"""
+
+import hashlib
+import os
+import tempfile
+from typing import Optional, Tuple
+
+DEFAULT_DOC_CACHE_DIR = os.getenv(
+    "DOC_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "doc_cache"),
+)
+
+CHUNK_BYTES = 1 << 20
+
+
+class DocumentCache:
+    def __init__(self, root: str = DEFAULT_DOC_CACHE_DIR):
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self.tmp = os.path.join(root, "tmp")
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.tmp, exist_ok=True)
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.objects, sha256[:2], sha256)
+
+    def get(self, sha256: Optional[str]) -> Optional[str]:
+        """Path of the cached document with this hash, or ``None``."""
+        if not sha256:
+            return None
+        path = self.path_for(sha256)
+        return path if os.path.exists(path) else None
+
+    def store_stream(self, response) -> Tuple[str, str, int]:
+        """Stream a ``requests`` response body into the cache.
+
+        Returns ``(path, sha256, size)``.  The body is written to a temp
+        file and renamed into place, so readers never see partial files.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for block in response.iter_content(chunk_size=CHUNK_BYTES):
+                    if block:
+                        f.write(block)
+                        digest.update(block)
+                        size += len(block)
+            sha256 = digest.hexdigest()
+            path = self.path_for(sha256)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return path, sha256, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def key_of(path) -> Optional[str]:
+        """The SHA‑256 a cache path is stored under (``None`` for anything else)."""
+        if isinstance(path, str):
+            name = os.path.basename(path)
+            if len(name) == 64 and os.path.basename(os.path.dirname(path)) == name[:2]:
+                return name
+        return None
+
+    @staticmethod
+    def read_bytes(path: str) -> bytes:
+        """Read a (small) cached document such as an HTML page."""
+        with open(path, "rb") as f:
+            return f.read()
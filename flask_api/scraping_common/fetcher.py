@@ -0,0 +1,209 @@
+"""
+Pooled, concurrent HTTP fetching shared by the city scrapers.
+
+All requests go through one ``requests.Session`` so connections to a host
+are kept alive and reused instead of opening a new TLS connection for every
+page and PDF.  On top of the session the ``Fetcher`` adds:
+
+* a per-host concurrency limit (a semaphore per host name),
+* a politeness delay between the *starts* of two requests to the same host,
+* retries with exponential backoff (and ``Retry-After``) on connection
+  errors, 429 and 5xx responses,
+* counters for a progress line and an end-of-run summary.
+
+``Fetcher.map`` runs a function over many items on a thread pool, which is
+how the scrapers crawl a whole directory concurrently.
+"""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class Fetcher:
+    """Shared session with per-host limits, politeness delay and retries."""
+
+    def __init__(
+        self,
+        headers: Optional[Dict[str, str]] = None,
+        max_per_host: int = 4,
+        delay: float = 0.25,
+        retries: int = 4,
+        backoff: float = 1.0,
+        timeout: float = 60,
+    ):
+        self.max_per_host = max(1, max_per_host)
+        self.delay = max(0.0, delay)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        # Keep enough pooled connections per host for every concurrent slot
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=self.max_per_host * 2)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._host_slots: Dict[str, threading.Semaphore] = {}
+        self._host_next_start: Dict[str, float] = {}
+        self.stats = {"requests": 0, "retries": 0, "errors": 0, "bytes": 0}
+        self._started = time.monotonic()
+
+    # ---- per-host throttling -------------------------------------------
+
+    def _slot(self, host: str) -> threading.Semaphore:
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.Semaphore(self.max_per_host)
+            return self._host_slots[host]
+
+    def _wait_for_turn(self, host: str) -> None:
+        """Reserve the next start time for ``host`` and sleep until it."""
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._host_next_start.get(host, now))
+            self._host_next_start[host] = start_at + self.delay
+        if start_at > now:
+            time.sleep(start_at - now)
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    # ---- requests ------------------------------------------------------
+
+    def record_bytes(self, n: int) -> None:
+        self._count("bytes", n)
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        on_response: Optional[Callable[[requests.Response], None]] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """Send a request with throttling and retries.
+
+        Returns the final response (``raise_for_status`` is left to the
+        caller, so 304 and 404 can be handled there).  Raises the last
+        connection error if every attempt failed to connect.
+
+        ``on_response`` is called with every non‑retryable response while
+        the host slot is still held; with ``stream=True`` this is where
+        the body should be consumed (e.g. streamed to disk), so large
+        downloads also count against the per‑host limit.  A connection
+        drop while it reads the body is retried like any other.
+        """
+        host = urlparse(url).netloc
+        kwargs.setdefault("timeout", self.timeout)
+        last_error: Optional[Exception] = None
+        for attempt in range(self.retries + 1):
+            response = None
+            with self._slot(host):
+                self._wait_for_turn(host)
+                self._count("requests")
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                    if not kwargs.get("stream"):
+                        self._count("bytes", len(response.content))
+                    if on_response is not None and response.status_code not in RETRY_STATUSES:
+                        on_response(response)
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                    last_error = e
+                    if response is not None:
+                        response.close()
+                    response = None
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+            if attempt == self.retries:
+                break
+            wait = self._retry_wait(attempt, response)
+            self._count("retries")
+            logging.debug(
+                "Retrying %s in %.1fs (attempt %d, %s)",
+                url, wait, attempt + 1,
+                response.status_code if response is not None else last_error,
+            )
+            if response is not None:
+                response.close()
+            time.sleep(wait)
+        self._count("errors")
+        if response is not None:
+            return response
+        raise last_error
+
+    def _retry_wait(self, attempt: int, response: Optional[requests.Response]) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * (2 ** attempt) + random.uniform(0, self.backoff / 2)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("allow_redirects", True)
+        return self.request("HEAD", url, **kwargs)
+
+    def get_text(self, url: str) -> str:
+        """GET a page and return its text, raising ``requests.HTTPError`` on failure."""
+        response = self.get(url)
+        response.raise_for_status()
+        return response.text
+
+    def get_bytes(self, url: str) -> bytes:
+        """GET a binary document, raising ``requests.HTTPError`` on failure."""
+        response = self.get(url)
+        response.raise_for_status()
+        return response.content
+
+    # ---- concurrency helpers -------------------------------------------
+
+    def map(self, fn: Callable, items: Iterable, workers: int = 8, label: str = "items") -> List:
+        """Run ``fn`` over ``items`` on a thread pool and return results in input order.
+
+        Exceptions are logged and turn into ``None`` results so a single
+        broken by-law does not abort the crawl.  A progress line is logged
+        every few completions.
+        """
+        items = list(items)
+        results: List = [None] * len(items)
+        done = failed = 0
+        step = max(1, len(items) // 20)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(fn, item): i for i, item in enumerate(items)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    failed += 1
+                    logging.warning("Failed to process %s: %s", items[i], e)
+                done += 1
+                if done % step == 0 or done == len(items):
+                    logging.info("[%d/%d %s] %d failed, %s", done, len(items), label, failed, self.summary())
+        return results
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self._started
+        with self._lock:
+            s = dict(self.stats)
+        return (
+            f"{s['requests']} requests, {s['retries']} retries, {s['errors']} errors, "
+            f"{s['bytes'] / 1e6:.1f} MB in {elapsed:.0f}s"
+        )
+
+    def close(self) -> None:
+        self.session.close()
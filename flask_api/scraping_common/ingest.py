@@ -0,0 +1,356 @@
+"""
+One ingestion path for every city: fetch -> extract -> chunk -> embed -> write.
+
+``run_ingest`` wires a city adapter (see ``scraping_common/adapters.py``)
+into a ``Pipeline`` of bounded queues, so downloads, PDF extraction,
+chunking, embedding and Mongo writes all overlap and memory stays flat
+however many by‑laws there are.  Nothing is accumulated for a final
+``insert_many``: chunks are embedded in batches as they arrive and
+written in ``bulk_write`` batches.
+
+Writes are incremental: chunks whose ``(id, index, content_sha256)``
+already exist are neither re‑embedded nor rewritten, and chunks a
+re‑ingested by‑law no longer produces are deleted – but only once every
+new chunk of that by‑law has been embedded and written, so a failed
+embedding or upsert never leaves a by‑law with fewer chunks than before.
+
+An adapter provides:
+
+* ``id_field``, ``index_field``, ``embedding_field`` – the collection's schema,
+* ``sources()`` – an iterable of work items (dicts),
+* ``fetch(item)`` – returns the item with ``text`` or a PDF ``source`` path,
+* ``chunk(text)`` – list of ``scraping_common.chunking.Chunk`` (text + offsets),
+* ``make_doc(item, chunk, index, sha)`` – the Mongo document (minus the vector),
+* ``ensure_indexes(col)``.
+"""
+
+import hashlib
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import pymongo
+from dotenv import load_dotenv
+
+from embed_vectors import get_embedding_model
+from embedding_cache import MINILM_MODEL_NAME, EmbeddingCache, encode_cached
+from scraping_common.doc_cache import DocumentCache
+from scraping_common.pdf_extract import PdfExtractor, extract_pdf_text
+from scraping_common.pipeline import Pipeline, Stage
+from vector_codec import VECTOR_FORMATS, encode_vector
+
+
+def sha256_text(s: str) -> str:
+    return hashlib.sha256(s.encode("utf-8", errors="ignore")).hexdigest()
+
+
+def make_mongo_client() -> pymongo.MongoClient:
+    load_dotenv()
+    login = os.getenv("DATABASE_LOGIN")
+    if not login:
+        raise ValueError("DATABASE_LOGIN not set in .env (URL-encoded username:password).")
+    uri = f"mongodb+srv://{login}@gdsc2025.cn3wt5n.mongodb.net/?retryWrites=true&w=majority&appName=GDSC2025"
+    return pymongo.MongoClient(uri)
+
+
+# ---- Embedding ---------------------------------------------
+
+def _embed_one(text: str) -> Optional[List[float]]:
+    if not text or not text.strip():
+        return None
+    try:
+        return get_embedding_model().encode(text, normalize_embeddings=True).tolist()
+    except Exception as e:
+        print(f"[embed] error: {e}")
+        return None
+
+
+def embed_texts(texts: List[str], cache: Optional[EmbeddingCache]) -> List[Optional[List[float]]]:
+    # Batched, cache-first embedding; falls back to one-by-one so a bad chunk only loses itself
+    try:
+        return encode_cached(get_embedding_model(), MINILM_MODEL_NAME, texts, cache)
+    except Exception as e:
+        print(f"[embed] batch error, retrying one by one: {e}")
+        return [_embed_one(t) for t in texts]
+
+
+def make_token_chunking(target_tokens: int, overlap_tokens: int, min_tokens: int):
+    """``TokenChunking`` with the embedding model's own tokenizer, checked against its sequence limit."""
+    from scraping_common.adapters import TokenChunking
+
+    model = get_embedding_model()
+    limit = model.max_seq_length
+    if target_tokens + overlap_tokens + 2 > limit:
+        print(f"[chunk] warning: {target_tokens}+{overlap_tokens} tokens (+CLS/SEP) exceeds the model limit of {limit}; "
+              f"chunk tails will be truncated")
+    return TokenChunking(model.tokenizer, target_tokens, overlap_tokens, min_tokens)
+
+
+def open_hnsw(collection_name: str):
+    """The collection's writable HNSW index (created empty if it doesn't exist yet)."""
+    from hnsw_index import HnswIndex, index_dir
+
+    return HnswIndex(index_dir(collection_name))
+
+
+# ---- Incremental state -------------------------------------
+
+def load_existing_chunks(col, id_field: str, index_field: str) -> Dict[str, Dict[Tuple[int, str], object]]:
+    # One pass over the collection: id -> {(index, content_sha256): _id}
+    existing: Dict[str, Dict[Tuple[int, str], object]] = {}
+    projection = {"_id": 1, id_field: 1, index_field: 1, "content_sha256": 1}
+    for d in col.find({}, projection).batch_size(5000):
+        existing.setdefault(d.get(id_field), {})[(d.get(index_field), d.get("content_sha256"))] = d["_id"]
+    return existing
+
+
+# ---- Pipeline ----------------------------------------------
+
+def run_ingest(
+    adapter,
+    col,
+    incremental: bool = True,
+    cache: Optional[EmbeddingCache] = None,
+    extractor: Optional[PdfExtractor] = None,
+    fetch_workers: int = 4,
+    chunk_workers: int = 2,
+    embed_batch: int = 64,
+    write_batch: int = 64,
+    queue_size: int = 32,
+    vector_format: str = "array",
+    hnsw=None,
+) -> Dict[str, int]:
+    """Stream ``adapter.sources()`` into ``col``; returns the chunk counts.
+
+    ``vector_format`` is how vectors are stored (``vector_codec.py``): a BSON
+    array, or packed BinData ``float32``/``int8``.  With an ``hnsw``
+    (``hnsw_index.HnswIndex``), the same upserts and deletes are applied to
+    the graph index, which is checkpointed as it goes and saved at the end.
+    """
+    adapter.ensure_indexes(col)
+    existing = load_existing_chunks(col, adapter.id_field, adapter.index_field)
+    print(f"Loaded {sum(len(v) for v in existing.values())} existing chunks for {len(existing)} bylaws.")
+
+    counts = {"bylaws": 0, "skipped": 0, "added": 0, "unchanged": 0, "removed": 0, "failed": 0}
+    # bylaw id -> upserts not written yet; its stale chunks are only deleted at 0
+    unwritten: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def count(key: str, n: int = 1) -> None:
+        with lock:
+            counts[key] += n
+
+    def fetch(item: Dict) -> List[Dict]:
+        return [adapter.fetch(item)]
+
+    def extract(item: Dict) -> List[Dict]:
+        if item.get("text") is None:
+            source = item.pop("source")
+            name = item.get("bylaw_id", "")
+            if extractor is not None:
+                item["text"] = extractor.extract(source, name=name, sha256=DocumentCache.key_of(source))
+            else:
+                item["text"] = extract_pdf_text(source, name=name)
+        if not (item["text"] or "").strip():
+            print(f"[skip] empty text in: {item.get('bylaw_id')}")
+            count("skipped")
+            return []
+        return [item]
+
+    def chunk(item: Dict) -> List[Dict]:
+        text = item.pop("text")
+        chunks = adapter.chunk(text)
+        if not chunks:
+            print(f"[skip] no chunks extracted: {item.get('bylaw_id')}")
+            count("skipped")
+            return []
+        count("bylaws")
+        previous = existing.get(item["bylaw_id"], {})
+        current = set()
+        out = []
+        for i, ch in enumerate(chunks):
+            doc = adapter.make_doc(item, ch, i, sha256_text(ch.text))
+            key = (doc[adapter.index_field], doc["content_sha256"])
+            current.add(key)
+            if incremental and key in previous:
+                count("unchanged")
+                continue
+            out.append({"op": "upsert", "bylaw_id": item["bylaw_id"], "doc": doc})
+        with lock:
+            unwritten[item["bylaw_id"]] = len(out)
+        # after the upserts: stage order is preserved, so write() sees it last
+        stale = [(key, _id) for key, _id in previous.items() if key not in current]
+        if stale:
+            out.append({
+                "op": "delete",
+                "bylaw_id": item["bylaw_id"],
+                "ids": [_id for _, _id in stale],
+                "keys": [(item["bylaw_id"],) + key for key, _ in stale],
+            })
+        return out
+
+    def embed(records: List[Dict]) -> List[Dict]:
+        upserts = [r for r in records if r["op"] == "upsert"]
+        vectors = iter(embed_texts([r["doc"]["chunk_text"] for r in upserts], cache))
+        out = []
+        for r in records:
+            if r["op"] == "upsert":
+                doc, vec = r["doc"], next(vectors)
+                if vec is None:
+                    print(f"[warn] embedding failed for {doc[adapter.id_field]}#{doc[adapter.index_field]}, skipping")
+                    count("failed")
+                    continue
+                doc[adapter.embedding_field] = encode_vector(vec, vector_format)
+                r["vector"] = vec
+            out.append(r)
+        return out
+
+    def write(records: List[Dict]) -> List:
+        upserts = [r for r in records if r["op"] == "upsert"]
+        failed = set()
+        if upserts:
+            ops = [
+                pymongo.UpdateOne(
+                    {
+                        adapter.id_field: r["doc"][adapter.id_field],
+                        adapter.index_field: r["doc"][adapter.index_field],
+                        "content_sha256": r["doc"]["content_sha256"],
+                    },
+                    {"$set": r["doc"]},
+                    upsert=True,
+                )
+                for r in upserts
+            ]
+            try:
+                col.bulk_write(ops, ordered=False)
+            except pymongo.errors.BulkWriteError as bwe:
+                print(f"[bulk] write error: {bwe.details}")
+                failed = {e["index"] for e in bwe.details.get("writeErrors", [])}
+        written = [r for i, r in enumerate(upserts) if i not in failed]
+        count("added", len(written))
+        count("failed", len(failed))
+
+        deletes = []
+        with lock:
+            for r in written:
+                unwritten[r["bylaw_id"]] -= 1
+            for r in records:
+                if r["op"] != "delete":
+                    continue
+                if unwritten.get(r["bylaw_id"]):
+                    print(f"[warn] {unwritten[r['bylaw_id']]} new chunks of {r['bylaw_id']} were not written, "
+                          f"keeping its {len(r['ids'])} old ones")
+                    continue
+                deletes.append(r)
+        if deletes:
+            try:
+                col.bulk_write([pymongo.DeleteMany({"_id": {"$in": r["ids"]}}) for r in deletes], ordered=False)
+            except pymongo.errors.BulkWriteError as bwe:
+                print(f"[bulk] delete error: {bwe.details}")
+                deletes = []
+            count("removed", sum(len(r["ids"]) for r in deletes))
+        if hnsw is not None:
+            update_hnsw(written, deletes)
+        return []
+
+    def update_hnsw(upserts: List[Dict], deletes: List[Dict]) -> None:
+        from hnsw_index import chunk_key
+
+        hnsw.upsert(
+            [chunk_key(r["doc"][adapter.id_field], r["doc"][adapter.index_field], r["doc"]["content_sha256"])
+             for r in upserts],
+            [r["doc"][adapter.id_field] for r in upserts],
+            [r["vector"] for r in upserts],
+            [r["doc"] for r in upserts],
+        )
+        for r in deletes:
+            hnsw.delete([chunk_key(*key) for key in r["keys"]])
+        hnsw.checkpoint()
+
+    pipeline = Pipeline([
+        Stage("fetch", fetch, workers=fetch_workers),
+        # one thread per extraction process keeps the pool busy
+        Stage("extract", extract, workers=extractor.workers if extractor is not None else 1),
+        Stage("chunk", chunk, workers=chunk_workers),
+        Stage("embed", embed, batch_size=embed_batch, queue_size=embed_batch * 4),
+        Stage("write", write, batch_size=write_batch, queue_size=write_batch * 4),
+    ], queue_size=queue_size)
+    pipeline.run(adapter.sources())
+
+    print(pipeline.report())
+    if hnsw is not None:
+        hnsw.save()
+        print(f"HNSW index: {hnsw.count()} chunks")
+    if cache is not None:
+        print(cache.report())
+    print(
+        f"Done. Ingested {counts['bylaws']} bylaws ({counts['skipped']} skipped); "
+        f"added/updated {counts['added']}, unchanged {counts['unchanged']}, "
+        f"removed {counts['removed']}, failed {counts['failed']} chunks."
+    )
+    return counts
+
+
+def insert_bylaws_main(adapter_cls, description: str = "Chunk, embed (CPU), and ingest bylaws into MongoDB Atlas.") -> None:
+    """Command line shared by the Waterloo and Guelph ``insert_bylaws.py`` scripts."""
+    import argparse
+    from pathlib import Path
+
+    ap = argparse.ArgumentParser(description=description)
+    ap.add_argument("--db", required=True, help="Database name, e.g., bylaws")
+    ap.add_argument("--collection", required=True, help="Collection name, e.g., waterloo")
+    ap.add_argument("--city", required=True, help="City label for metadata, e.g., Waterloo")
+    ap.add_argument("--input", required=True, help="Folder with .json/.txt bylaw files")
+    ap.add_argument("--chunk", type=int, default=1000, help="Target chunk size in characters (default 1000)")
+    ap.add_argument("--overlap", type=int, default=150, help="Overlap size in characters (default 150)")
+    ap.add_argument("--minchunk", type=int, default=600, help="Minimum chunk size before forcing split (default 600)")
+    ap.add_argument("--chunk-mode", choices=["chars", "tokens"], default="chars",
+                    help="Size chunks in characters or in embedding-model tokens (default chars)")
+    ap.add_argument("--chunk-tokens", type=int, default=200, help="Target chunk size in tokens (default 200)")
+    ap.add_argument("--overlap-tokens", type=int, default=32, help="Overlap in tokens (default 32)")
+    ap.add_argument("--min-tokens", type=int, default=100, help="Minimum chunk size in tokens (default 100)")
+    ap.add_argument("--batch", type=int, default=64, help="Bulk write batch size (default 64)")
+    ap.add_argument("--embed-batch", type=int, default=64, help="Chunks per embedding batch (default 64)")
+    ap.add_argument("--queue-size", type=int, default=32, help="Max items waiting between pipeline stages (default 32)")
+    ap.add_argument("--vector-format", choices=VECTOR_FORMATS, default="array",
+                    help="Store vectors as a BSON array or packed BinData float32/int8 (default array)")
+    ap.add_argument("--full", action="store_true", help="Re-embed every chunk, not only new or changed ones")
+    ap.add_argument("--no-cache", action="store_true", help="Don't use the local embedding cache")
+    ap.add_argument("--hnsw", action="store_true",
+                    help="Also add/tombstone the chunks in the collection's HNSW index (hnsw_index.py)")
+    args = ap.parse_args()
+
+    input_dir = Path(args.input).resolve()
+    if not input_dir.exists():
+        raise FileNotFoundError(f"Input dir not found: {input_dir}")
+
+    adapter = adapter_cls(
+        args.city,
+        input_dir,
+        target_chunk_chars=args.chunk,
+        overlap_chars=args.overlap,
+        min_chunk_chars=args.minchunk,
+        token_chunking=(
+            make_token_chunking(args.chunk_tokens, args.overlap_tokens, args.min_tokens)
+            if args.chunk_mode == "tokens" else None
+        ),
+    )
+    client = make_mongo_client()
+    cache = None if args.no_cache else EmbeddingCache()
+    hnsw = open_hnsw(args.collection) if args.hnsw else None
+    try:
+        run_ingest(
+            adapter,
+            client[args.db][args.collection],
+            incremental=not args.full,
+            cache=cache,
+            embed_batch=args.embed_batch,
+            write_batch=args.batch,
+            queue_size=args.queue_size,
+            vector_format=args.vector_format,
+            hnsw=hnsw,
+        )
+    finally:
+        client.close()
+        if cache is not None:
+            cache.close()
@@ -0,0 +1,153 @@
+"""
+Per-URL fetch manifest for incremental scrapes.
+
+The manifest is a JSON file (``.fetch_manifest.json`` inside a scraper's
+output directory) that remembers, for every page and PDF fetched:
+
+* ``etag`` and ``last_modified`` as sent by the server,
+* ``content_sha256`` of the raw bytes,
+* ``fetched_at`` (when the content last changed) and ``checked_at``,
+* anything the scraper wants to attach (e.g. the PDF linked from a page
+  or the JSON file the by‑law was saved to).
+
+``conditional_download`` replays the stored validators as ``If-None-Match`` /
+``If-Modified-Since`` so unchanged documents come back as a bodiless 304.
+Servers that ignore validators still get caught by the content hash.
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+MANIFEST_NAME = ".fetch_manifest.json"
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FetchManifest:
+    """Thread-safe ``url -> metadata`` map persisted as JSON."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except Exception as e:
+                logging.warning("Ignoring unreadable manifest %s: %s", path, e)
+
+    @classmethod
+    def for_output_dir(cls, output_dir: str) -> "FetchManifest":
+        return cls(os.path.join(output_dir, MANIFEST_NAME))
+
+    def get(self, url: str) -> Dict:
+        with self._lock:
+            return dict(self.entries.get(url, {}))
+
+    def update(self, url: str, **fields) -> None:
+        with self._lock:
+            self.entries.setdefault(url, {}).update(fields)
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        entry = self.get(url)
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def save(self) -> None:
+        """Write the manifest atomically (temp file + rename)."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def conditional_download(
+    fetcher,
+    manifest: Optional[FetchManifest],
+    cache,
+    url: str,
+    force: bool = False,
+    reextract: bool = False,
+    offline: bool = False,
+) -> Optional[str]:
+    """GET ``url`` into a ``DocumentCache`` unless it is unchanged since the last recorded fetch.
+
+    Returns the path of the cached document when it is new or changed,
+    and ``None`` when it is unchanged.  With ``reextract`` unchanged
+    documents return their cached path too (re‑run extraction without
+    re‑downloading); with ``offline`` no request is made at all and the
+    cached copy recorded in the manifest is returned (``FileNotFoundError``
+    if there is none).
+    """
+    previous = manifest.get(url) if manifest is not None else {}
+    cached_path = cache.get(previous.get("content_sha256"))
+    if offline:
+        if cached_path is None:
+            raise FileNotFoundError(f"{url} is not in the document cache")
+        return cached_path
+
+    headers = {}
+    if manifest is not None and not force and cached_path is not None:
+        # only ask for a 304 when there is a cached copy to fall back on
+        headers = manifest.conditional_headers(url)
+
+    stored = {}
+
+    def consume(response) -> None:
+        if response.status_code == 200:
+            stored["path"], stored["sha256"], stored["size"] = cache.store_stream(response)
+
+    response = fetcher.get(url, headers=headers, stream=True, on_response=consume)
+    checked_at = now_iso()
+    try:
+        if response.status_code == 304:
+            if manifest is not None:
+                manifest.update(url, checked_at=checked_at)
+            logging.debug("Not modified: %s", url)
+            return cached_path if reextract else None
+        response.raise_for_status()
+        fetcher.record_bytes(stored["size"])
+    finally:
+        response.close()
+
+    unchanged = not force and previous.get("content_sha256") == stored["sha256"]
+    if manifest is not None:
+        manifest.update(
+            url,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            content_sha256=stored["sha256"],
+            size=stored["size"],
+            checked_at=checked_at,
+            fetched_at=previous.get("fetched_at") if unchanged else checked_at,
+        )
+    if unchanged and not reextract:
+        logging.debug("Unchanged content: %s", url)
+        return None
+    return stored["path"]
+
+
+def ocr_incomplete(manifest: Optional[FetchManifest], url: str) -> bool:
+    """True when the last extraction of a PDF left scanned pages without OCR text, so it must be re-extracted."""
+    return manifest is not None and bool(manifest.get(url).get("ocr_incomplete"))
+
+
+def output_missing(manifest: Optional[FetchManifest], url: str) -> bool:
+    """True when the file a URL was last saved to is gone, so it must be refetched."""
+    if manifest is None:
+        return True
+    output_file = manifest.get(url).get("output_file")
+    return not output_file or not os.path.exists(output_file)
@@ -0,0 +1,151 @@
+"""
+OCR fallback for PDF pages that have no text layer.
+
+Some by‑laws (Guelph's accessible parking and outside water use by‑laws,
+for example) are published as scans, so text extraction returns nothing
+and they never make it into retrieval.  This module renders such pages
+with PyMuPDF and reads them with Tesseract (via ``pytesseract``).
+
+* A page is OCR'd only when it has no extractable text but does contain
+  images.
+* Results are cached per ``(sha256 of the PDF, page number, dpi, lang)``
+  in an SQLite file, so re‑runs never OCR an unchanged page twice.
+* Work is bounded by the caller (see ``PdfExtractor``): pages run on the
+  extraction process pool, each page has a Tesseract timeout, and a
+  document has a maximum page count and time budget.
+
+Install the optional dependencies with::
+
+    pip install pytesseract pillow
+    apt-get install tesseract-ocr   # or: brew install tesseract
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:  # OCR is optional
+    pytesseract = None
+    Image = None
+
+# Keep each Tesseract process single-threaded; parallelism comes from the pool
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+DEFAULT_OCR_CACHE_PATH = os.getenv(
+    "OCR_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ocr_cache", "ocr.sqlite3"),
+)
+
+MIN_TEXT_CHARS = 20  # fewer extracted characters than this counts as "no text layer"
+
+
+def ocr_available() -> bool:
+    if pytesseract is None:
+        return False
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def _open_doc(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    # cached documents are stored without an extension
+    return fitz.open(source, filetype="pdf")
+
+
+def source_sha256(source) -> str:
+    """SHA‑256 of PDF bytes or of the file at a path."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pages_needing_ocr(source, page_texts: List[str]) -> List[int]:
+    """Indices of pages with (almost) no text that contain at least one image."""
+    empty = [i for i, t in enumerate(page_texts) if len((t or "").strip()) < MIN_TEXT_CHARS]
+    if not empty:
+        return []
+    with _open_doc(source) as doc:
+        return [i for i in empty if i < doc.page_count and doc[i].get_images()]
+
+
+def ocr_page(source, page_index: int, dpi: int = 200, lang: str = "eng", timeout: int = 60) -> Tuple[int, Optional[str], float]:
+    """Render one page and OCR it.  Returns ``(page_index, text, seconds)``.
+
+    Runs in pool workers, so it must stay a module‑level function.  A
+    Tesseract timeout or error yields ``None`` so the page is retried
+    (rather than cached as empty) on the next run.
+    """
+    began = time.perf_counter()
+    try:
+        with _open_doc(source) as doc:
+            pix = doc[page_index].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+            image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+        text = pytesseract.image_to_string(image, lang=lang, timeout=timeout)
+    except Exception as e:
+        logging.warning("OCR failed on page %d: %s", page_index + 1, e)
+        text = None
+    return page_index, text, time.perf_counter() - began
+
+
+class OcrCache:
+    """``(pdf sha256, page, dpi, lang) -> text`` store shared by all runs."""
+
+    def __init__(self, path: str = DEFAULT_OCR_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_pages ("
+            " pdf_sha256 TEXT NOT NULL,"
+            " page INTEGER NOT NULL,"
+            " dpi INTEGER NOT NULL,"
+            " lang TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " PRIMARY KEY (pdf_sha256, page, dpi, lang)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, pdf_sha: str, pages: Iterable[int], dpi: int, lang: str) -> Dict[int, str]:
+        pages = set(pages)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, text FROM ocr_pages WHERE pdf_sha256 = ? AND dpi = ? AND lang = ?",
+                (pdf_sha, dpi, lang),
+            ).fetchall()
+        found = {page: text for page, text in rows if page in pages}
+        self.hits += len(found)
+        self.misses += len(pages) - len(found)
+        return found
+
+    def put(self, pdf_sha: str, page: int, dpi: int, lang: str, text: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_pages VALUES (?, ?, ?, ?, ?)",
+                (pdf_sha, page, dpi, lang, text),
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,268 @@
+"""
+Shared PDF text extraction for the scrapers.
+
+PyMuPDF (``fitz``) is the fast path; pdfplumber is only used when PyMuPDF
+cannot open or read a document.  Page texts are collected in a list and
+joined once instead of being appended to a growing string.
+
+``PdfExtractor`` farms the work out to a process pool so extraction runs
+on every core while the fetch threads keep downloading.  Large PDFs are
+split into page ranges so one 300‑page by‑law does not keep a single
+worker busy while the others sit idle.  Each document's extraction time
+is logged.
+
+Pages without a text layer (scans) are OCR'd on the same pool when
+Tesseract is available; see ``scraping_common/ocr.py``.
+"""
+
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import List, Optional, Set, Tuple, Union
+
+import fitz  # PyMuPDF
+
+from scraping_common import ocr
+
+PdfSource = Union[bytes, str]  # raw bytes or a path on disk
+
+
+def _open_fitz(source: PdfSource):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    # a path; cached documents are stored without an extension
+    return fitz.open(source, filetype="pdf")
+
+
+def _open_plumber(source: PdfSource):
+    import pdfplumber  # only needed on the fallback path
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return pdfplumber.open(io.BytesIO(source))
+    return pdfplumber.open(source)
+
+
+def page_count(source: PdfSource) -> int:
+    """Number of pages, or 0 if PyMuPDF cannot open the document."""
+    try:
+        with _open_fitz(source) as doc:
+            return doc.page_count
+    except Exception:
+        return 0
+
+
+def extract_page_range(source: PdfSource, start: int = 0, end: Optional[int] = None) -> Tuple[List[str], str, float]:
+    """Extract pages ``[start, end)`` and return ``(page_texts, engine, seconds)``.
+
+    Runs in pool workers, so it must stay a module‑level function.
+    """
+    began = time.perf_counter()
+    try:
+        with _open_fitz(source) as doc:
+            end = doc.page_count if end is None else min(end, doc.page_count)
+            pages = [doc[i].get_text() or "" for i in range(start, end)]
+        return pages, "pymupdf", time.perf_counter() - began
+    except Exception as e:
+        logging.debug("PyMuPDF failed (%s), falling back to pdfplumber", e)
+    try:
+        with _open_plumber(source) as pdf:
+            end = len(pdf.pages) if end is None else min(end, len(pdf.pages))
+            pages = [pdf.pages[i].extract_text() or "" for i in range(start, end)]
+        return pages, "pdfplumber", time.perf_counter() - began
+    except Exception as e:
+        logging.warning("Failed to parse PDF pages %d-%s: %s", start, end, e)
+        return [], "failed", time.perf_counter() - began
+
+
+def join_pages(pages: List[str]) -> str:
+    return "\n".join(p.strip() for p in pages if p and p.strip())
+
+
+def extract_pdf_text(source: PdfSource, name: str = "") -> str:
+    """Extract a whole PDF in the current process."""
+    pages, engine, seconds = extract_page_range(source)
+    text = join_pages(pages)
+    logging.info("Extracted %s: %d pages, %d chars in %.2fs (%s)", name or "PDF", len(pages), len(text), seconds, engine)
+    return text
+
+
+class PdfExtractor:
+    """Process‑pool PDF extraction that can be called from many threads.
+
+    ``extract`` blocks the calling thread until the document's page
+    ranges have been extracted by the pool, so a scraper's fetch
+    threads can each hand their PDF over and wait for the text.
+
+    With ``use_ocr`` (and Tesseract installed) scanned pages are OCR'd
+    on the same pool.  OCR is bounded per document by ``max_ocr_pages``
+    and ``ocr_budget`` seconds, and per page by ``ocr_page_timeout``
+    (the Tesseract timeout, cut to what is left of the budget).  Pages
+    that don't make it stay empty for this run; ``ocr_incomplete(name)``
+    tells the caller so it can re-extract the document next time.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        pages_per_task: int = 40,
+        use_ocr: bool = True,
+        ocr_dpi: int = 200,
+        ocr_lang: str = "eng",
+        ocr_page_timeout: int = 60,
+        max_ocr_pages: int = 60,
+        ocr_budget: float = 300,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.pages_per_task = max(1, pages_per_task)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.timings: List[Tuple[str, float]] = []
+
+        self.use_ocr = use_ocr and ocr.ocr_available()
+        if use_ocr and not self.use_ocr:
+            logging.warning("Tesseract/pytesseract not available; scanned pages will stay empty")
+        self.ocr_cache = ocr.OcrCache() if self.use_ocr else None
+        self.ocr_dpi = ocr_dpi
+        self.ocr_lang = ocr_lang
+        self.ocr_page_timeout = ocr_page_timeout
+        self.max_ocr_pages = max_ocr_pages
+        self.ocr_budget = ocr_budget
+        self.ocr_pages_done = 0
+        self._ocr_incomplete: Set[str] = set()
+        self._lock = threading.Lock()  # extract() is called from many fetch threads
+
+    def extract(self, source: PdfSource, name: str = "", sha256: Optional[str] = None) -> str:
+        """Extract ``source`` (bytes or a path) and return its text.
+
+        Pass ``sha256`` when the caller already knows the document hash
+        (e.g. from the document cache) to save rehashing it for OCR.
+        Paths are preferred: workers open the file themselves instead of
+        receiving a pickled copy of the PDF for every page range.
+        """
+        began = time.perf_counter()
+        n_pages = page_count(source)
+        if n_pages <= self.pages_per_task:
+            ranges = [(0, None)]
+        else:
+            ranges = [(s, s + self.pages_per_task) for s in range(0, n_pages, self.pages_per_task)]
+
+        futures = [self._pool.submit(extract_page_range, source, s, e) for s, e in ranges]
+        pages: List[str] = []
+        engines = set()
+        cpu_seconds = 0.0
+        for future in futures:
+            part, engine, seconds = future.result()
+            pages.extend(part)
+            engines.add(engine)
+            cpu_seconds += seconds
+
+        if self.use_ocr and pages:
+            ocr_seconds, left = self._ocr_missing_pages(source, pages, name, sha256)
+            if left:
+                with self._lock:
+                    self._ocr_incomplete.add(name)
+            if ocr_seconds:
+                engines.add("ocr")
+                cpu_seconds += ocr_seconds
+        text = join_pages(pages)
+
+        wall = time.perf_counter() - began
+        self.timings.append((name, wall))
+        logging.info(
+            "Extracted %s: %d pages in %d task(s), %d chars, %.2fs wall / %.2fs worker (%s)",
+            name or "PDF", len(pages), len(ranges), len(text), wall, cpu_seconds, "+".join(sorted(engines)),
+        )
+        return text
+
+    def ocr_incomplete(self, name: str) -> bool:
+        """Whether the last ``extract`` of ``name`` left scanned pages without OCR text (clears the flag)."""
+        with self._lock:
+            if name in self._ocr_incomplete:
+                self._ocr_incomplete.discard(name)
+                return True
+            return False
+
+    def _ocr_missing_pages(
+        self, source: PdfSource, pages: List[str], name: str, pdf_sha: Optional[str] = None
+    ) -> Tuple[float, int]:
+        """Fill empty scanned pages in ``pages`` from the OCR cache or the pool.
+
+        Returns worker seconds spent on OCR and the number of scanned
+        pages still without text.
+        """
+        try:
+            missing = ocr.pages_needing_ocr(source, pages)
+        except Exception as e:
+            logging.warning("Could not inspect %s for OCR: %s", name, e)
+            return 0.0, 0
+        if not missing:
+            return 0.0, 0
+
+        pdf_sha = pdf_sha or ocr.source_sha256(source)
+        cached = self.ocr_cache.get_many(pdf_sha, missing, self.ocr_dpi, self.ocr_lang)
+        for i, page_text in cached.items():
+            pages[i] = page_text
+        todo = [i for i in missing if i not in cached]
+        skipped = 0
+        if len(todo) > self.max_ocr_pages:
+            logging.warning("%s: %d scanned pages, OCR limited to the first %d", name, len(todo), self.max_ocr_pages)
+            skipped = len(todo) - self.max_ocr_pages
+            todo = todo[: self.max_ocr_pages]
+        if not todo:
+            return 0.0, skipped
+
+        # Pages are submitted one per free worker, never ahead: a running task can't be
+        # cancelled, so each gets a Tesseract timeout no longer than the budget left
+        deadline = time.monotonic() + self.ocr_budget
+        queued = list(reversed(todo))
+        pending = set()
+        seconds = 0.0
+        done_pages = 0
+        while queued or pending:
+            remaining = deadline - time.monotonic()
+            while queued and len(pending) < self.workers and remaining >= 1:
+                timeout = int(min(self.ocr_page_timeout, remaining))
+                pending.add(self._pool.submit(ocr.ocr_page, source, queued.pop(), self.ocr_dpi, self.ocr_lang, timeout))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, page_text, took = future.result()
+                seconds += took
+                if page_text is None:
+                    continue
+                pages[i] = page_text
+                self.ocr_cache.put(pdf_sha, i, self.ocr_dpi, self.ocr_lang, page_text)
+                done_pages += 1
+        with self._lock:
+            self.ocr_pages_done += done_pages
+        left = len(todo) - done_pages
+        if queued:
+            logging.warning("%s: OCR budget of %.0fs exhausted", name, self.ocr_budget)
+        if left:
+            logging.warning("%s: %d scanned page(s) left without text for the next run", name, left)
+        logging.info("%s: OCR'd %d page(s), %d from cache", name, done_pages, len(cached))
+        return seconds, left + skipped
+
+    def summary(self) -> str:
+        if not self.timings:
+            return "no PDFs extracted"
+        total = sum(t for _, t in self.timings)
+        slowest_name, slowest = max(self.timings, key=lambda t: t[1])
+        return (
+            f"{len(self.timings)} PDFs extracted in {total:.1f}s total "
+            f"(avg {total / len(self.timings):.2f}s, slowest {slowest:.2f}s: {slowest_name})"
+            + (f", {self.ocr_pages_done} pages OCR'd" if self.use_ocr else "")
+        )
+
+    def close(self) -> None:
+        self._pool.shutdown(cancel_futures=True)
+        if self.ocr_cache is not None:
+            self.ocr_cache.close()
+
+    def __enter__(self) -> "PdfExtractor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
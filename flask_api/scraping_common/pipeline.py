@@ -0,0 +1,193 @@
+"""
+Streaming stage pipeline used by ingestion.
+
+A ``Pipeline`` is a list of ``Stage``s connected by bounded
+``queue.Queue``s::
+
+    source -> [fetch] -> q -> [extract] -> q -> [chunk] -> q -> [embed] -> q -> [write]
+
+Every stage runs its own pool of threads, so each step gets its own
+parallelism (a few fetch threads, one thread per extraction process, a
+single embedding thread feeding the model full batches, ...).  Queues
+are bounded: when the writer falls behind, the embedder blocks on
+``put``, then the chunker, and so on back to the source, so memory stays
+constant no matter how large the corpus is.
+
+A stage function takes one item (or a list of up to ``batch_size``
+items for batched stages) and returns an iterable of output items;
+returning ``None`` or an empty list drops the item.  Exceptions are
+logged and counted and only lose the item that raised them.
+
+``Pipeline.run`` returns per-stage ``StageStats`` (items in/out, errors,
+busy time and throughput) and ``Pipeline.report`` formats them.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+_DONE = object()  # end-of-stream marker, one per downstream worker
+
+
+class StageStats:
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.busy = 0.0          # summed over workers
+        self.blocked = 0.0       # time spent waiting to hand results downstream
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def add(self, items_in: int, items_out: int, busy: float, blocked: float, error: bool = False) -> None:
+        with self._lock:
+            self.items_in += items_in
+            self.items_out += items_out
+            self.busy += busy
+            self.blocked += blocked
+            self.errors += int(error)
+
+    @property
+    def wall(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    def summary(self) -> str:
+        wall = self.wall or 1e-9
+        return (
+            f"{self.name:<8} x{self.workers:<2} in={self.items_in:<6} out={self.items_out:<6} "
+            f"err={self.errors:<3} {self.items_in / wall:7.1f} items/s  "
+            f"busy {100 * self.busy / (wall * self.workers):3.0f}%  "
+            f"blocked {100 * self.blocked / (wall * self.workers):3.0f}%"
+        )
+
+
+class Stage:
+    """One step of a ``Pipeline``.
+
+    ``fn`` maps an item (or, with ``batch_size`` > 1, a list of items) to
+    an iterable of output items.  Batched stages hand ``fn`` whatever has
+    arrived after ``max_wait`` seconds rather than waiting for a full
+    batch, so a slow upstream stage doesn't stall them.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable,
+        workers: int = 1,
+        batch_size: int = 1,
+        max_wait: float = 0.5,
+        queue_size: Optional[int] = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self.queue_size = queue_size
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage], queue_size: int = 32):
+        if not stages:
+            raise ValueError("a pipeline needs at least one stage")
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats: Dict[str, StageStats] = {s.name: StageStats(s.name, s.workers) for s in stages}
+
+    def run(self, items: Iterable) -> Dict[str, StageStats]:
+        """Push ``items`` through every stage and block until all are done."""
+        # queues[i] feeds stages[i]; the last stage's output is discarded
+        queues = [queue.Queue(maxsize=s.queue_size or self.queue_size) for s in self.stages]
+        threads: List[threading.Thread] = []
+        for i, stage in enumerate(self.stages):
+            out_q = queues[i + 1] if i + 1 < len(self.stages) else None
+            downstream = self.stages[i + 1].workers if out_q is not None else 0
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for n in range(stage.workers):
+                t = threading.Thread(
+                    target=self._worker,
+                    args=(stage, queues[i], out_q, downstream, remaining, lock),
+                    name=f"{stage.name}-{n}",
+                    daemon=True,
+                )
+                t.start()
+                threads.append(t)
+
+        first = self.stages[0]
+        try:
+            for item in items:
+                queues[0].put(item)
+        finally:
+            for _ in range(first.workers):
+                queues[0].put(_DONE)
+        for t in threads:
+            t.join()
+        return self.stats
+
+    def _worker(self, stage: Stage, in_q: queue.Queue, out_q: Optional[queue.Queue],
+                downstream: int, remaining: List[int], lock: threading.Lock) -> None:
+        stats = self.stats[stage.name]
+        with lock:
+            if stats.started is None:
+                stats.started = time.monotonic()
+        done = False
+        while not done:
+            batch, done = self._take(stage, in_q)
+            if not batch:
+                continue
+            began = time.monotonic()
+            error = False
+            try:
+                outputs = stage.fn(batch if stage.batch_size > 1 else batch[0]) or []
+                outputs = list(outputs)
+            except Exception as e:
+                logging.warning("[%s] failed on %d item(s): %s", stage.name, len(batch), e)
+                outputs, error = [], True
+            busy = time.monotonic() - began
+            blocked_from = time.monotonic()
+            if out_q is not None:
+                for out in outputs:
+                    out_q.put(out)  # blocks when the next stage is behind
+            stats.add(len(batch), len(outputs), busy, time.monotonic() - blocked_from, error)
+
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+            if last:
+                stats.finished = time.monotonic()
+        if last and out_q is not None:
+            for _ in range(downstream):
+                out_q.put(_DONE)
+
+    @staticmethod
+    def _take(stage: Stage, in_q: queue.Queue):
+        """Collect up to ``batch_size`` items; returns ``(items, saw_end_marker)``."""
+        first = in_q.get()
+        if first is _DONE:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + stage.max_wait
+        while len(batch) < stage.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = in_q.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def report(self) -> str:
+        return "\n".join(self.stats[s.name].summary() for s in self.stages)
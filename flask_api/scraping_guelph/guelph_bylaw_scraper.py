@@ -19,35 +19,47 @@ The scraper performs the following steps:
   by‑law PDF links.
 * For each link, extract the bylaw title and attempt to parse the
   bylaw number and year from the surrounding cell text.
-* Download each PDF and extract its text using pdfplumber.
+* Download each PDF and extract its text with PyMuPDF (pdfplumber as a
+  fallback) on a process pool.
 * Compute a SHA‑256 hash of the extracted text for change detection.
+* Remember each PDF's ``ETag``/``Last‑Modified``/content hash in a fetch
+  manifest (``.fetch_manifest.json`` in the output directory) and send
+  conditional requests on re‑runs, so unchanged PDFs are skipped.
+* Stream each PDF into a content‑addressed document cache on disk
+  (``scraping_common/doc_cache.py``) and extract from the cached file;
+  ``--reextract``/``--offline`` re‑run extraction from the cache.
 * Save each bylaw as a JSON file containing metadata and the
   extracted text.  Filenames are derived from slugified titles.
 
 Dependencies:
 
-    pip install requests beautifulsoup4 pdfplumber python-dateutil
+    pip install requests beautifulsoup4 PyMuPDF pdfplumber python-dateutil
 
 Usage:
 
-    python guelph_bylaw_scraper.py --output ./guelph_bylaws
+    python guelph_bylaw_scraper.py --output ./guelph_bylaws --workers 8 --per-host 4 --delay 0.25
 
 """
 
 import argparse
 import hashlib
-import io
 import json
 import logging
 import os
 import re
+import sys
 from datetime import datetime, timezone
 from typing import Dict, List, Optional
 
-import requests
 from bs4 import BeautifulSoup
 from dateutil import parser as date_parser
-import pdfplumber
+
+# make flask_api/ importable when this file is run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraping_common.fetcher import Fetcher
+from scraping_common.pdf_extract import PdfExtractor, extract_pdf_text as extract_pdf_bytes
+from scraping_common.doc_cache import DocumentCache
+from scraping_common.manifest import FetchManifest, conditional_download, ocr_incomplete, output_missing
 
 # Constants
 BASE_URL = "https://guelph.ca"
@@ -64,15 +76,33 @@ HEADERS = {
 }
 
 
+_fetcher: Optional[Fetcher] = None
+_extractor: Optional[PdfExtractor] = None  # set while scrape_bylaws runs
+_doc_cache: Optional[DocumentCache] = None
+
+
+def get_fetcher() -> Fetcher:
+    """Return the module's shared ``Fetcher``, creating it on first use."""
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = Fetcher(HEADERS)
+    return _fetcher
+
+
+def get_doc_cache() -> DocumentCache:
+    global _doc_cache
+    if _doc_cache is None:
+        _doc_cache = DocumentCache()
+    return _doc_cache
+
+
 def fetch_page(url: str) -> str:
     """Fetch the content of a web page using a browser‑like user agent.
 
     Raises ``requests.HTTPError`` on failure.
     """
     logging.debug("Fetching %s", url)
-    response = requests.get(url, headers=HEADERS, timeout=30)
-    response.raise_for_status()
-    return response.text
+    return get_fetcher().get_text(url)
 
 
 def find_bylaw_links(directory_html: str) -> List[Dict[str, str]]:
@@ -121,29 +151,25 @@ def find_bylaw_links(directory_html: str) -> List[Dict[str, str]]:
     return unique
 
 
-def extract_pdf_text(pdf_url: str) -> str:
-    """Download a PDF and extract its text using pdfplumber.
+def extract_pdf_text(pdf_url: str, source: Optional[str] = None) -> str:
+    """Download a PDF and extract its text (PyMuPDF, pdfplumber fallback).
 
-    Returns an empty string on error.  Because many Guelph bylaws
-    contain scanned text, this function may return an empty string.
-    Consider adding OCR (pytesseract) if needed.
+    ``source`` (a document cache path) skips the download when the PDF
+    is already cached; otherwise it is streamed into the cache first.
+    Returns an empty string on error.  Many Guelph bylaws are scans;
+    while ``scrape_bylaws`` runs their pages are OCR'd (pytesseract) by
+    the extraction pool, otherwise this may return an empty string.
     """
-    logging.debug("Downloading PDF %s", pdf_url)
-    try:
-        resp = requests.get(pdf_url, headers=HEADERS, timeout=60)
-        resp.raise_for_status()
-    except Exception as e:
-        logging.warning("Failed to download %s: %s", pdf_url, e)
-        return ""
-    text = ""
-    try:
-        with pdfplumber.open(io.BytesIO(resp.content)) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text() or ""
-                text += page_text + "\n"
-    except Exception as e:
-        logging.warning("Failed to parse %s: %s", pdf_url, e)
-    return text.strip()
+    if source is None:
+        logging.debug("Downloading PDF %s", pdf_url)
+        try:
+            source = conditional_download(get_fetcher(), None, get_doc_cache(), pdf_url)
+        except Exception as e:
+            logging.warning("Failed to download %s: %s", pdf_url, e)
+            return ""
+    if _extractor is not None:
+        return _extractor.extract(source, name=pdf_url, sha256=DocumentCache.key_of(source))
+    return extract_pdf_bytes(source, name=pdf_url)
 
 
 def slugify(value: str) -> str:
@@ -153,8 +179,8 @@ def slugify(value: str) -> str:
     return value.lower()
 
 
-def save_bylaw_data(data: Dict[str, object], output_dir: str) -> None:
-    """Save the by‑law metadata and text as a JSON file."""
+def save_bylaw_data(data: Dict[str, object], output_dir: str) -> str:
+    """Save the by‑law metadata and text as a JSON file and return its path."""
     title = data.get("title") or "untitled_bylaw"
     slug = slugify(title)
     os.makedirs(output_dir, exist_ok=True)
@@ -162,20 +188,56 @@ def save_bylaw_data(data: Dict[str, object], output_dir: str) -> None:
     with open(path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
     logging.info("Saved %s", path)
-
-
-def scrape_bylaws(output_dir: str) -> None:
-    """Scrape the Guelph bylaw directory and save each bylaw."""
+    return path
+
+
+def scrape_bylaws(
+    output_dir: str,
+    workers: int = 8,
+    max_per_host: int = 4,
+    delay: float = 0.25,
+    full: bool = False,
+    extract_workers: Optional[int] = None,
+    use_ocr: bool = True,
+    reextract: bool = False,
+    offline: bool = False,
+) -> None:
+    """Scrape the Guelph bylaw directory and save each bylaw.
+
+    PDFs are downloaded on ``workers`` threads sharing one keep‑alive
+    session, with at most ``max_per_host`` requests in flight to
+    guelph.ca and ``delay`` seconds between request starts.  Unless
+    ``full`` is set, PDFs are requested conditionally against the fetch
+    manifest in ``output_dir`` and unchanged ones are skipped.
+    ``reextract`` re‑extracts unchanged PDFs from the document cache and
+    ``offline`` re‑extracts everything from it without network access.
+    """
+    global _fetcher, _extractor
+    if offline and full:
+        raise ValueError("--offline needs the fetch manifest; it cannot be combined with --full")
+    _fetcher = Fetcher(HEADERS, max_per_host=max_per_host, delay=delay)
+    _extractor = PdfExtractor(workers=extract_workers, use_ocr=use_ocr)
+    cache = get_doc_cache()
+    manifest = None if full else FetchManifest.for_output_dir(output_dir)
     logging.info("Fetching Guelph bylaw directory")
-    html = fetch_page(DIRECTORY_URL)
+    directory_path = conditional_download(_fetcher, manifest, cache, DIRECTORY_URL, reextract=True, offline=offline)
+    html = DocumentCache.read_bytes(directory_path)
     items = find_bylaw_links(html)
-    for item in items:
+
+    def process(item: Dict[str, str]) -> str:
         title = item["title"]
         pdf_url = item["pdf_url"]
         year = item.get("year")
         bylaw_number = item.get("bylaw_number")
         logging.info("Processing %s", title)
-        text = extract_pdf_text(pdf_url)
+        pdf_path = conditional_download(
+            _fetcher, manifest, cache, pdf_url,
+            force=output_missing(manifest, pdf_url) and not offline,
+            reextract=reextract or ocr_incomplete(manifest, pdf_url), offline=offline,
+        )
+        if pdf_path is None:
+            return "unchanged"
+        text = extract_pdf_text(pdf_url, source=pdf_path)
         content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
         bylaw_data = {
             "title": title,
@@ -186,7 +248,24 @@ def scrape_bylaws(output_dir: str) -> None:
             "text": text,
             "hash": content_hash,
         }
-        save_bylaw_data(bylaw_data, output_dir)
+        path = save_bylaw_data(bylaw_data, output_dir)
+        if manifest is not None:
+            manifest.update(pdf_url, output_file=path, ocr_incomplete=_extractor.ocr_incomplete(pdf_url))
+        return "saved"
+
+    results = _fetcher.map(process, items, workers=workers, label="by‑laws")
+    if manifest is not None:
+        manifest.save()
+    logging.info(
+        "Finished: %d saved, %d unchanged, %d failed of %d by‑laws (%s)",
+        results.count("saved"), results.count("unchanged"),
+        len(items) - results.count("saved") - results.count("unchanged"),
+        len(items), _fetcher.summary(),
+    )
+    logging.info("PDF extraction: %s", _extractor.summary())
+    _fetcher.close()
+    _extractor.close()
+    _extractor = None
 
 
 def main():
@@ -201,17 +280,26 @@ def main():
         default="INFO",
         help="Logging level (DEBUG, INFO, WARNING, ERROR)",
     )
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent PDF downloads (default: 8)")
+    parser.add_argument("--per-host", type=int, default=4, help="Max simultaneous requests per host (default: 4)")
+    parser.add_argument("--delay", type=float, default=0.25, help="Seconds between request starts per host (default: 0.25)")
+    parser.add_argument("--extract-workers", type=int, default=None, help="PDF extraction processes (default: CPU count)")
+    parser.add_argument("--no-ocr", action="store_true", help="Don't OCR scanned PDF pages")
+    parser.add_argument("--full", action="store_true", help="Ignore the fetch manifest and re‑download everything")
+    parser.add_argument("--reextract", action="store_true",
+                        help="Re‑extract every PDF, reading unchanged ones from the document cache")
+    parser.add_argument("--offline", action="store_true",
+                        help="Re‑extract every PDF from the document cache without touching the network")
     args = parser.parse_args()
     logging.basicConfig(level=getattr(logging, args.loglevel.upper(), logging.INFO), format="%(levelname)s: %(message)s")
-    scrape_bylaws(args.output)
+    scrape_bylaws(args.output, workers=args.workers, max_per_host=args.per_host, delay=args.delay, full=args.full,
+                  extract_workers=args.extract_workers, use_ocr=not args.no_ocr,
+                  reextract=args.reextract, offline=args.offline)
 
 
 if __name__ == "__main__":
     main()
 
-# TODO: why this:
-# [skip] empty text in: /Users/colewesterveld/Desktop/Coding Projects/GDSC_Hacks_2025/flask_api/scraping_guelph/guelph_bylaws/chief_administrative_officer_appointment_bylaw.json
-# [skip] empty text in: /Users/colewesterveld/Desktop/Coding Projects/GDSC_Hacks_2025/flask_api/scraping_guelph/guelph_bylaws/outside_water_use_bylaw.json
-# [skip] empty text in: /Users/colewesterveld/Desktop/Coding Projects/GDSC_Hacks_2025/flask_api/scraping_guelph/guelph_bylaws/brooklyn_and_college_hill_heritage_conservation_district_bylaw.json
-# [skip] empty text in: /Users/colewesterveld/Desktop/Coding Projects/GDSC_Hacks_2025/flask_api/scraping_guelph/guelph_bylaws/accessible_parking_bylaw.json
-# [skip] empty text in: /Users/colewesterveld/Desktop/Coding Projects/GDSC_Hacks_2025/flask_api/scraping_guelph/guelph_bylaws/meeting_investigation_bylaw.json
\ No newline at end of file
+# Scanned by-laws (e.g. accessible_parking_bylaw, outside_water_use_bylaw,
+# meeting_investigation_bylaw) used to ingest as empty text. Their pages are now
+# OCR'd by the extraction pool (scraping_common/ocr.py) when Tesseract is installed.
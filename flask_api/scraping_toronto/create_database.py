@@ -1,129 +1,117 @@
-import flask_api.scraping_toronto.parse_html as parse_html
-# import vector_index
-import embed_vectors
-from flask_api.scraping_toronto.chunk_text import chunk_text
-from dotenv import load_dotenv
+# file: create_database.py
+#
+# Builds the Toronto `bylaw_chunks` collection from lawmcode.htm.
+# The chapter PDFs go through the shared streaming pipeline
+# (scraping_common/ingest.py, TorontoAdapter in scraping_common/adapters.py):
+# download -> extract -> chunk -> embed -> write, with bounded queues in
+# between, so chunks are written in batches as they are produced instead of
+# being collected for one insert_many at the end.
+# Chapters are chunked on their § section boundaries (scraping_toronto/sections.py)
+# and each chunk carries a section_path such as "Article 2 > § 545-5 Licence required".
+
+import argparse
 import os
-#for pdf
-import requests
-import fitz  # PyMuPDF
-from io import BytesIO
+import sys
 
-import pymongo
-
-# create_database.py modifications
-
-import flask_api.scraping_toronto.parse_html as parse_html
-# import vector_index # Assuming this handles index creation
-import embed_vectors
-# ... (other imports: load_dotenv, os, requests, fitz, BytesIO, pymongo) ...
+# make flask_api/ importable when this file is run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_cache import EmbeddingCache
+from scraping_common.adapters import TorontoAdapter
+from scraping_common.doc_cache import DocumentCache
+from scraping_common.fetcher import Fetcher
+from scraping_common.ingest import make_mongo_client, make_token_chunking, open_hnsw, run_ingest
+from scraping_common.manifest import FetchManifest
+from scraping_common.pdf_extract import PdfExtractor
+from vector_codec import VECTOR_FORMATS
 
 
 # -----------------------------------------------------------------------------
 
-def create_chunked_database(html_file_name: str, database_name: str, new_collection_name: str): # Changed function name and param
-    load_dotenv()
-    DATABASE_LOGIN = os.getenv("DATABASE_LOGIN")
-    uri = f"mongodb+srv://{DATABASE_LOGIN}@gdsc2025.cn3wt5n.mongodb.net/?retryWrites=true&w=majority&appName=GDSC2025"
-    client = pymongo.MongoClient(uri)
-    database = client[database_name]
-
-    # ---- Use the NEW collection ----
-    collection = database[new_collection_name]
-    # Optional: Drop existing collection if recreating
-    # collection.drop()
-    # print(f"Dropped existing collection: {new_collection_name}")
-    # -----------------------------
-
-    data = parse_html.parse_html(html_file_name)
-    chunk_docs_to_insert = []
-    processed_count = 0
-
-    print(f"Processing {len(data)} bylaws from {html_file_name}...")
-
-    for law in data:
-        processed_count += 1
-        print(f"Processing bylaw {processed_count}/{len(data)}: ID {law['_id']}")
-        try:
-            url = law["pdf"]
-            response = requests.get(url, timeout=30) # Added timeout
-            response.raise_for_status()
-
-            pdf_data = BytesIO(response.content)
-            doc = fitz.open(stream=pdf_data, filetype="pdf")
-
-            full_text = ""
-            for page_num, page in enumerate(doc):
-                 try:
-                     full_text += page.get_text()
-                 except Exception as page_err:
-                     print(f"  Warning: Error extracting text from page {page_num + 1} of {law['_id']}. Skipping page. Error: {page_err}")
-            doc.close()
-
-            if not full_text.strip():
-                 print(f"  Warning: No text extracted from {law['_id']}. Skipping.")
-                 continue
-
-            # ---- Chunk the extracted text ----
-            chunk_size = 1000  # Example size
-            chunk_overlap = 100 # Example overlap
-            text_chunks = chunk_text(full_text, chunk_size, chunk_overlap)
-            print(f"  Extracted text, generated {len(text_chunks)} chunks.")
-            # --------------------------------
-
-            # ---- Create documents for each chunk ----
-            for i, chunk in enumerate(text_chunks):
-                 chunk_doc = {
-                     "original_bylaw_id": law["_id"],
-                     "title": law["title"],
-                     "pdf_url": law["pdf"],
-                     "chunk_sequence": i + 1,
-                     "chunk_text": chunk,
-                     # plot_embedding will be added later by embed_vectors.py
-                 }
-                 chunk_docs_to_insert.append(chunk_doc)
-            # ---------------------------------------
-
-        except requests.exceptions.RequestException as req_err:
-             print(f"  Error downloading {law['_id']} from {url}: {req_err}")
-        except fitz.fitz.FitzError as pdf_err: # More specific fitz error
-             print(f"  Error opening or processing PDF {law['_id']}: {pdf_err}")
-        except Exception as e:
-             print(f"  An unexpected error occurred processing {law['_id']}: {e}")
-
-    # ---- Insert all chunk documents ----
-    if chunk_docs_to_insert:
-        print(f"\nInserting {len(chunk_docs_to_insert)} chunk documents into {database_name}.{new_collection_name}...")
-        try:
-            collection.insert_many(chunk_docs_to_insert, ordered=False) # ordered=False might speed up bulk inserts
-            print("Insertion complete.")
-        except pymongo.errors.BulkWriteError as bwe:
-            print(f"  Bulk write error during insertion: {bwe.details}")
-        except Exception as insert_err:
-            print(f"  An error occurred during bulk insertion: {insert_err}")
-    else:
-        print("\nNo chunk documents were generated to insert.")
-    # ----------------------------------
-
-    # ---- Initialize Vector Index on the NEW collection ----
-    print(f"Initializing vector index on {database_name}.{new_collection_name}...")
-    # Ensure vector_index.initialize_vector_index is adapted for the new collection
-    # and the embedding field name (e.g., 'plot_embedding' or maybe 'chunk_embedding')
-    # vector_index.initialize_vector_index(database_name, new_collection_name, embedding_field="plot_embedding") # Example adaptation
-    print("(Skipping actual index initialization call as 'vector_index.py' is not provided)")
-    # ----------------------------------------------------
-
-    # ---- Update NEW collection documents with embeddings ----
-    print(f"Updating documents with embeddings in {database_name}.{new_collection_name}...")
-    # Ensure embed_vectors.update_documents_with_embeddings uses the new collection
-    embed_vectors.update_documents_with_embeddings(database_name, new_collection_name)
-    # -------------------------------------------------------
-
-    client.close()
+def create_chunked_database(
+    html_file_name: str,
+    database_name: str,
+    new_collection_name: str,
+    incremental: bool = True,
+    offline: bool = False,
+    fetch_workers: int = 4,
+    extract_workers: int = None,
+    chunk_tokens: int = None,
+    by_section: bool = True,
+    vector_format: str = "array",
+    hnsw: bool = False,
+):
+    client = make_mongo_client()
+    collection = client[database_name][new_collection_name]
+
+    # PDFs are streamed to the on-disk document cache and extracted from there;
+    # offline rebuilds from the cache without downloading
+    doc_cache = DocumentCache()
+    manifest = FetchManifest(os.path.join(doc_cache.root, "toronto_manifest.json"))
+    fetcher = Fetcher()
+    extractor = PdfExtractor(workers=extract_workers)
+    cache = EmbeddingCache()
+    token_chunking = make_token_chunking(chunk_tokens, 32, chunk_tokens // 2) if chunk_tokens else None
+    adapter = TorontoAdapter(
+        html_file_name, fetcher, doc_cache, manifest=manifest, offline=offline,
+        token_chunking=token_chunking, by_section=by_section,
+    )
+
+    print(f"Building {database_name}.{new_collection_name} from {html_file_name}...")
+    try:
+        run_ingest(
+            adapter,
+            collection,
+            incremental=incremental,
+            cache=cache,
+            extractor=extractor,
+            fetch_workers=fetch_workers,
+            vector_format=vector_format,
+            hnsw=open_hnsw(new_collection_name) if hnsw else None,
+        )
+    finally:
+        manifest.save()
+        fetcher.close()
+        extractor.close()
+        cache.close()
+        client.close()
+
+    # ---- Vector index on the collection ----
+    # vector_index.initialize_vector_index(database_name, new_collection_name, embedding_field="chunk_embedding_cpu")
+    print("(Skipping index initialization: run bylaw_summaries.py and vector_index.py to refresh "
+          "the bylaw summaries and the Atlas 'vector_index' on chunk_embedding_cpu)")
     print("Database creation process finished.")
 
-# --- Call the updated function with a new collection name ---
-# create_chunked_database("lawmcode.htm", "bylaws", "bylaw_chunks")
-# print("Run the above line uncommented to start the process.")
-# ---------------------------------------------------------
-create_chunked_database("lawmcode.htm", "bylaws", "bylaw_chunks") # <-- Make sure this line is NOT commented out
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Toronto bylaw_chunks collection")
+    parser.add_argument("--html", default="lawmcode.htm", help="Saved Toronto municipal code page (default: lawmcode.htm)")
+    parser.add_argument("--db", default="bylaws")
+    parser.add_argument("--collection", default="bylaw_chunks")
+    parser.add_argument("--full", action="store_true", help="Re-embed and rewrite every chunk")
+    parser.add_argument("--offline", action="store_true", help="Only use PDFs already in the document cache")
+    parser.add_argument("--fetch-workers", type=int, default=4, help="Concurrent PDF downloads (default: 4)")
+    parser.add_argument("--extract-workers", type=int, default=None, help="PDF extraction processes (default: CPU count)")
+    parser.add_argument("--chunk-tokens", type=int, default=None,
+                        help="Size chunks in model tokens (e.g. 200, plus 32 overlap) instead of 1000 characters")
+    parser.add_argument("--no-sections", action="store_true",
+                        help="Chunk by size only instead of on § section boundaries")
+    parser.add_argument("--vector-format", choices=VECTOR_FORMATS, default="array",
+                        help="Store vectors as a BSON array or packed BinData float32/int8 (default array)")
+    parser.add_argument("--hnsw", action="store_true",
+                        help="Also add/tombstone the chunks in the collection's HNSW index (hnsw_index.py)")
+    args = parser.parse_args()
+    create_chunked_database(
+        args.html, args.db, args.collection,
+        incremental=not args.full,
+        offline=args.offline,
+        fetch_workers=args.fetch_workers,
+        extract_workers=args.extract_workers,
+        chunk_tokens=args.chunk_tokens,
+        by_section=not args.no_sections,
+        vector_format=args.vector_format,
+        hnsw=args.hnsw,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# file: sections.py
+"""
+Section parser for Toronto Municipal Code chapter PDFs.
+
+Chapters are numbered like::
+
+    ARTICLE 2
+    Licensing Requirements
+    § 545-5. Licence required.
+    A. No person shall ...
+      (1) ...
+        (a) ...
+
+``find_sections`` locates the ``ARTICLE`` and ``§ <chapter>-<n>``
+headings in the extracted text and returns ``(start, end, path)`` spans
+such as ``"Article 2 > § 545-5 Licence required"``.  The table of
+contents at the top of a chapter lists every heading once before the
+body does, so a heading line that is immediately followed by another one
+and repeated later is skipped, and numbers must increase through the
+chapter (a cross‑reference that happens to start a line is not a heading).
+
+``chunk_sections`` turns the spans into chunks on section boundaries:
+short neighbouring sections of one article are packed together, and a
+section that is too long is split at its subsection markers (``A.``,
+``(1)``, ``(a)``) and, failing that, by the regular offset chunker.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+from scraping_common.chunking import Chunk, chunk_spans
+
+_ARTICLE = re.compile(r"^[ \t]*ARTICLE[ \t]+([IVXLC]+|\d+[A-Z]?)\b[ \t]*(.*)$", re.M)
+# headings are "§ 545-5. Title." – the period sets them apart from "§ 545-5 of this chapter"
+_SECTION = re.compile(r"^[ \t]*§[ \t]*(\d+[A-Z]?-\d+(?:\.\d+)*[A-Z]?)\.(?=\s)[ \t]*(.*)$", re.M)
+_SUBSECTION = re.compile(r"^[ \t]*(?:[A-Z]\.|\(\d+\)|\([a-z]\))[ \t]", re.M)
+
+_TOC_GAP = 40  # max characters between two table-of-contents lines
+
+Span = Tuple[int, int, str]
+
+
+def _section_key(number: str) -> Tuple:
+    """``"545-5.1"`` -> ``(5, 1)`` for ordering within a chapter."""
+    parts = re.findall(r"\d+", number.split("-", 1)[1])
+    return tuple(int(p) for p in parts)
+
+
+def _title(rest: str) -> str:
+    return rest.strip().rstrip(".").strip()
+
+
+def find_sections(text: str) -> Optional[List[Span]]:
+    """``(start, end, section_path)`` spans covering ``text``, or ``None`` if it has no § headings."""
+    candidates = list(_SECTION.finditer(text))
+    if not candidates:
+        return None
+
+    # table-of-contents entries: nothing but the heading line before the next
+    # candidate, and the same number comes again later in the body
+    last = {m.group(1): i for i, m in enumerate(candidates)}
+    headings = []
+    prev_key: Tuple = ()
+    for i, m in enumerate(candidates):
+        next_start = candidates[i + 1].start() if i + 1 < len(candidates) else len(text)
+        if last[m.group(1)] != i and next_start - m.end() < _TOC_GAP:
+            continue
+        key = _section_key(m.group(1))
+        if key <= prev_key:
+            continue  # a cross-reference that happens to start a line
+        headings.append(m)
+        prev_key = key
+    if not headings:
+        return None
+
+    articles = [(m.start(), f"Article {m.group(1)}") for m in _ARTICLE.finditer(text) if m.start() >= headings[0].start() - 200]
+
+    def article_at(pos: int) -> Optional[str]:
+        current = None
+        for start, name in articles:
+            if start > pos:
+                break
+            current = name
+        return current
+
+    spans: List[Span] = []
+    if text[: headings[0].start()].strip():
+        spans.append((0, headings[0].start(), "Preamble"))
+    for i, m in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(text)
+        # an ARTICLE heading between two sections belongs to the next one
+        for start, _ in articles:
+            if m.end() < start < end:
+                end = start
+                break
+        label = f"§ {m.group(1)}"
+        title = _title(m.group(2))
+        if title:
+            label = f"{label} {title}"
+        article = article_at(m.start())
+        spans.append((m.start(), end, f"{article} > {label}" if article else label))
+
+    # text between an ARTICLE heading and its first section goes to that section
+    for i in range(len(spans) - 1):
+        if spans[i][1] < spans[i + 1][0]:
+            spans[i + 1] = (spans[i][1],) + spans[i + 1][1:]
+    return spans
+
+
+def _article(path: str) -> str:
+    return path.split(" > ", 1)[0] if " > " in path else ""
+
+
+def _section_label(path: str) -> str:
+    label = path.split(" > ")[-1]
+    return label.split(" ", 2)[1] if label.startswith("§ ") else label
+
+
+def _split_long_section(text: str, s: int, e: int, path: str, pack_limit: int,
+                        target: int, overlap: int, min_size: int, tokenizer=None) -> List[Chunk]:
+    """Split one long section at subsection markers, falling back to the offset chunker."""
+    marks = [m.start() for m in _SUBSECTION.finditer(text, s, e) if m.start() > s]
+    bounds = [s] + marks + [e]
+
+    chunks: List[Chunk] = []
+    cs, ce = s, s
+    for ps, pe in zip(bounds, bounds[1:]):
+        if pe - cs <= pack_limit or ce == cs:
+            ce = pe
+        else:
+            chunks.extend(_emit(text, cs, ce, path, target, overlap, min_size, tokenizer))
+            cs, ce = ps, pe
+    chunks.extend(_emit(text, cs, ce, path, target, overlap, min_size, tokenizer))
+    return chunks
+
+
+def _emit(text: str, s: int, e: int, path: str, target: int, overlap: int, min_size: int, tokenizer=None) -> List[Chunk]:
+    """Chunk ``text[s:e]`` (usually a single chunk) with exact offsets into ``text``."""
+    piece = text[s:e]
+    return [
+        Chunk(piece[a:b], s + a, s + b, path)
+        for a, b in chunk_spans(piece, target, overlap, min_size, tokenizer)
+    ]
+
+
+def chunk_sections(
+    text: str,
+    target_size: int = 1000,
+    overlap: int = 100,
+    min_size: int = 300,
+    tokenizer=None,
+) -> Optional[List[Chunk]]:
+    """Chunks on section boundaries with a ``section_path`` each, or ``None`` if no sections were found.
+
+    With a ``tokenizer`` the sizes are in tokens (see ``scraping_common.chunking``);
+    which neighbouring sections to pack together is still decided on
+    characters (about 4 per token), but every chunk is cut to the token budget.
+    """
+    spans = find_sections(text)
+    if spans is None:
+        return None
+    scale = 4 if tokenizer is not None else 1
+    pack_limit, pack_min = target_size * scale, min_size * scale
+
+    chunks: List[Chunk] = []
+    group: List[Span] = []
+
+    def flush():
+        if not group:
+            return
+        s, e = group[0][0], group[-1][1]
+        if len(group) == 1:
+            path = group[0][2]
+        else:
+            first, last = _section_label(group[0][2]), _section_label(group[-1][2])
+            article = _article(group[0][2])
+            path = f"{article} > § {first}–{last}" if article else f"§ {first}–{last}"
+        if e - s > pack_limit:
+            chunks.extend(_split_long_section(text, s, e, path, pack_limit, target_size, overlap, min_size, tokenizer))
+        else:
+            chunks.extend(_emit(text, s, e, path, target_size, overlap, min_size, tokenizer))
+        group.clear()
+
+    for span in spans:
+        s, e, path = span
+        if group and (
+            _article(path) != _article(group[0][2])
+            or e - group[0][0] > pack_limit
+            or group[-1][1] - group[0][0] >= pack_min
+            or "Preamble" in (path, group[0][2])
+        ):
+            flush()
+        group.append(span)
+    flush()
+    return chunks
@@ -53,7 +53,8 @@ Key features
 * Finds every by‑law listed on the official directory page (``/en/living/bylaw-directory.aspx``)
   and resolves relative URLs to absolute ones.
 * Detects whether a by‑law is published as a PDF or as an HTML page.  If a
-  PDF is present it will be downloaded and parsed with pdfplumber.  If not,
+  PDF is present it will be downloaded and parsed with PyMuPDF (pdfplumber
+  as a fallback) on a process pool.  If not,
   the scraper falls back to extracting the HTML body using BeautifulSoup.
 * Extracts basic metadata from the by‑law pages such as the title,
   by‑law number and the "Last passed" or "Last amended" date when
@@ -63,20 +64,24 @@ Key features
 * Writes each by‑law to a JSON file containing the text, metadata and
   fetch timestamp.  The JSON filename is derived from a slugified
   version of the by‑law title.
-* Includes an optional update checker that can compare the current hash
-  against a previously saved hash (from a previous run) and also
-  consults HTTP ``ETag``/``Last‑Modified`` headers when available.
+* Keeps a fetch manifest (``.fetch_manifest.json`` in the output
+  directory) with the ``ETag``, ``Last‑Modified`` and content hash of
+  every page and PDF, and sends ``If-None-Match``/``If-Modified-Since``
+  on re‑runs so unchanged by‑laws are skipped with a 304.
+* Streams every page and PDF into a content‑addressed document cache on
+  disk (see ``scraping_common/doc_cache.py``) and extracts from the
+  cached file, so ``--reextract`` and ``--offline`` can re‑run
+  extraction without downloading anything again.
 
 Dependencies
 ------------
 You will need the following Python packages installed:
 
-    pip install requests beautifulsoup4 pdfplumber python-dateutil
+    pip install requests beautifulsoup4 PyMuPDF pdfplumber python-dateutil
 
-pdfplumber in turn depends on ``PyPDF2`` and ``pillow``.  If you
-anticipate scanning PDFs that lack a text layer you can optionally
-install ``pytesseract`` and ``pdf2image`` and extend
-``extract_pdf_text`` accordingly.
+pdfplumber in turn depends on ``PyPDF2`` and ``pillow``.  Scanned
+PDFs that lack a text layer are OCR'd when ``pytesseract`` and the
+``tesseract`` binary are installed (see ``scraping_common/ocr.py``).
 
 Usage
 -----
@@ -84,6 +89,10 @@ To scrape all by‑laws into an output directory:
 
     python waterloo_bylaw_scraper.py --output ./waterloo_bylaws
 
+Pages are fetched concurrently over a shared keep‑alive session
+(see ``scraping_common/fetcher.py``); tune the crawl with ``--workers``,
+``--per-host`` and ``--delay``.
+
 The script will create the output directory if it does not exist and
 write one JSON file per by‑law.  You can run the script repeatedly;
 existing files will be overwritten if a by‑law's content has changed.
@@ -109,14 +118,19 @@ import json
 import logging
 import os
 import re
+import sys
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional
 
-import requests
 from bs4 import BeautifulSoup
 from dateutil import parser as date_parser
-import pdfplumber
-import io
+
+# make flask_api/ importable when this file is run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraping_common.fetcher import Fetcher
+from scraping_common.pdf_extract import PdfExtractor, extract_pdf_text as extract_pdf_bytes
+from scraping_common.doc_cache import DocumentCache
+from scraping_common.manifest import FetchManifest, conditional_download, ocr_incomplete, output_missing
 
 # Base URLs and headers used for all HTTP requests.  The City of
 # Waterloo's website sometimes blocks automated requests without a
@@ -136,17 +150,39 @@ HEADERS = {
 }
 
 
+_fetcher: Optional[Fetcher] = None
+_extractor: Optional[PdfExtractor] = None  # set while scrape_bylaws runs
+_doc_cache: Optional[DocumentCache] = None
+
+
+def get_fetcher() -> Fetcher:
+    """Return the module's shared ``Fetcher``, creating it on first use.
+
+    ``scrape_bylaws`` replaces it with one configured from the command
+    line; helpers called on their own fall back to the defaults.
+    """
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = Fetcher(HEADERS)
+    return _fetcher
+
+
+def get_doc_cache() -> DocumentCache:
+    global _doc_cache
+    if _doc_cache is None:
+        _doc_cache = DocumentCache()
+    return _doc_cache
+
+
 def fetch_page(url: str) -> str:
     """Fetch a URL and return its text content.
 
-    Raises ``requests.HTTPError`` if the request fails.  This helper
-    centralises headers so that all requests include the same user
-    agent.
+    Raises ``requests.HTTPError`` if the request fails.  Requests go
+    through the shared ``Fetcher`` so that all of them include the same
+    user agent and reuse pooled connections.
     """
     logging.debug("Fetching %s", url)
-    response = requests.get(url, headers=HEADERS, timeout=30)
-    response.raise_for_status()
-    return response.text
+    return get_fetcher().get_text(url)
 
 
 def find_bylaw_links(directory_html: str) -> List[str]:
@@ -187,29 +223,26 @@ def find_bylaw_links(directory_html: str) -> List[str]:
     return unique_links
 
 
-def extract_pdf_text(pdf_url: str) -> str:
-    """Download a PDF and extract its text using pdfplumber.
+def extract_pdf_text(pdf_url: str, source: Optional[str] = None) -> str:
+    """Download a PDF and extract its text (PyMuPDF, pdfplumber fallback).
 
-    If the PDF cannot be downloaded or parsed, an empty string is
-    returned.  Optionally you could implement OCR here for scanned
-    PDFs that lack a text layer (see documentation).
+    While ``scrape_bylaws`` runs, extraction is handed to its process
+    pool.  ``source`` may be passed when the PDF is already in the
+    document cache.  Otherwise it is streamed into the cache first.  If
+    the PDF cannot be downloaded or parsed, an empty string is returned.
+    Scanned pages without a text layer are OCR'd by the extraction pool
+    when Tesseract is installed.
     """
-    logging.debug("Downloading PDF %s", pdf_url)
-    try:
-        resp = requests.get(pdf_url, headers=HEADERS, timeout=60)
-        resp.raise_for_status()
-    except Exception as e:
-        logging.warning("Failed to download PDF %s: %s", pdf_url, e)
-        return ""
-    text = ""
-    try:
-        with pdfplumber.open(io.BytesIO(resp.content)) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() or ""
-        return text
-    except Exception as e:
-        logging.warning("Failed to parse PDF %s: %s", pdf_url, e)
-        return ""
+    if source is None:
+        logging.debug("Downloading PDF %s", pdf_url)
+        try:
+            source = conditional_download(get_fetcher(), None, get_doc_cache(), pdf_url)
+        except Exception as e:
+            logging.warning("Failed to download PDF %s: %s", pdf_url, e)
+            return ""
+    if _extractor is not None:
+        return _extractor.extract(source, name=pdf_url, sha256=DocumentCache.key_of(source))
+    return extract_pdf_bytes(source, name=pdf_url)
 
 
 def slugify(value: str) -> str:
@@ -286,19 +319,31 @@ def extract_html_bylaw_text(soup: BeautifulSoup) -> str:
     return text
 
 
-def parse_bylaw_page(url: str) -> Optional[Dict[str, object]]:
+def parse_bylaw_page(
+    url: str,
+    html: Optional[bytes] = None,
+    pdf_source: Optional[str] = None,
+    manifest: Optional[FetchManifest] = None,
+    offline: bool = False,
+) -> Optional[Dict[str, object]]:
     """Parse a single by‑law page and return its metadata and text.
 
+    ``html`` and ``pdf_source`` (a document cache path) may be supplied
+    when they were already downloaded.  With a ``manifest`` the linked
+    PDF is fetched conditionally, served from the document cache when
+    unchanged (or always, with ``offline``), and the page's manifest
+    entry remembers the PDF URL.
     If the page cannot be fetched or parsed, ``None`` is returned.
-    The returned dictionary contains keys: ``url``, ``title``,
-    ``bylaw_number``, ``last_passed``, ``last_amended``, ``text`` and
-    ``hash``.
+    The returned dictionary contains keys: ``url``, ``pdf_url``,
+    ``title``, ``bylaw_number``, ``last_passed``, ``last_amended``,
+    ``text`` and ``hash``.
     """
-    try:
-        html = fetch_page(url)
-    except Exception as e:
-        logging.warning("Failed to fetch %s: %s", url, e)
-        return None
+    if html is None:
+        try:
+            html = get_fetcher().get_bytes(url)
+        except Exception as e:
+            logging.warning("Failed to fetch %s: %s", url, e)
+            return None
     soup = BeautifulSoup(html, "html.parser")
     metadata = parse_bylaw_metadata(soup)
     # Look for a PDF link inside the page
@@ -309,14 +354,29 @@ def parse_bylaw_page(url: str) -> Optional[Dict[str, object]]:
             pdf_link = href if href.startswith("http") else f"{BASE_URL}/{href.lstrip('/')}"
             break
     if pdf_link:
-        text = extract_pdf_text(pdf_link)
+        if pdf_source is None and manifest is not None:
+            try:
+                # the page changed, so extract even if the PDF itself did not
+                pdf_source = conditional_download(
+                    get_fetcher(), manifest, get_doc_cache(), pdf_link, reextract=True, offline=offline
+                )
+            except Exception as e:
+                logging.warning("Failed to download PDF %s: %s", pdf_link, e)
+                return None
+        text = extract_pdf_text(pdf_link, source=pdf_source)
+        if manifest is not None and _extractor is not None:
+            # scanned pages OCR didn't finish: re-extract on the next run even if nothing changed
+            manifest.update(pdf_link, ocr_incomplete=_extractor.ocr_incomplete(pdf_link))
     else:
         text = extract_html_bylaw_text(soup)
     if not text:
         logging.warning("No text extracted from %s", url)
+    if manifest is not None:
+        manifest.update(url, pdf_url=pdf_link)
     content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
     return {
         "url": url,
+        "pdf_url": pdf_link,
         "title": metadata.get("title"),
         "bylaw_number": metadata.get("bylaw_number"),
         "last_passed": metadata.get("last_passed"),
@@ -327,11 +387,11 @@ def parse_bylaw_page(url: str) -> Optional[Dict[str, object]]:
     }
 
 
-def save_bylaw_data(bylaw_data: Dict[str, object], output_dir: str) -> None:
+def save_bylaw_data(bylaw_data: Dict[str, object], output_dir: str) -> str:
     """Write by‑law data to a JSON file in the specified output directory.
 
     The filename is derived from the by‑law's title.  Existing files
-    with the same name will be overwritten.
+    with the same name will be overwritten.  Returns the file path.
     """
     title = bylaw_data.get("title") or "untitled_bylaw"
     slug = slugify(title)
@@ -340,50 +400,86 @@ def save_bylaw_data(bylaw_data: Dict[str, object], output_dir: str) -> None:
     with open(path, "w", encoding="utf-8") as f:
         json.dump(bylaw_data, f, ensure_ascii=False, indent=2)
     logging.info("Saved %s", path)
-
-
-def check_for_update(url: str, previous_hash: Optional[str] = None) -> Tuple[bool, Optional[str]]:
-    """Check whether a by‑law has been updated.
-
-    This function performs an HTTP HEAD request to retrieve ETag
-    or Last‑Modified headers.  If those headers are present they
-    can be compared to stored values (not implemented here).
-    Alternatively the caller can supply a previously computed
-    ``previous_hash``; the function will download the page, compute
-    the new hash and return a tuple ``(changed, new_hash)``.  The
-    function returns ``(True, new_hash)`` if the by‑law appears to
-    have changed.
+    return path
+
+
+def scrape_bylaws(
+    output_dir: str,
+    workers: int = 8,
+    max_per_host: int = 4,
+    delay: float = 0.25,
+    full: bool = False,
+    extract_workers: Optional[int] = None,
+    use_ocr: bool = True,
+    reextract: bool = False,
+    offline: bool = False,
+) -> None:
+    """Scrape the entire by‑law directory and save results into ``output_dir``.
+
+    By‑law pages (and the PDFs they link to) are fetched on ``workers``
+    threads sharing one keep‑alive session.  ``max_per_host`` caps the
+    number of simultaneous requests to waterloo.ca and ``delay`` spaces
+    out request starts so the crawl stays polite.
+
+    Unless ``full`` is set, a fetch manifest in ``output_dir`` is used to
+    send conditional requests so only changed pages and PDFs are
+    downloaded and re‑parsed.  ``reextract`` re‑parses every by‑law,
+    taking unchanged pages and PDFs from the document cache, and
+    ``offline`` does the same without any network access.
     """
-    try:
-        response = requests.head(url, headers=HEADERS, allow_redirects=True, timeout=15)
-        etag = response.headers.get("ETag")
-        last_modified = response.headers.get("Last-Modified")
-    except Exception:
-        etag = last_modified = None
-    if previous_hash is None:
-        # Without a previous hash we cannot decide based on content; assume
-        # the by‑law should be re‑downloaded.
-        return True, None
-    try:
-        data = parse_bylaw_page(url)
-    except Exception:
-        return False, None
-    new_hash = data["hash"] if data else None
-    changed = new_hash != previous_hash
-    return changed, new_hash
-
-
-def scrape_bylaws(output_dir: str) -> None:
-    """Scrape the entire by‑law directory and save results into ``output_dir``."""
+    global _fetcher, _extractor
+    if offline and full:
+        raise ValueError("--offline needs the fetch manifest; it cannot be combined with --full")
+    _fetcher = Fetcher(HEADERS, max_per_host=max_per_host, delay=delay)
+    _extractor = PdfExtractor(workers=extract_workers, use_ocr=use_ocr)
+    cache = get_doc_cache()
+    manifest = None if full else FetchManifest.for_output_dir(output_dir)
     logging.info("Starting scrape of Waterloo by‑law directory")
-    directory_html = fetch_page(DIRECTORY_URL)
+    directory_path = conditional_download(_fetcher, manifest, cache, DIRECTORY_URL, reextract=True, offline=offline)
+    directory_html = DocumentCache.read_bytes(directory_path)
     bylaw_links = find_bylaw_links(directory_html)
     logging.info("Processing %d by‑law pages", len(bylaw_links))
-    for link in bylaw_links:
+
+    def process(link: str) -> str:
         logging.info("Processing %s", link)
-        data = parse_bylaw_page(link)
-        if data:
-            save_bylaw_data(data, output_dir)
+        force = output_missing(manifest, link) and not offline
+        page_path = conditional_download(
+            _fetcher, manifest, cache, link, force=force, reextract=reextract, offline=offline
+        )
+        pdf_path = None
+        if page_path is None:
+            # Page unchanged: only the linked PDF can still have changed
+            pdf_url = manifest.get(link).get("pdf_url")
+            if not pdf_url:
+                return "unchanged"
+            pdf_path = conditional_download(_fetcher, manifest, cache, pdf_url,
+                                            reextract=ocr_incomplete(manifest, pdf_url))
+            if pdf_path is None:
+                return "unchanged"
+            page_path = cache.get(manifest.get(link).get("content_sha256"))
+        data = parse_bylaw_page(
+            link, html=DocumentCache.read_bytes(page_path), pdf_source=pdf_path, manifest=manifest, offline=offline
+        )
+        if not data:
+            return "failed"
+        path = save_bylaw_data(data, output_dir)
+        if manifest is not None:
+            manifest.update(link, output_file=path)
+        return "saved"
+
+    results = _fetcher.map(process, bylaw_links, workers=workers, label="by‑laws")
+    if manifest is not None:
+        manifest.save()
+    logging.info(
+        "Finished: %d saved, %d unchanged, %d failed of %d by‑laws (%s)",
+        results.count("saved"), results.count("unchanged"),
+        len(bylaw_links) - results.count("saved") - results.count("unchanged"),
+        len(bylaw_links), _fetcher.summary(),
+    )
+    logging.info("PDF extraction: %s", _extractor.summary())
+    _fetcher.close()
+    _extractor.close()
+    _extractor = None
 
 
 def main():
@@ -398,9 +494,21 @@ def main():
         default="INFO",
         help="Logging level (DEBUG, INFO, WARNING, ERROR)",
     )
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent by‑law fetches (default: 8)")
+    parser.add_argument("--per-host", type=int, default=4, help="Max simultaneous requests per host (default: 4)")
+    parser.add_argument("--delay", type=float, default=0.25, help="Seconds between request starts per host (default: 0.25)")
+    parser.add_argument("--extract-workers", type=int, default=None, help="PDF extraction processes (default: CPU count)")
+    parser.add_argument("--no-ocr", action="store_true", help="Don't OCR scanned PDF pages")
+    parser.add_argument("--full", action="store_true", help="Ignore the fetch manifest and re‑download everything")
+    parser.add_argument("--reextract", action="store_true",
+                        help="Re‑parse every by‑law, reading unchanged pages and PDFs from the document cache")
+    parser.add_argument("--offline", action="store_true",
+                        help="Re‑parse every by‑law from the document cache without touching the network")
     args = parser.parse_args()
     logging.basicConfig(level=getattr(logging, args.loglevel.upper(), logging.INFO), format="%(levelname)s: %(message)s")
-    scrape_bylaws(args.output)
+    scrape_bylaws(args.output, workers=args.workers, max_per_host=args.per_host, delay=args.delay, full=args.full,
+                  extract_workers=args.extract_workers, use_ocr=not args.no_ocr,
+                  reextract=args.reextract, offline=args.offline)
 
 
 if __name__ == "__main__":
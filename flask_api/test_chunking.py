@@ -0,0 +1,55 @@
+# test_chunking.py
+# The offset-based chunker (scraping_common/chunking.py).
+import re
+
+import pytest
+
+from scraping_common.chunking import chunk_spans, chunk_text, chunk_with_offsets
+
+TEXT = "\n\n".join(
+    f"{n}. " + " ".join(f"Clause {n}.{k}: no person shall erect a fence higher than {k} metres!" for k in range(9))
+    for n in range(1, 9)
+)
+
+
+@pytest.mark.parametrize("target, overlap, min_size", [(1000, 150, 600), (400, 80, 200), (120, 0, 60)])
+def test_chunks_are_slices_of_the_text_within_size(target, overlap, min_size):
+    chunks = chunk_with_offsets(TEXT, target_size=target, overlap=overlap, min_size=min_size)
+
+    assert len(chunks) > 1
+    for c in chunks:
+        assert TEXT[c.start:c.end] == c.text
+        assert len(c.text) <= target + overlap
+        assert c.text == c.text.strip()
+    assert [c.text for c in chunks] == chunk_text(TEXT, target, overlap, min_size)
+
+
+def test_chunks_cover_the_text_in_order():
+    spans = chunk_spans(TEXT, target_size=400, overlap=80, min_size=200)
+
+    assert spans[0][0] == 0 and spans[-1][1] == len(TEXT)
+    for (ps, pe), (s, e) in zip(spans, spans[1:]):
+        assert ps < s <= pe < e  # each chunk starts inside the previous one (overlap) and ends after it
+
+
+def test_overlap_starts_on_a_word():
+    for c in chunk_with_offsets(TEXT, target_size=400, overlap=80, min_size=200)[1:]:
+        assert c.start == 0 or TEXT[c.start - 1].isspace()
+
+
+def test_chunks_end_on_sentence_boundaries_without_overlap():
+    for c in chunk_with_offsets(TEXT, target_size=400, overlap=0, min_size=200):
+        assert re.search(r"[.!?]$", c.text)
+
+
+def test_a_unit_longer_than_the_target_is_hard_wrapped_at_a_space():
+    text = " ".join(f"word{i}" for i in range(300))  # no sentence breaks at all
+    chunks = chunk_with_offsets(text, target_size=200, overlap=0, min_size=100)
+
+    assert all(len(c.text) <= 200 for c in chunks)
+    assert " ".join(c.text for c in chunks) == text
+
+
+def test_empty_text_has_no_chunks():
+    assert chunk_with_offsets("") == []
+    assert chunk_with_offsets(" \n\n ") == []
@@ -0,0 +1,79 @@
+# test_hnsw_index.py
+# Incremental updates, checkpoints and reloads of the persistent HNSW index (hnsw_index.py).
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("hnswlib")
+import hnsw_index
+from hnsw_index import HnswIndex, chunk_key
+
+
+def vectors(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, hnsw_index.DIMENSIONS)).astype(np.float32)
+
+
+def add(index, bylaw_id, n, seed=0):
+    keys = [chunk_key(bylaw_id, i, "sha") for i in range(n)]
+    index.upsert(keys, [bylaw_id] * n, vectors(n, seed),
+                 [{"bylaw_id": bylaw_id, "chunk_index": i, "chunk_text": f"{bylaw_id}#{i}"} for i in range(n)])
+    return keys
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "waterloo")
+
+
+def test_unsaved_changes_are_rolled_back_with_the_graph(path):
+    index = HnswIndex(path)
+    add(index, "a", 5)
+    index.save()
+    add(index, "b", 5, seed=1)
+    index.delete([chunk_key("a", 0, "sha")])
+    index._db().close()  # the ingest dies before its next checkpoint
+
+    reopened = HnswIndex(path)
+    assert reopened.count() == reopened.meta["live"] == 5
+    # the sidecar and the graph agree, so the same keys can be tombstoned and re-added
+    assert reopened.delete([chunk_key("a", 0, "sha"), chunk_key("b", 0, "sha")]) == 1
+    add(reopened, "b", 5, seed=1)
+    reopened.save()
+    assert HnswIndex(path, read_only=True).count() == 9
+
+
+def test_missing_label_is_tolerated(path):
+    index = HnswIndex(path)
+    keys = add(index, "a", 3)
+    index.index.mark_deleted(1)  # e.g. tombstoned in a graph saved before its sidecar rows were
+
+    assert index.delete(keys) == 3
+    assert index.meta["live"] == 0
+
+
+def test_k_is_capped_at_the_live_chunks(path):
+    index = HnswIndex(path)
+    keys = add(index, "a", 6)
+    index.delete(keys[:4])
+
+    labels, _ = index.search_labels(vectors(1)[0], k=4)
+    assert len(labels) == 2
+    assert len(index.search(vectors(1)[0], k=4, bylaw_ids=["a"])) == 2
+
+
+def test_readers_reload_a_newer_index(path, monkeypatch):
+    monkeypatch.setattr(hnsw_index, "_indexes", {})
+    writer = HnswIndex(path)
+    add(writer, "a", 3)
+    writer.save()
+    reader = hnsw_index.get_hnsw_index("waterloo", root=os.path.dirname(path))
+    assert hnsw_index.get_hnsw_index("waterloo", root=os.path.dirname(path)) is reader
+    assert reader.count() == 3
+
+    add(writer, "b", 3, seed=1)
+    writer.save()
+    os.utime(os.path.join(path, "index.bin"), ns=(0, reader.mtime + 1))  # coarse filesystem clocks
+    reloaded = hnsw_index.get_hnsw_index("waterloo", root=os.path.dirname(path))
+    assert reloaded is not reader
+    assert len(reloaded.search(vectors(1, seed=1)[0], k=6)) == 6
@@ -0,0 +1,143 @@
+# test_ingest.py
+# The streaming pipeline (scraping_common/pipeline.py) and incremental writes of
+# scraping_common/ingest.py, against an in-memory stand-in for the collection.
+import sys
+import threading
+import types
+
+import pymongo
+import pytest
+
+from scraping_common.chunking import Chunk
+from scraping_common.pipeline import Pipeline, Stage
+
+
+def test_pipeline_runs_every_item_through_every_stage():
+    seen = []
+    lock = threading.Lock()
+
+    def write(batch):
+        with lock:
+            seen.extend(batch)
+
+    pipeline = Pipeline([
+        Stage("double", lambda n: [n, n], workers=3),
+        Stage("square", lambda batch: [n * n for n in batch], batch_size=4, max_wait=0.01),
+        Stage("write", write, batch_size=8, max_wait=0.01),
+    ], queue_size=2)
+    stats = pipeline.run(range(50))
+
+    assert sorted(seen) == sorted([n * n for n in range(50)] * 2)
+    assert (stats["double"].items_in, stats["double"].items_out) == (50, 100)
+    assert stats["write"].items_in == 100
+
+
+def test_pipeline_stage_errors_only_lose_their_item():
+    out = []
+
+    def fragile(n):
+        if n % 10 == 3:
+            raise ValueError(n)
+        return [n]
+
+    stats = Pipeline([Stage("fragile", fragile, workers=2), Stage("out", out.append)]).run(range(30))
+
+    assert sorted(out) == [n for n in range(30) if n % 10 != 3]
+    assert stats["fragile"].errors == 3
+
+
+@pytest.fixture
+def ingest(monkeypatch):
+    # ingest imports embed_vectors (torch) for the model; embed_texts is replaced below
+    monkeypatch.setitem(sys.modules, "embed_vectors", types.SimpleNamespace(get_embedding_model=None))
+    monkeypatch.delitem(sys.modules, "scraping_common.ingest", raising=False)
+    import scraping_common.ingest as ingest
+
+    # chunks containing "!" fail to embed
+    monkeypatch.setattr(ingest, "embed_texts",
+                        lambda texts, cache: [None if "!" in t else [1.0, 0.0] for t in texts])
+    return ingest
+
+
+class Adapter:
+    id_field, index_field, embedding_field = "bylaw_id", "chunk_index", "chunk_embedding"
+
+    def __init__(self, texts):
+        self.texts = texts
+
+    def sources(self):
+        return [{"bylaw_id": b, "text": t} for b, t in self.texts.items()]
+
+    def fetch(self, item):
+        return item
+
+    def chunk(self, text):
+        return [Chunk(part, 0, len(part)) for part in text.split("|")]
+
+    def make_doc(self, item, chunk, index, sha):
+        return {"bylaw_id": item["bylaw_id"], "chunk_index": index, "chunk_text": chunk.text, "content_sha256": sha}
+
+    def ensure_indexes(self, col):
+        pass
+
+
+class Collection:
+    """Stored chunks by _id; upserts of chunks containing "#" fail with a write error."""
+
+    def __init__(self, docs):
+        self.docs = {d["_id"]: d for d in docs}
+
+    def find(self, query, projection):
+        return types.SimpleNamespace(batch_size=lambda n: list(self.docs.values()))
+
+    def bulk_write(self, ops, ordered=True):
+        errors = []
+        for i, op in enumerate(ops):
+            if isinstance(op, pymongo.DeleteMany):
+                for _id in op._filter["_id"]["$in"]:
+                    self.docs.pop(_id, None)
+                continue
+            doc = op._doc["$set"]
+            if "#" in doc["chunk_text"]:
+                errors.append({"index": i, "code": 11000, "errmsg": "duplicate key"})
+                continue
+            _id = f"{doc['bylaw_id']}:{doc['chunk_index']}:{doc['content_sha256']}"
+            self.docs[_id] = {**doc, "_id": _id}
+        if errors:
+            raise pymongo.errors.BulkWriteError({"writeErrors": errors})
+
+    def texts(self, bylaw_id):
+        return sorted(d.get("chunk_text") for d in self.docs.values() if d["bylaw_id"] == bylaw_id)
+
+
+def stored(bylaw_id, *texts):
+    return [{"_id": f"{bylaw_id}-old{i}", "bylaw_id": bylaw_id, "chunk_index": i, "chunk_text": t,
+             "content_sha256": f"old{i}"} for i, t in enumerate(texts)]
+
+
+def test_stale_chunks_are_only_deleted_once_every_new_chunk_is_written(ingest):
+    col = Collection(stored("ok", "old a", "old b") + stored("unembedded", "old c") + stored("rejected", "old d"))
+    adapter = Adapter({
+        "ok": "new a|new b",
+        "unembedded": "new c|bad! c",
+        "rejected": "new d|bad# d",
+    })
+
+    counts = ingest.run_ingest(adapter, col, embed_batch=2, write_batch=2, fetch_workers=2, queue_size=2)
+
+    assert col.texts("ok") == ["new a", "new b"]
+    # a new chunk failed to embed or to upsert: the old chunks stay
+    assert col.texts("unembedded") == ["new c", "old c"]
+    assert col.texts("rejected") == ["new d", "old d"]
+    assert counts["added"] == 4
+    assert counts["failed"] == 2
+    assert counts["removed"] == 2
+
+
+def test_unchanged_chunks_are_not_rewritten(ingest):
+    col = Collection([])
+    ingest.run_ingest(Adapter({"a": "one|two"}), col)
+    counts = ingest.run_ingest(Adapter({"a": "one|two|three"}), col)
+
+    assert (counts["unchanged"], counts["added"], counts["removed"]) == (2, 1, 0)
+    assert col.texts("a") == ["one", "three", "two"]
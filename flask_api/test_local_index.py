@@ -0,0 +1,85 @@
+# test_local_index.py
+# The in-RAM backend (local_index.py) on a small index written straight to disk.
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import local_index
+
+N, DIMS = 64, 16
+
+
+@pytest.fixture
+def index(tmp_path):
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((N, DIMS)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    offsets = []
+    with open(tmp_path / "docs.jsonl", "wb") as docs:
+        for i in range(N):
+            offsets.append(docs.tell())
+            row = {"bylaw_id": f"bylaw-{i // 8}", "chunk_index": i % 8, "chunk_text": f"chunk {i} " + "x" * i}
+            docs.write(json.dumps(row).encode("utf-8") + b"\n")
+    matrix.tofile(tmp_path / "vectors.f32")
+    np.save(tmp_path / "bits.npy", local_index.pack_bits(matrix))
+    np.save(tmp_path / "codes.npy", local_index.quantize(matrix))
+    np.save(tmp_path / "ids.npy", np.asarray([str(i) for i in range(N)]))
+    np.save(tmp_path / "groups.npy", np.arange(N, dtype=np.int32) // 8)
+    np.save(tmp_path / "positions.npy", np.arange(N, dtype=np.int32) % 8)
+    np.save(tmp_path / "doc_offsets.npy", np.asarray(offsets, dtype=np.int64))
+    with open(tmp_path / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({"collection": "test", "embedding_path": "chunk_embedding", "id_field": "bylaw_id",
+                   "index_field": "chunk_index", "count": N, "dims": DIMS,
+                   "groups": {f"bylaw-{g}": g for g in range(N // 8)}}, f)
+    return local_index.LocalIndex(str(tmp_path)), matrix
+
+
+def test_docs_read_concurrently_come_back_intact(index):
+    idx, _ = index
+    rows = list(range(N)) * 20
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        docs = list(pool.map(idx.doc, rows))
+    assert [d["chunk_text"].split()[1] for d in docs] == [str(r) for r in rows]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_workers_read_their_own_docs(index):
+    idx, _ = index
+    idx.doc(0)  # the parent has read before forking, like a --preload master
+    pid = os.fork()
+    if pid == 0:
+        ok = all(idx.doc(r)["chunk_index"] == r % 8 for r in range(N - 1, -1, -1))
+        os._exit(0 if ok else 1)
+    assert all(idx.doc(r)["chunk_index"] == r % 8 for r in range(N))
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+
+
+def test_search_finds_the_query_vector_and_filters_by_bylaw(index):
+    idx, matrix = index
+    hits = idx.search(matrix[13], k=3, candidates=N, mode="int8")
+    assert hits[0]["chunk_text"].startswith("chunk 13 ")
+    assert hits[0]["score"] == pytest.approx(1.0, abs=1e-5)
+
+    hits = idx.search(matrix[13], k=3, candidates=N, mode="exact", bylaw_ids=["bylaw-5"])
+    assert {h["bylaw_id"] for h in hits} == {"bylaw-5"}
+
+
+def test_find_answers_a_neighbour_query(index):
+    idx, _ = index
+    docs = idx.find({"$or": [{"bylaw_id": "bylaw-2", "chunk_index": {"$gte": 3, "$lte": 5}}]})
+    assert sorted(d["chunk_index"] for d in docs) == [3, 4, 5]
+
+
+def test_only_the_prefilter_array_is_resident(index):
+    idx, matrix = index
+    int8_idx = local_index.LocalIndex(idx.path, prefilter="int8")
+
+    assert set(idx.resident_bytes()) == {"bits", "int8 (mmap)", "float32 (mmap)"}
+    assert set(int8_idx.resident_bytes()) == {"bits (mmap)", "int8", "float32 (mmap)"}
+    # the mapped array still answers its mode
+    assert idx.search(matrix[7], k=1, candidates=N, mode="int8")[0]["chunk_text"].startswith("chunk 7 ")
+    assert int8_idx.search(matrix[7], k=1, candidates=N, mode="bits")[0]["chunk_text"].startswith("chunk 7 ")
@@ -0,0 +1,78 @@
+# test_pdf_extract.py
+# OCR budgeting in scraping_common/pdf_extract.py, with Tesseract replaced by a slow stand-in
+# and the process pool by threads (the stand-in has to run in this process).
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scraping_common import ocr
+from scraping_common.pdf_extract import PdfExtractor
+
+
+class OcrCache:
+    def __init__(self):
+        self.pages = {}
+
+    def get_many(self, pdf_sha, pages, dpi, lang):
+        return {i: self.pages[i] for i in pages if i in self.pages}
+
+    def put(self, pdf_sha, page, dpi, lang, text):
+        self.pages[page] = text
+
+
+@pytest.fixture
+def extractor(monkeypatch):
+    timeouts = []
+
+    def ocr_page(source, page_index, dpi, lang, timeout):
+        timeouts.append(timeout)
+        time.sleep(0.3)
+        return page_index, None if page_index == 1 else f"page {page_index}", 0.3
+
+    monkeypatch.setattr(ocr, "ocr_page", ocr_page)
+    monkeypatch.setattr(ocr, "pages_needing_ocr", lambda source, pages: [i for i, p in enumerate(pages) if not p])
+    ex = PdfExtractor(workers=2, use_ocr=False, ocr_budget=1.5, ocr_page_timeout=60)
+    ex._pool.shutdown()
+    ex._pool = ThreadPoolExecutor(max_workers=2)
+    ex.use_ocr, ex.ocr_cache = True, OcrCache()
+    ex.timeouts = timeouts
+    yield ex
+    ex._pool.shutdown()
+
+
+def test_ocr_stops_at_the_budget_and_flags_the_document(extractor):
+    pages = [""] * 12
+    began = time.monotonic()
+    seconds, left = extractor._ocr_missing_pages(b"%PDF", pages, "scan.pdf", pdf_sha="sha")
+
+    assert time.monotonic() - began < extractor.ocr_budget + 0.5
+    # every page's Tesseract timeout fits in what was left of the budget
+    assert all(t <= extractor.ocr_budget for t in extractor.timeouts)
+    assert len(extractor.timeouts) < 12
+    assert left == 12 - extractor.ocr_pages_done
+    assert pages[1] == ""  # a failed page stays empty (and isn't cached)
+    assert extractor.ocr_pages_done == len(extractor.ocr_cache.pages)
+
+
+def test_next_extraction_resumes_from_the_cache(extractor):
+    pages = [""] * 4
+    extractor._ocr_missing_pages(b"%PDF", pages, "scan.pdf", pdf_sha="sha")
+    assert pages == ["page 0", "", "page 2", "page 3"]
+
+    extractor.timeouts.clear()
+    pages = [""] * 4
+    _, left = extractor._ocr_missing_pages(b"%PDF", pages, "scan.pdf", pdf_sha="sha")
+    assert len(extractor.timeouts) == 1  # only the page that failed is OCR'd again
+    assert left == 1
+
+
+def test_incomplete_flag_is_read_once(extractor, monkeypatch):
+    monkeypatch.setattr("scraping_common.pdf_extract.page_count", lambda source: 2)
+    monkeypatch.setattr("scraping_common.pdf_extract.extract_page_range",
+                        lambda source, start, end: (["", ""], "pymupdf", 0.0))
+
+    extractor.extract(b"%PDF", name="scan.pdf")
+
+    assert extractor.ocr_incomplete("scan.pdf")
+    assert not extractor.ocr_incomplete("scan.pdf")
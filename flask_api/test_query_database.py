@@ -0,0 +1,122 @@
+# test_query_database.py
+# Query routing through query_database's search paths, against an in-memory stand-in for
+# Atlas. clients.py needs GEMINI_API_KEY and genai, and embed_vectors loads torch, so both
+# are replaced for these tests; the query vector is passed in.
+import asyncio
+import sys
+import types
+
+import pytest
+
+import query_router
+
+# (bylaw_id, chunk_index, score against the query)
+CHUNKS = [
+    ("waterloo::2010-164", 0, 0.91),  # Noise By-law: the best match in the collection
+    ("waterloo::2010-164", 1, 0.88),
+    ("waterloo::2019-038", 4, 0.84),  # Fence By-law, the one the query names
+    ("waterloo::2019-038", 5, 0.80),
+    ("waterloo::2015-001", 0, 0.86),
+]
+
+
+class Collection:
+    def __init__(self):
+        self.searches = []
+
+    def _hits(self, pipeline):
+        stage = pipeline[0]["$vectorSearch"]
+        allowed = stage.get("filter", {}).get("bylaw_id", {}).get("$in")
+        self.searches.append(allowed)
+        hits = [{"bylaw_id": b, "chunk_index": i, "chunk_text": f"{b}#{i}", "score": s}
+                for b, i, s in CHUNKS if allowed is None or b in allowed]
+        return sorted(hits, key=lambda h: -h["score"])[:stage["limit"]]
+
+    def aggregate(self, pipeline):
+        return self._hits(pipeline)
+
+    def find_one(self, *args, **kwargs):
+        return None  # no embedding version pointer
+
+
+class AsyncCollection(Collection):
+    async def aggregate(self, pipeline):
+        hits = self._hits(pipeline)
+
+        class Cursor:
+            async def to_list(self):
+                return hits
+        return Cursor()
+
+
+class Client:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getitem__(self, name):
+        return {"waterloo": self.collection, "embedding_versions": self.collection}
+
+
+@pytest.fixture
+def qd(monkeypatch):
+    collection, async_collection = Collection(), AsyncCollection()
+    clients = types.SimpleNamespace(
+        get_mongo_client=lambda: (Client(collection), None),
+        get_async_mongo_client=lambda: (Client(async_collection), None),
+        mark_mongo_down=lambda e: None,
+        mongo_outage_started=lambda: None,
+    )
+    monkeypatch.setitem(sys.modules, "clients", clients)
+    monkeypatch.setitem(sys.modules, "embed_vectors",
+                        types.SimpleNamespace(embed_text_async=lambda text: asyncio.sleep(0, [1.0, 0.0])))
+    for name in ("query_database", "embedding_versions"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    import query_database
+
+    monkeypatch.setattr(query_router, "_routes", {"waterloo": query_router.build_table([
+        ("waterloo::2010-164", "Noise By-law", "2010-164"),
+        ("waterloo::2019-038", "Fence By-law", "2019-038"),
+        ("waterloo::2015-001", "Swimming Pool Enclosure By-law", "2015-001"),
+    ])})
+    monkeypatch.setitem(query_database.COLLECTION_SEARCH_SETTINGS, "waterloo",
+                        {"adaptive": False, "limit": 2, "merge_adjacent": False})
+    return types.SimpleNamespace(module=query_database, settings=query_database.COLLECTION_SEARCH_SETTINGS["waterloo"],
+                                 collection=collection, async_collection=async_collection)
+
+
+def run(qd, query, use_async=False):
+    """(results, the bylaw pre-filter of every $vectorSearch that ran)"""
+    if use_async:
+        results, _ = asyncio.run(qd.module.query_database_async(query, "bylaws", "waterloo"))
+        return results, qd.async_collection.searches
+    results, _ = qd.module.query_database(query, "bylaws", "waterloo", query_vector=[1.0, 0.0])
+    return results, qd.collection.searches
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_named_bylaw_wins_over_a_higher_scoring_unrelated_chunk(qd, use_async):
+    results, searches = run(qd, "what does by-law 2019-038 say about noise from a pool pump", use_async)
+
+    assert [(r["bylaw_id"], r["chunk_index"]) for r in results] == [
+        ("waterloo::2019-038", 4), ("waterloo::2019-038", 5)]
+    assert searches == [["waterloo::2019-038"]]  # one pre-filtered search, no unfiltered one
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_named_bylaw_below_min_score_falls_back_to_the_whole_collection(qd, use_async):
+    qd.settings["min_score"] = 0.85
+    results, searches = run(qd, "by-law 2019-038", use_async)
+
+    assert [r["bylaw_id"] for r in results] == ["waterloo::2010-164", "waterloo::2010-164"]
+    assert searches == [["waterloo::2019-038"], None]
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_related_bylaws_are_boosted_within_a_single_search(qd, use_async):
+    qd.settings.update(limit=3, related_boost=0.04)
+    results, searches = run(qd, "pool fences", use_async)
+
+    assert searches == [None]
+    # the pool enclosure chunk (0.86) moves above the noise chunk (0.88); its score is unchanged
+    assert [(r["bylaw_id"], r["score"]) for r in results] == [
+        ("waterloo::2010-164", 0.91), ("waterloo::2015-001", 0.86), ("waterloo::2010-164", 0.88)]
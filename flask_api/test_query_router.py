@@ -0,0 +1,81 @@
+# test_query_router.py
+# Query routing (query_router.py) against the real Toronto chapter listing (lawmcode.htm).
+import os
+
+import pytest
+
+import query_router
+import ranking
+from scraping_toronto.parse_html import parse_html
+
+SETTINGS = {"id_field": "bylaw_id", "index_field": "chunk_index"}
+
+
+@pytest.fixture(scope="module")
+def routes():
+    chapters = parse_html(os.path.join(os.path.dirname(os.path.abspath(__file__)), "lawmcode.htm"))
+    return {
+        "bylaw_chunks": query_router.build_table((c["_id"], c["title"], None) for c in chapters),
+        "waterloo": query_router.build_table([
+            ("waterloo::2019-038", "Fence By-law", "2019-038"),
+            ("waterloo::2010-164", "Noise By-law", "No. 2010-164"),
+        ]),
+        "guelph": query_router.build_table([("guelph::15200", "Sign By-law", "15200")]),
+    }
+
+
+@pytest.mark.parametrize("query", [
+    "Where can I park my car overnight?",
+    "Can I have a fire in my backyard?",
+    "Can I keep chickens in my yard?",
+    "Is there a bylaw 3 dogs limit",
+    "What does chapter 9999 say about sheds?",
+])
+def test_common_questions_are_not_hard_routed(routes, query):
+    named, _ = query_router.route(query, "bylaw_chunks", routes)
+    assert named is None
+
+
+@pytest.mark.parametrize("query, collection, expected", [
+    ("What does Chapter 591 say about construction noise?", "bylaw_chunks", ["Chapter 591"]),
+    ("ch. 608 dogs off leash", "bylaw_chunks", ["Chapter 608"]),
+    ("what does by-law 2019-38 allow", "waterloo", ["waterloo::2019-038"]),
+    ("Bylaw No. 2010-0164 quiet hours", "waterloo", ["waterloo::2010-164"]),
+    ("By-law Number (1996)-15200 sign size", "guelph", ["guelph::15200"]),
+])
+def test_explicit_references_in_the_table_are_named(routes, query, collection, expected):
+    assert query_router.route(query, collection, routes) == (expected, None)
+
+
+def test_title_notes_are_not_indexed(routes):
+    # "Traffic and Parking\n\nNote: Schedules have been updated ..."
+    assert query_router.title_keywords(
+        "Traffic and Parking \n\nNote: Schedules have been updated to include amendments") == {"traffic", "parking"}
+    assert "Chapter 950" not in routes["bylaw_chunks"]["keywords"].get("have", [])
+    assert "Chapter 950" not in routes["bylaw_chunks"]["keywords"].get("schedule", [])
+
+
+def test_keyword_matches_are_only_related(routes):
+    named, related = query_router.route("how loud can noise be at night", "bylaw_chunks", routes)
+    assert named is None
+    assert related == ["Chapter 591"]
+
+
+def test_named_search_is_kept_only_if_it_clears_min_score():
+    settings = dict(SETTINGS, min_score=0.70)
+    assert ranking.named_hits_ok([{"bylaw_id": "Chapter 591", "chunk_index": 1, "score": 0.74}], settings)
+    assert not ranking.named_hits_ok([{"bylaw_id": "Chapter 591", "chunk_index": 1, "score": 0.65}], settings)
+    assert not ranking.named_hits_ok([], settings)
+
+
+def test_related_hits_are_boosted_without_changing_scores():
+    hits = [{"bylaw_id": "Chapter 950", "chunk_index": 1, "score": 0.90},
+            {"bylaw_id": "Chapter 950", "chunk_index": 2, "score": 0.86},
+            {"bylaw_id": "Chapter 608", "chunk_index": 5, "score": 0.85}]
+    settings = dict(SETTINGS, related_boost=0.02)
+
+    boosted = ranking.boost_related(hits, ["Chapter 608"], settings)
+
+    assert [(h["bylaw_id"], h["score"]) for h in boosted] == [
+        ("Chapter 950", 0.90), ("Chapter 608", 0.85), ("Chapter 950", 0.86)]
+    assert ranking.boost_related(hits, None, settings) == hits
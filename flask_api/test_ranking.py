@@ -0,0 +1,198 @@
+# test_ranking.py
+# Post-processing of retrieved chunks (ranking.py). Run from the repo root: python -m pytest -q
+import numpy as np
+import pytest
+
+from scraping_common.chunking import chunk_with_offsets
+
+import ranking
+
+SETTINGS = {
+    "id_field": "bylaw_id",
+    "index_field": "chunk_index",
+    "embedding_path": "chunk_embedding",
+    "adaptive": True,
+    "limit": 4,
+    "min_k": 1,
+    "max_k": 6,
+    "min_score": 0.70,
+    "min_relative_score": 0.90,
+    "max_relative_gap": 0.04,
+    "mmr": False,
+    "mmr_lambda": 0.7,
+    "merge_adjacent": True,
+    "expand_neighbors": 0,
+}
+
+BYLAW_TEXT = "\n\n".join(
+    f"Section {n}. " + " ".join(f"Sentence {n}.{k} about fences, hedges and the height of walls." for k in range(12))
+    for n in range(1, 7)
+)
+
+
+def make_hits(text=BYLAW_TEXT, bylaw_id="waterloo::2019-038"):
+    """Every chunk of ``text`` as a stored chunk document."""
+    return [
+        {"bylaw_id": bylaw_id, "chunk_index": i, "chunk_text": c.text, "char_start": c.start, "char_end": c.end}
+        for i, c in enumerate(chunk_with_offsets(text, target_size=400, overlap=80, min_size=200))
+    ]
+
+
+def test_merge_rebuilds_overlapping_chunks_from_offsets():
+    chunks = make_hits()
+    assert len(chunks) > 4
+    hits = [dict(chunks[2], score=0.90), dict(chunks[1], score=0.85), dict(chunks[3], score=0.80)]
+
+    merged = ranking.merge_adjacent_chunks(hits, SETTINGS)
+
+    assert len(merged) == 1
+    passage = merged[0]
+    assert passage["chunk_text"] == BYLAW_TEXT[chunks[1]["char_start"]:chunks[3]["char_end"]]
+    assert passage["merged_chunks"] == [1, 2, 3]
+    assert (passage["char_start"], passage["char_end"]) == (chunks[1]["char_start"], chunks[3]["char_end"])
+    assert passage["score"] == 0.90
+
+
+def test_merge_joins_contiguous_chunks_without_a_space():
+    text = "No hedge shall exceed one metre in height."
+    cut = text.index("metre") + 2  # a hard wrap in the middle of a word
+    hits = [
+        {"bylaw_id": "b", "chunk_index": 0, "chunk_text": text[:cut], "char_start": 0, "char_end": cut, "score": 0.9},
+        {"bylaw_id": "b", "chunk_index": 1, "chunk_text": text[cut:], "char_start": cut, "char_end": len(text),
+         "score": 0.8},
+    ]
+
+    assert ranking.merge_adjacent_chunks(hits, SETTINGS)[0]["chunk_text"] == text
+
+
+def test_merge_without_offsets_finds_the_overlap_in_the_text():
+    chunks = make_hits()
+    hits = [{k: v for k, v in c.items() if k not in ("char_start", "char_end")} | {"score": 0.9} for c in chunks[:3]]
+
+    merged = ranking.merge_adjacent_chunks(hits, SETTINGS)
+
+    assert len(merged) == 1
+    assert merged[0]["chunk_text"] == BYLAW_TEXT[chunks[0]["char_start"]:chunks[2]["char_end"]]
+
+
+def test_merge_keeps_separate_passages_in_rank_order():
+    chunks = make_hits()
+    other = make_hits(bylaw_id="waterloo::2010-164")
+    hits = [
+        dict(chunks[4], score=0.95),
+        dict(other[0], score=0.93),
+        dict(chunks[0], score=0.91),
+        dict(chunks[5], score=0.90),
+    ]
+
+    merged = ranking.merge_adjacent_chunks(hits, SETTINGS)
+
+    assert [(p["bylaw_id"], p.get("merged_chunks", [p["chunk_index"]])) for p in merged] == [
+        ("waterloo::2019-038", [4, 5]),
+        ("waterloo::2010-164", [0]),
+        ("waterloo::2019-038", [0]),
+    ]
+
+
+def test_merge_leaves_hits_without_a_chunk_index_alone():
+    hits = [{"bylaw_id": "a", "chunk_text": "x", "score": 0.9}, {"bylaw_id": "a", "chunk_text": "y", "score": 0.8}]
+    assert ranking.merge_adjacent_chunks(hits, SETTINGS) == hits
+
+
+def test_dedupe_sources_keeps_the_first_source_per_bylaw():
+    sources = [
+        {"bylaw_id": "Chapter 591", "title": "Noise"},
+        {"bylaw_id": "Chapter 447", "title": "Fences"},
+        {"bylaw_id": "Chapter 591", "title": "Noise"},
+        {"bylaw_id": None, "pdf_url": "https://example.org/a.pdf"},
+        {"bylaw_id": None, "pdf_url": "https://example.org/a.pdf"},
+    ]
+    assert ranking.dedupe_sources(sources) == [sources[0], sources[1], sources[3]]
+
+
+def scored(*scores):
+    return [{"bylaw_id": "a", "chunk_index": i, "score": s} for i, s in enumerate(scores)]
+
+
+@pytest.mark.parametrize("scores, kept", [
+    ((0.90, 0.89, 0.88, 0.87, 0.86, 0.85, 0.84), 6),  # a flat run stops at max_k
+    ((0.90, 0.89, 0.80, 0.79), 2),                     # gap larger than max_relative_gap * top
+    ((0.90, 0.88, 0.86, 0.84, 0.82, 0.80), 5),         # 0.80 < min_relative_score * top
+    ((0.72, 0.71, 0.69), 2),                           # below min_score
+    ((0.60, 0.59), 1),                                 # weak results still keep min_k
+    ((0.0, 0.0), 1),
+])
+def test_adaptive_cutoff(scores, kept):
+    assert ranking.adaptive_cutoff(scored(*scores), SETTINGS) == scored(*scores)[:kept]
+
+
+def test_adaptive_cutoff_keeps_min_k_before_applying_the_thresholds():
+    settings = dict(SETTINGS, min_k=3)
+    assert len(ranking.adaptive_cutoff(scored(0.90, 0.60, 0.50, 0.49), settings)) == 3
+    assert ranking.adaptive_cutoff([], settings) == []
+
+
+def test_mmr_skips_near_duplicates_of_what_it_already_chose():
+    query = np.array([1.0, 0.0, 0.0])
+    vectors = np.array([
+        [0.95, 0.31, 0.0],   # best match
+        [0.94, 0.34, 0.01],  # nearly the same chunk again
+        [0.88, 0.0, 0.47],   # a bit less relevant, but different
+    ])
+    assert ranking.mmr_select(query, vectors, k=2, lam=1.0) == [0, 1]  # lam=1 is plain top-k
+    assert ranking.mmr_select(query, vectors, k=2, lam=0.7) == [0, 2]
+    assert ranking.mmr_select(query, vectors, k=5) == [0, 1, 2]
+
+
+def test_rank_results_reranks_with_mmr_and_drops_the_vectors():
+    settings = dict(SETTINGS, mmr=True, adaptive=False, limit=2)
+    hits = [
+        {"bylaw_id": "a", "chunk_index": 0, "score": 0.90, "chunk_embedding": [0.95, 0.31, 0.0]},
+        {"bylaw_id": "a", "chunk_index": 1, "score": 0.89, "chunk_embedding": [0.94, 0.34, 0.01]},
+        {"bylaw_id": "b", "chunk_index": 0, "score": 0.85, "_vector": np.array([0.88, 0.0, 0.47])},
+    ]
+
+    ranked = ranking.rank_results(hits, [1.0, 0.0, 0.0], settings)
+
+    assert [(r["bylaw_id"], r["chunk_index"]) for r in ranked] == [("a", 0), ("b", 0)]
+    assert not any("chunk_embedding" in r or "_vector" in r for r in ranked)
+
+
+def test_expand_neighbours_fetches_every_window_in_one_query():
+    chunks = make_hits()
+    settings = dict(SETTINGS, expand_neighbors=1)
+    queries = []
+
+    def fetch(query):
+        queries.append(query)
+        return [c for c in chunks if any(c["chunk_index"] in range(q["chunk_index"]["$gte"], q["chunk_index"]["$lte"] + 1)
+                                         for q in query["$or"])]
+
+    hits = [dict(chunks[4], score=0.9), dict(chunks[0], score=0.8)]
+    expanded = ranking.expand_neighbours(hits, settings, fetch)
+
+    assert len(queries) == 1
+    assert queries[0] == {"$or": [
+        {"bylaw_id": "waterloo::2019-038", "chunk_index": {"$gte": 3, "$lte": 5}},
+        {"bylaw_id": "waterloo::2019-038", "chunk_index": {"$gte": -1, "$lte": 1}},
+    ]}
+    # each neighbour follows its hit with the hit's score
+    assert [(c["chunk_index"], c["score"], c.get("context", False)) for c in expanded] == [
+        (4, 0.9, False), (3, 0.9, True), (5, 0.9, True), (0, 0.8, False), (1, 0.8, True)]
+
+
+def test_assemble_results_stitches_each_window_into_one_passage():
+    chunks = make_hits()
+    settings = dict(SETTINGS, expand_neighbors=1, merge_adjacent=False)
+    hits = [dict(chunks[4], score=0.9)]
+
+    passages = ranking.assemble_results(hits, settings, lambda query: chunks[3:6])
+
+    assert len(passages) == 1
+    assert passages[0]["merged_chunks"] == [3, 4, 5]
+    assert passages[0]["chunk_text"] == BYLAW_TEXT[chunks[3]["char_start"]:chunks[5]["char_end"]]
+
+
+def test_expand_neighbours_without_chunk_indexes_is_a_no_op():
+    hits = [{"bylaw_id": "a", "chunk_text": "x", "score": 0.9}]
+    assert ranking.expand_neighbours(hits, dict(SETTINGS, expand_neighbors=2), lambda q: pytest.fail("fetched")) == hits
@@ -0,0 +1,100 @@
+# test_reembed.py
+# Shard ranges and the writer thread of reembed.py, against an in-memory stand-in for the collection.
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+
+import reembed
+
+SHARDS = [{"min": 0, "max": 50, "last": False}, {"min": 50, "max": 99, "last": True}]
+
+
+def test_shard_query_bounds():
+    base = {"chunk_text": {"$exists": True}}
+    assert reembed.shard_query(base, SHARDS[0]) == {**base, "_id": {"$gte": 0, "$lt": 50}}
+    # the last $bucketAuto bucket includes its max
+    assert reembed.shard_query(base, SHARDS[1]) == {**base, "_id": {"$gte": 50, "$lte": 99}}
+    # resuming starts after the checkpointed _id instead of at the shard's min
+    assert reembed.shard_query(base, SHARDS[1], after=72) == {**base, "_id": {"$gt": 72, "$lte": 99}}
+    assert reembed.shard_query(base, {"min": None, "max": None, "last": True}) == base
+
+
+class Cursor(list):
+    def sort(self, *args):
+        return self
+
+    def batch_size(self, n):
+        return self
+
+
+class Collection:
+    """find/count_documents/bulk_write; bulk_write fails from the ``fail_from``-th call on."""
+
+    def __init__(self, n, fail_from=None):
+        self.docs = [{"_id": i, "chunk_text": f"chunk {i}"} for i in range(n)]
+        self.fail_from = fail_from
+        self.calls = 0
+
+    def count_documents(self, query):
+        return len(self.docs)
+
+    def find(self, query, projection):
+        return Cursor(self.docs)
+
+    def bulk_write(self, ops, ordered=True):
+        self.calls += 1
+        if self.fail_from is not None and self.calls >= self.fail_from:
+            time.sleep(0.2)  # slow enough for the encoder to fill the queue behind it
+            raise RuntimeError("write concern error")
+
+
+class Client(dict):
+    def close(self):
+        pass
+
+
+class Model:
+    def encode(self, texts, batch_size=None, normalize_embeddings=True):
+        return np.ones((len(texts), 4), dtype=np.float32) / 2
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    def run(collection):
+        # run_shard imports embed_vectors (torch) itself
+        monkeypatch.setitem(sys.modules, "embed_vectors", types.SimpleNamespace(get_embedding_model=Model))
+        monkeypatch.setattr(reembed, "make_client", lambda: Client(bylaws={"chunks": collection}))
+        args = types.SimpleNamespace(db="bylaws", collection="chunks", field="emb", text_field="chunk_text",
+                                     batch=10, vector_format="array", no_cache=True,
+                                     checkpoint_dir=str(tmp_path))
+        return args, reembed.run_shard(args, 0, {"min": None, "max": None, "last": True}, {})
+    return run
+
+
+def test_run_shard_writes_every_batch_and_finishes(run):
+    collection = Collection(95)
+    args, written = run(collection)
+    assert written == 95
+    assert collection.calls == 10
+    assert reembed._read_json(reembed.checkpoint_path(args, 0)) == {"last_id": 94, "count": 95, "done": True}
+
+
+def test_failed_bulk_write_raises_instead_of_hanging(run):
+    collection = Collection(200, fail_from=2)
+    result = {}
+
+    def target():
+        try:
+            run(collection)
+        except RuntimeError as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout=10)
+    assert not thread.is_alive(), "run_shard blocked on the writer queue"
+    assert "rerun to resume" in str(result["error"])
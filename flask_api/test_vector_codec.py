@@ -0,0 +1,50 @@
+# test_vector_codec.py
+# Stored vector formats (vector_codec.py).
+import numpy as np
+import pytest
+from bson import BSON
+
+import vector_codec
+
+
+@pytest.fixture
+def unit_vector():
+    rng = np.random.default_rng(7)
+    v = rng.standard_normal(384).astype(np.float32)
+    return (v / np.linalg.norm(v)).tolist()
+
+
+@pytest.mark.parametrize("fmt, tolerance", [("array", 1e-12), ("float32", 1e-7), ("int8", 0.5 / vector_codec.INT8_SCALE + 1e-9)])
+def test_round_trip(unit_vector, fmt, tolerance):
+    stored = vector_codec.encode_vector(unit_vector, fmt)
+
+    assert vector_codec.vector_format_of(stored) == fmt
+    # survives a trip through BSON, as it would through Mongo
+    stored = BSON.decode(BSON.encode({"v": stored}))["v"]
+    decoded = vector_codec.decode_vector(stored)
+    assert len(decoded) == 384
+    assert np.max(np.abs(np.asarray(decoded) - unit_vector)) <= tolerance
+
+
+def test_packed_formats_are_smaller(unit_vector):
+    sizes = {fmt: len(BSON.encode({"v": vector_codec.encode_vector(unit_vector, fmt)}))
+             for fmt in vector_codec.VECTOR_FORMATS}
+    assert sizes["int8"] < sizes["float32"] < sizes["array"]
+
+
+def test_int8_clips_at_the_fixed_scale():
+    assert vector_codec.quantize_int8([0.0, 0.25, -0.5, 0.9, -3.0]) == [0, 64, -127, 127, -127]
+
+
+def test_int8_keeps_cosine_ranking(unit_vector):
+    rng = np.random.default_rng(8)
+    docs = rng.standard_normal((50, 384)).astype(np.float32)
+    docs /= np.linalg.norm(docs, axis=1, keepdims=True)
+    exact = docs @ np.asarray(unit_vector)
+    decoded = np.asarray([vector_codec.decode_vector(vector_codec.encode_vector(d, "int8")) for d in docs])
+    assert np.argmax(decoded @ np.asarray(unit_vector)) == np.argmax(exact)
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        vector_codec.encode_vector([0.1], "float16")
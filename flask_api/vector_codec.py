@@ -0,0 +1,55 @@
+# file: vector_codec.py
+# How chunk vectors are stored in Mongo.
+#
+#   "array"   BSON array of doubles (the original format): ~3.5 KB of encoded
+#             numbers per 384-dim vector, since every element carries a type
+#             byte and its array index as a key string
+#   "float32" BSON BinData vector (subtype 9), float32: 1,538 bytes
+#   "int8"    BinData vector, int8 scalar-quantized: 386 bytes
+#
+# Atlas Vector Search indexes BinData float32/int8 vectors directly, and the
+# query vector has to be sent in the same format as the stored ones, so the
+# query path encodes it with encode_vector(query, settings["vector_format"]).
+# (There is no float16 BinData vector type; the embedding cache keeps float16
+# locally, but Mongo gets float32 or int8.)
+#
+# int8 uses one fixed scale for every vector, so dot products/cosine between
+# quantized vectors stay proportional to the float ones. MiniLM outputs unit
+# vectors whose components almost never leave [-0.5, 0.5]; anything outside
+# is clipped.
+from bson.binary import Binary, BinaryVectorDtype
+
+VECTOR_FORMATS = ("array", "float32", "int8")
+INT8_CLIP = 0.5
+INT8_SCALE = 127 / INT8_CLIP
+
+
+def quantize_int8(vector) -> list[int]:
+    return [int(round(max(-INT8_CLIP, min(INT8_CLIP, float(x))) * INT8_SCALE)) for x in vector]
+
+
+def encode_vector(vector, fmt: str = "array"):
+    """The value to store (or send as queryVector) for a float vector in format ``fmt``."""
+    if fmt == "array":
+        return [float(x) for x in vector]
+    if fmt == "float32":
+        return Binary.from_vector([float(x) for x in vector], BinaryVectorDtype.FLOAT32)
+    if fmt == "int8":
+        return Binary.from_vector(quantize_int8(vector), BinaryVectorDtype.INT8)
+    raise ValueError(f"Unknown vector format {fmt!r} (expected one of {VECTOR_FORMATS})")
+
+
+def decode_vector(value) -> list[float]:
+    """A stored vector in any format back to floats (int8 is de-quantized)."""
+    if isinstance(value, Binary):
+        vec = value.as_vector()
+        if vec.dtype == BinaryVectorDtype.INT8:
+            return [x / INT8_SCALE for x in vec.data]
+        return list(vec.data)
+    return value
+
+
+def vector_format_of(value) -> str:
+    if isinstance(value, Binary):
+        return "int8" if value.as_vector().dtype == BinaryVectorDtype.INT8 else "float32"
+    return "array"
@@ -0,0 +1,73 @@
+# file: vector_index.py
+# Atlas Vector Search index definitions for the bylaw collections.
+#
+# Every searchable chunk collection gets a "vector_index" on its embedding
+# field with its bylaw id field declared as a filter field, so the second
+# stage of a two-stage search ($vectorSearch with filter: {id: {$in: [...]}})
+# can pre-filter instead of post-filtering. The bylaw summary collections
+# built by bylaw_summaries.py get a "vector_index" on summary_embedding.
+#
+#   python vector_index.py                       # chunk + summary indexes for every collection
+#   python vector_index.py --collections waterloo --no-summaries
+import argparse
+
+from pymongo.errors import OperationFailure
+from pymongo.operations import SearchIndexModel
+
+import query_database
+from clients import get_mongo_client
+
+EMBEDDING_DIMENSIONS = 384  # all-MiniLM-L6-v2
+
+
+def vector_index_definition(embedding_field: str, filter_fields=(), dimensions: int = EMBEDDING_DIMENSIONS,
+                            similarity: str = "cosine") -> dict:
+    fields = [{"type": "vector", "path": embedding_field, "numDimensions": dimensions, "similarity": similarity}]
+    fields += [{"type": "filter", "path": f} for f in filter_fields]
+    return {"fields": fields}
+
+
+def initialize_vector_index(database_name: str, collection_name: str, embedding_field: str,
+                            filter_fields=(), index_name: str = "vector_index") -> None:
+    """Creates the vectorSearch index, or updates its definition if it already exists."""
+    mongo_client, error = get_mongo_client()
+    if not mongo_client:
+        raise RuntimeError(f"MongoDB client is not available: {error}")
+    collection = mongo_client[database_name][collection_name]
+    definition = vector_index_definition(embedding_field, filter_fields)
+
+    existing = {ix["name"]: ix for ix in collection.list_search_indexes()}
+    if index_name in existing:
+        if existing[index_name].get("latestDefinition") == definition:
+            print(f"{collection_name}.{index_name} is up to date")
+            return
+        collection.update_search_index(index_name, definition)
+        print(f"Updated {collection_name}.{index_name} (builds in the background)")
+        return
+    try:
+        collection.create_search_index(SearchIndexModel(definition=definition, name=index_name, type="vectorSearch"))
+        print(f"Created {collection_name}.{index_name} on {embedding_field} (filters: {list(filter_fields) or 'none'})")
+    except OperationFailure as e:
+        print(f"Could not create {collection_name}.{index_name}: {e}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Create or update the Atlas vector search indexes.")
+    ap.add_argument("--db", default="bylaws")
+    ap.add_argument("--collections", default=",".join(query_database.COLLECTION_SEARCH_SETTINGS),
+                    help="Comma list of chunk collections (default: all searchable ones)")
+    ap.add_argument("--no-summaries", action="store_true", help="Skip the <collection>_bylaws summary indexes")
+    args = ap.parse_args()
+
+    for name in [c.strip() for c in args.collections.split(",") if c.strip()]:
+        settings = query_database.get_search_settings(name)
+        initialize_vector_index(args.db, name, settings["embedding_path"],
+                                filter_fields=[settings["id_field"]], index_name=settings["index"])
+        if not args.no_summaries:
+            initialize_vector_index(args.db, query_database.summary_collection_name(name, settings),
+                                    settings["summary_embedding_path"],
+                                    index_name=settings["summary_index"])
+
+
+if __name__ == "__main__":
+    main()